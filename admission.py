@@ -0,0 +1,251 @@
+"""Admission control and weighted fair queuing for the chat LLM calls.
+
+Every tenant shares one path to the OpenAI API, so one customer running a bulk
+batch could starve interactive users and push the platform into provider 429s.
+Before its LLM call a turn takes a slot:
+
+- at most ``ADMISSION_MAX_CONCURRENT`` calls run at once, and at most
+  ``ADMISSION_TENANT_MAX_CONCURRENT`` per ``company_id``;
+- when no slot is free the turn waits in its tenant's FIFO queue. Freed slots
+  go to the tenant whose head request has the smallest virtual finish tag
+  (weighted fair queuing, ``ADMISSION_TENANT_WEIGHTS``), so a tenant with a
+  deep queue gets its weighted share, not the whole pool;
+- a turn is shed (``Overloaded``) when its tenant already has
+  ``ADMISSION_MAX_QUEUE`` waiting or it is not admitted within
+  ``ADMISSION_QUEUE_TIMEOUT_S``.
+
+Works for both the event loop (``acquire``) and worker threads
+(``acquire_sync``); state is guarded by one lock.
+"""
+from collections import deque
+from typing import Any, Deque, Dict, Hashable, Optional
+import asyncio
+import threading
+import time
+
+import config
+
+_WAIT_SAMPLES = 1024  # recent admission waits kept per tenant for the percentiles
+
+
+class Overloaded(Exception):
+    """The turn was shed before its LLM call: ``reason`` is "queue_full" or "queue_timeout"."""
+
+    def __init__(self, reason: str, wait_ms: float) -> None:
+        super().__init__(f"Admission refused ({reason}) after {wait_ms:.0f} ms")
+        self.reason = reason
+        self.wait_ms = wait_ms
+
+
+def parse_weights(spec: str) -> Dict[int, float]:
+    """``"3:2,7:0.5"`` -> ``{3: 2.0, 7: 0.5}``; malformed or non-positive entries are ignored."""
+    weights = {}
+    for item in spec.split(","):
+        company, _, weight = item.partition(":")
+        try:
+            if float(weight) > 0:
+                weights[int(company)] = float(weight)
+        except ValueError:
+            continue
+    return weights
+
+
+def _percentile(samples: Deque[float], q: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+
+
+class _Waiter:
+    __slots__ = ("tag", "granted", "_event", "_loop", "_future")
+
+    def __init__(self, tag: float, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        self.tag = tag
+        self.granted = False
+        self._loop = loop
+        self._future = loop.create_future() if loop is not None else None
+        self._event = threading.Event() if loop is None else None
+
+    def wake(self) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._resolve)
+        else:
+            self._event.set()
+
+    def _resolve(self) -> None:
+        if not self._future.done():
+            self._future.set_result(None)
+
+    async def wait(self, timeout: float) -> None:
+        await asyncio.wait_for(asyncio.shield(self._future), timeout)
+
+    def wait_sync(self, timeout: float) -> bool:
+        return self._event.wait(timeout)
+
+
+class _Tenant:
+    __slots__ = ("weight", "queue", "in_flight", "last_tag", "admitted", "shed_full", "shed_timeout", "waits")
+
+    def __init__(self, weight: float) -> None:
+        self.weight = weight
+        self.queue: Deque[_Waiter] = deque()
+        self.in_flight = 0
+        self.last_tag = 0.0
+        self.admitted = 0
+        self.shed_full = 0
+        self.shed_timeout = 0
+        self.waits: Deque[float] = deque(maxlen=_WAIT_SAMPLES)
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_concurrent: int,
+        tenant_max_concurrent: int,
+        max_queue: int,
+        queue_timeout_s: float,
+        weights: Optional[Dict[int, float]] = None,
+    ) -> None:
+        self.max_concurrent = max(1, max_concurrent)
+        self.tenant_max_concurrent = max(1, tenant_max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout_s = queue_timeout_s
+        self.weights = weights or {}
+        self._tenants: Dict[Hashable, _Tenant] = {}
+        self._in_flight = 0
+        self._vtime = 0.0
+        self._lock = threading.Lock()
+
+    def _tenant(self, key: Hashable) -> _Tenant:
+        tenant = self._tenants.get(key)
+        if tenant is None:
+            tenant = self._tenants[key] = _Tenant(self.weights.get(key, 1.0))
+        return tenant
+
+    def _has_slot(self, tenant: _Tenant) -> bool:
+        return self._in_flight < self.max_concurrent and tenant.in_flight < self.tenant_max_concurrent
+
+    def _next_tag(self, tenant: _Tenant) -> float:
+        # Virtual finish tag: an idle tenant restarts at the current virtual time, it does not bank credit.
+        tenant.last_tag = max(self._vtime, tenant.last_tag) + 1.0 / tenant.weight
+        return tenant.last_tag
+
+    def _grant(self, tenant: _Tenant, tag: float) -> None:
+        self._in_flight += 1
+        tenant.in_flight += 1
+        tenant.admitted += 1
+        self._vtime = max(self._vtime, tag)
+
+    def _dispatch(self) -> None:
+        """Hand free slots to queued turns, smallest finish tag first among tenants under quota."""
+        while self._in_flight < self.max_concurrent:
+            best = None
+            for tenant in self._tenants.values():
+                if tenant.queue and tenant.in_flight < self.tenant_max_concurrent:
+                    if best is None or tenant.queue[0].tag < best.queue[0].tag:
+                        best = tenant
+            if best is None:
+                return
+            waiter = best.queue.popleft()
+            waiter.granted = True
+            self._grant(best, waiter.tag)
+            waiter.wake()
+
+    def _enqueue(self, key: Hashable, loop: Optional[asyncio.AbstractEventLoop]) -> Optional[_Waiter]:
+        """None when admitted at once; the queued waiter otherwise. Raises ``Overloaded`` if the queue is full."""
+        with self._lock:
+            tenant = self._tenant(key)
+            if not tenant.queue and self._has_slot(tenant):
+                self._grant(tenant, self._next_tag(tenant))
+                tenant.waits.append(0.0)
+                return None
+            if len(tenant.queue) >= self.max_queue:
+                tenant.shed_full += 1
+                raise Overloaded("queue_full", 0.0)
+            waiter = _Waiter(self._next_tag(tenant), loop)
+            tenant.queue.append(waiter)
+            return waiter
+
+    def _settle(self, key: Hashable, waiter: _Waiter, started: float) -> float:
+        """Record the wait of a woken or timed-out waiter; return it in ms, or raise ``Overloaded``."""
+        wait_ms = (time.monotonic() - started) * 1000
+        with self._lock:
+            tenant = self._tenants[key]
+            tenant.waits.append(wait_ms)
+            if waiter.granted:
+                return wait_ms
+            tenant.queue.remove(waiter)
+            tenant.shed_timeout += 1
+        raise Overloaded("queue_timeout", wait_ms)
+
+    def _abandon(self, key: Hashable, waiter: _Waiter) -> None:
+        """The caller went away: give back a slot granted meanwhile, or leave the queue."""
+        with self._lock:
+            if not waiter.granted:
+                self._tenants[key].queue.remove(waiter)
+                return
+        self.release(key)
+
+    async def acquire(self, key: Hashable) -> float:
+        """Take a slot for tenant ``key``; return the queue wait in ms. Raises ``Overloaded`` when shed."""
+        started = time.monotonic()
+        waiter = self._enqueue(key, asyncio.get_running_loop())
+        if waiter is None:
+            return 0.0
+        try:
+            await waiter.wait(self.queue_timeout_s)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            self._abandon(key, waiter)
+            raise
+        return self._settle(key, waiter, started)
+
+    def acquire_sync(self, key: Hashable) -> float:
+        """Blocking ``acquire`` for worker threads and scripts."""
+        started = time.monotonic()
+        waiter = self._enqueue(key, None)
+        if waiter is None:
+            return 0.0
+        waiter.wait_sync(self.queue_timeout_s)
+        return self._settle(key, waiter, started)
+
+    def release(self, key: Hashable) -> None:
+        with self._lock:
+            tenant = self._tenants[key]
+            tenant.in_flight -= 1
+            self._in_flight -= 1
+            self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tenants = {
+                str(key): {
+                    "weight": tenant.weight,
+                    "in_flight": tenant.in_flight,
+                    "queued": len(tenant.queue),
+                    "admitted": tenant.admitted,
+                    "shed_queue_full": tenant.shed_full,
+                    "shed_queue_timeout": tenant.shed_timeout,
+                    "wait_ms_p50": _percentile(tenant.waits, 0.5),
+                    "wait_ms_p99": _percentile(tenant.waits, 0.99),
+                }
+                for key, tenant in self._tenants.items()
+            }
+            return {
+                "max_concurrent": self.max_concurrent,
+                "tenant_max_concurrent": self.tenant_max_concurrent,
+                "in_flight": self._in_flight,
+                "queued": sum(len(t.queue) for t in self._tenants.values()),
+                "tenants": tenants,
+            }
+
+
+admission_controller = AdmissionController(
+    max_concurrent=config.ADMISSION_MAX_CONCURRENT,
+    tenant_max_concurrent=config.ADMISSION_TENANT_MAX_CONCURRENT,
+    max_queue=config.ADMISSION_MAX_QUEUE,
+    queue_timeout_s=config.ADMISSION_QUEUE_TIMEOUT_S,
+    weights=parse_weights(config.ADMISSION_TENANT_WEIGHTS),
+)
@@ -1,11 +1,26 @@
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, AsyncIterator, Callable, List, Tuple
 from dataclasses import dataclass, field
+from collections import OrderedDict
 from uuid import uuid4
-from openai import OpenAI
+import asyncio
+import functools
+import re
+import sys
+import threading
+import time
 
-Líneas corregidas
 import config
-from rag_module import query_rag
+import fanout
+import mro_sync
+from admission import Overloaded, admission_controller
+from answer_cache import answer_cache, make_scope
+from aviation_codes import extract_fault_refs, normalize_ata
+from context_builder import build_messages, fault_history_lines
+from llm_client import acreate_chat_completion, create_chat_completion
+from rag_module import get_pipeline, query_rag
+from session_store import SessionStore, get_session_store
+from singleflight import chat_flights
+from sql_agent import fault_history
 
 
 FAULT_KEYWORDS = [
@@ -19,168 +34,890 @@ AIRCRAFT_TOKENS = [
 ]
 
 
+SYSTEM_PROMPT = (
+    "You are a hybrid expert:\n"
+    "- A senior aircraft maintenance engineer with more than 30 years of hands-on experience in line maintenance, base maintenance, MCC, and quality inspection.\n"
+    "- A senior aircraft design engineer with more than 30 years of experience.\n\n"
+    "HARD CONSTRAINTS:\n"
+    "- You do NOT have access to proprietary OEM manuals (AMM, SRM, IPC, FCOM, TSM, WDM, schematics, etc.).\n"
+    "- You must NOT quote, paraphrase, or simulate OEM procedures.\n"
+    "- You may only use:\n"
+    "  • Public MMELs and equivalent public documents.\n"
+    "  • Public regulations and safety documents (FAA/EASA, advisory circulars).\n"
+    "  • Human Factors and safety handbooks.\n"
+    "  • Company MEL, MOE, procedures, engineering memos, and reliability reports that the tenant has uploaded.\n\n"
+    "YOUR ROLE:\n"
+    "- You are NOT a manual search engine.\n"
+    "- You behave as an experienced engineering colleague who:\n"
+    "  • Interprets and explains fault codes (Alpha Call-Up, ACMS, EICAS, BITE, status messages) in clear language.\n"
+    "  • Correlates symptoms, ATA chapters, and system interdependencies.\n"
+    "  • Highlights potential risks, Human Factors issues, and FOD exposure.\n"
+    "  • Guides technicians on what TYPE of OEM documentation to consult (AMM, TSM, SRM, etc.) WITHOUT reproducing or guessing OEM procedures.\n"
+    "  • Asks for missing data when information is incomplete (aircraft model, ATA, phase of flight, environment, recent maintenance, MEL deferrals, history of similar defects).\n"
+    "  • Simplifies complex technical concepts for less experienced TMAs.\n\n"
+    "BEHAVIOUR:\n"
+    "- If you lack sufficient context, ask for more data instead of guessing.\n"
+    "- Never state that an aircraft is serviceable, ready for Return-to-Service, or fit to fly.\n"
+    "- Always remind the user to verify against OEM manuals, MMEL/MEL, and approved organisational procedures.\n"
+    "- Respond in the same language the user writes in.\n"
+)
+
+
+# Words a plain records lookup ("history of C4254 on EC-MXV") may hold besides the references.
+LOOKUP_WORDS = frozenset([
+    "fault", "faults", "code", "codes", "history", "previous", "prior", "last", "recent", "occurrences",
+    "defect", "defects", "tail", "on", "of", "for", "the", "and", "show", "ata",
+    "historial", "código", "codigo", "códigos", "codigos", "fallo", "fallos", "falla", "fallas",
+    "avería", "averia", "averías", "averias", "matrícula", "matricula", "en", "de", "del", "el", "la",
+    "los", "las", "y", "muestra", "anteriores",
+])
+
+
 def contains_fault_indicators(text: str) -> bool:
     t = (text or "").lower()
     return any(k in t for k in FAULT_KEYWORDS)
 
 
+def is_history_lookup(refs: Dict[str, Any]) -> bool:
+    """True when the question is only fault codes / tails / ATA plus lookup words."""
+    return all(word in LOOKUP_WORDS for word in re.findall(r"\w+", refs["rest"].lower()))
+
+
+# Rough per-turn overhead (tuple + list slot) on top of the string itself.
+_TURN_OVERHEAD_BYTES = 72
+
+
+class MemoryMeter:
+    """Shared byte counter so the manager can enforce a global budget in O(1)."""
+    __slots__ = ("bytes",)
+
+    def __init__(self) -> None:
+        self.bytes = 0
+
+
+def _user_turn(question: str, aircraft_model: Optional[str], ata: Optional[str]) -> str:
+    user_message = question
+    if aircraft_model:
+        user_message = f"[Aircraft: {aircraft_model}] {user_message}"
+    if ata:
+        user_message = f"[ATA: {ata}] {user_message}"
+    return user_message
+
+
 @dataclass
 class AeroAgent:
     company_id: Optional[int]
     conversation_id: str
+    # Compact history: (role, content) tuples holding the raw question, never the RAG-inflated prompt.
     memory: list = field(default_factory=list)
+    last_used: float = field(default_factory=time.monotonic)
+    size_bytes: int = 0
+    meter: Optional[MemoryMeter] = field(default=None, repr=False)
+    store: Optional[SessionStore] = field(default=None, repr=False)
+    # Length of the backend log already reflected in ``memory``.
+    synced: int = 0
+    # Absolute number of turns seen; ``memory`` holds the last ``len(memory)`` of them.
+    turn_total: int = 0
+    # Rolling summary of turns [0, summary_upto) that no longer fit the prompt verbatim.
+    summary: str = ""
+    summary_upto: int = 0
 
-    def ask(self, question: str, aircraft_model: Optional[str], ata: Optional[str]) -> Dict[str, Any]:
-        # Build system prompt
-        system_prompt = (
-            "You are a hybrid expert:\n"
-            "- A senior aircraft maintenance engineer with more than 30 years of hands-on experience in line maintenance, base maintenance, MCC, and quality inspection.\n"
-            "- A senior aircraft design engineer with more than 30 years of experience.\n\n"
-            "HARD CONSTRAINTS:\n"
-            "- You do NOT have access to proprietary OEM manuals (AMM, SRM, IPC, FCOM, TSM, WDM, schematics, etc.).\n"
-            "- You must NOT quote, paraphrase, or simulate OEM procedures.\n"
-            "- You may only use:\n"
-            "  • Public MMELs and equivalent public documents.\n"
-            "  • Public regulations and safety documents (FAA/EASA, advisory circulars).\n"
-            "  • Human Factors and safety handbooks.\n"
-            "  • Company MEL, MOE, procedures, engineering memos, and reliability reports that the tenant has uploaded.\n\n"
-            "YOUR ROLE:\n"
-            "- You are NOT a manual search engine.\n"
-            "- You behave as an experienced engineering colleague who:\n"
-            "  • Interprets and explains fault codes (Alpha Call-Up, ACMS, EICAS, BITE, status messages) in clear language.\n"
-            "  • Correlates symptoms, ATA chapters, and system interdependencies.\n"
-            "  • Highlights potential risks, Human Factors issues, and FOD exposure.\n"
-            "  • Guides technicians on what TYPE of OEM documentation to consult (AMM, TSM, SRM, etc.) WITHOUT reproducing or guessing OEM procedures.\n"
-            "  • Asks for missing data when information is incomplete (aircraft model, ATA, phase of flight, environment, recent maintenance, MEL deferrals, history of similar defects).\n"
-            "  • Simplifies complex technical concepts for less experienced TMAs.\n\n"
-            "BEHAVIOUR:\n"
-            "- If you lack sufficient context, ask for more data instead of guessing.\n"
-            "- Never state that an aircraft is serviceable, ready for Return-to-Service, or fit to fly.\n"
-            "- Always remind the user to verify against OEM manuals, MMEL/MEL, and approved organisational procedures.\n"
-            "- Respond in the same language the user writes in.\n"
-        )
+    @property
+    def key(self) -> tuple:
+        return (self.company_id, self.conversation_id)
 
-        is_fault_centric = contains_fault_indicators(question)
+    def _remember(self, role: str, content: str) -> None:
+        content = content or ""
+        self._remember_local(role, content)
+        if self.store is None:
+            return
+        new_length = self.store.append(self.key, [(role, content)])
+        if new_length != self.synced + 1:
+            # Another worker appended in between; rebuild the tail in the backend's order.
+            self._reload(new_length)
+        else:
+            self.synced = new_length
+
+    def sync(self) -> None:
+        """Pull turns appended by other workers since the last sync."""
+        if self.store is None:
+            return
+        length = self.store.length(self.key)
+        if length == self.synced:
+            return
+        if length < self.synced or length - self.synced > config.CONVERSATION_MAX_MESSAGES:
+            self._reload(length)
+            return
+        for role, content in self.store.load(self.key, start=self.synced):
+            self._remember_local(role, content)
+        self.synced = length
+
+    def _reload(self, length: int) -> None:
+        start = max(0, length - config.CONVERSATION_MAX_MESSAGES)
+        turns = self.store.load(self.key, start=start)
+        while self.memory:
+            self._forget_oldest()
+        self.turn_total = start
+        for role, content in turns:
+            self._remember_local(role, content)
+        self.synced = length
+
+    async def _off_loop(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """``fn(*args)`` from the event loop; in a worker thread when the session store does blocking I/O."""
+        if self.store is not None and self.store.blocking:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
 
+    def _remember_local(self, role: str, content: str) -> None:
+        size = sys.getsizeof(content) + _TURN_OVERHEAD_BYTES
+        self.memory.append((role, content))
+        self.turn_total += 1
+        self.size_bytes += size
+        if self.meter is not None:
+            self.meter.bytes += size
+        while len(self.memory) > config.CONVERSATION_MAX_MESSAGES:
+            self._forget_oldest()
+
+    def _forget_oldest(self) -> None:
+        _, content = self.memory.pop(0)
+        size = sys.getsizeof(content) + _TURN_OVERHEAD_BYTES
+        self.size_bytes -= size
+        if self.meter is not None:
+            self.meter.bytes -= size
+
+    def history_messages(self, last_n: int) -> list:
+        return [{"role": role, "content": content} for role, content in self.memory[-last_n:]] if last_n > 0 else []
+
+    def _retrieve(self, question: str, aircraft_model: Optional[str], ata: Optional[str]) -> Dict[str, Any]:
         # Query RAG (will return empty if not implemented)
-        rag_result = query_rag(
+        return query_rag(
             question,
             company_id=self.company_id,
             aircraft_model=aircraft_model,
             ata_chapter=ata,
         )
+
+    def _history_atas(self, refs: Dict[str, Any], ata: Optional[str], is_fault_centric: bool) -> Optional[List[str]]:
+        """ATA chapters for the records lookup, or None when the question names nothing to look up."""
+        if self.company_id is None or not config.AGENT_FAULT_HISTORY_ENABLED:
+            return None
+        # An ATA chapter alone only selects history for fault-centric questions.
+        atas = (refs["atas"] or [a for a in [normalize_ata(ata)] if a]) if is_fault_centric else []
+        if not (refs["fault_codes"] or refs["tails"] or atas):
+            return None
+        return atas
+
+    def _history_sources(
+        self, refs: Dict[str, Any], atas: Optional[List[str]], aircraft_model: Optional[str]
+    ) -> Dict[str, fanout.Source]:
+        if atas is None:
+            return {}
+        return {"failures_db": lambda deadline: fault_history(
+            self.company_id, refs["fault_codes"], refs["tails"], atas, aircraft_model
+        )}
+
+    def _live_providers(self) -> list:
+        """Integrations queried live for this tenant: the enabled ones, unless mro_sync mirrors them."""
+        if not config.AGENT_LIVE_INTEGRATIONS or self.company_id in mro_sync.companies():
+            return []
+        return [client_cls for client_cls in mro_sync.PROVIDERS if client_cls.is_enabled(self.company_id)]
+
+    async def _live_defects(
+        self,
+        client_cls: type,
+        refs: Dict[str, Any],
+        aircraft_model: Optional[str],
+        ata: Optional[str],
+        deadline: float,
+    ) -> List[Dict[str, Any]]:
+        """The provider's recent defects as failures-shaped records, narrowed to the named codes / tails."""
+        defects = await client_cls(self.company_id).get_defect_history(
+            aircraft_model, ata, limit=config.AGENT_INTEGRATION_MAX_ROWS, timeout=max(0.001, deadline - time.monotonic())
+        )
+        records = mro_sync.live_records(self.company_id, client_cls.provider_name, defects)
+        codes, tails = set(refs["fault_codes"]), set(refs["tails"])
+        if codes or tails:
+            records = [r for r in records if r["fault_code"] in codes or r["tail"] in tails]
+        return records
+
+    def _context_sources(
+        self,
+        question: str,
+        aircraft_model: Optional[str],
+        ata: Optional[str],
+        refs: Dict[str, Any],
+        atas: Optional[List[str]],
+        prefetched: Dict[str, Any],
+        live: bool = True,
+    ) -> Dict[str, fanout.Source]:
+        """Everything this turn reads, keyed by source name; ``prefetched`` sources are not asked again."""
+        sources: Dict[str, fanout.Source] = {"rag": lambda deadline: self._retrieve(question, aircraft_model, ata)}
+        sources.update(self._history_sources(refs, atas, aircraft_model))
+        if live and atas is not None:
+            ata_hint = atas[0] if atas else ata
+            for client_cls in self._live_providers():
+                sources[f"integration:{client_cls.provider_name}"] = functools.partial(
+                    self._live_defects, client_cls, refs, aircraft_model, ata_hint
+                )
+        return {name: source for name, source in sources.items() if name not in prefetched}
+
+    @staticmethod
+    def _merge_context(
+        values: Dict[str, Any], report: Dict[str, Dict[str, Any]], started: float
+    ) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]], Dict[str, Any]]:
+        """``(rag_result, history, context_report)``: live records join the tenant's, newest first."""
+        rag_result = values.get("rag") or {}
+        history = values.get("failures_db")
+        items = {"rag": len(rag_result.get("fuentes", []))}
+        if history:
+            items["failures_db"] = len(history["fault_codes"]) + len(history["registros"])
+        live = []
+        for name, records in values.items():
+            if name.startswith("integration:"):
+                items[name] = len(records)
+                live.extend(records)
+        if live:
+            history = dict(history or {"fault_codes": [], "tails": [], "atas": [], "registros": []})
+            history["registros"] = sorted(
+                history["registros"] + live, key=lambda r: r["occurrence_date"] or "", reverse=True
+            )
+        for name, entry in report.items():
+            if entry["status"] == "ok":
+                entry["items"] = items.get(name, 0)
+            elif entry["status"] != "skipped":
+                detail = f": {entry['error']}" if "error" in entry else ""
+                print(f"[AGENT] Context source {name} skipped ({entry['status']}{detail})")
+        context = {
+            "deadline_s": config.AGENT_CONTEXT_DEADLINE_S,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            "sources": report,
+            "contributed": [name for name, entry in report.items() if entry.get("items")],
+        }
+        return rag_result, history, context
+
+    @staticmethod
+    def _wants_history_only(refs: Dict[str, Any], history_only: Optional[bool]) -> bool:
+        """Whether a known fault code would be answered from the records alone: the caller's or configured choice."""
+        if not refs["fault_codes"]:
+            return False
+        if history_only is not None:
+            return history_only
+        mode = config.AGENT_HISTORY_ONLY
+        return mode == "always" or (mode == "exact" and is_history_lookup(refs))
+
+    def _history_only(
+        self, refs: Dict[str, Any], history: Optional[Dict[str, Any]], history_only: Optional[bool]
+    ) -> bool:
+        return bool(history and history["fault_codes"]) and self._wants_history_only(refs, history_only)
+
+    @staticmethod
+    def _history_report(history: Dict[str, Any], mode: str) -> Dict[str, Any]:
+        return {
+            "mode": mode,
+            "fault_codes": [c["fault_code"] for c in history["fault_codes"]],
+            "tails": history["tails"],
+            "atas": history["atas"],
+            "record_ids": [r["id"] for r in history["registros"] if r["id"] is not None],
+            "live_records": sum(1 for r in history["registros"] if r.get("live")),
+        }
+
+    @staticmethod
+    def _fault_history_body(history: Dict[str, Any]) -> str:
+        codes = ", ".join(c["fault_code"] for c in history["fault_codes"])
+        return f"Maintenance history for {codes} (your organisation's records):\n" + "\n".join(
+            fault_history_lines(history)
+        )
+
+    def _from_fault_history(
+        self,
+        question: str,
+        aircraft_model: Optional[str],
+        ata: Optional[str],
+        is_fault_centric: bool,
+        history: Dict[str, Any],
+        context: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        """No-LLM answer for a known-code lookup: the tenant's records, formatted."""
+        answer_body = self._fault_history_body(history)
+        self._remember("user", _user_turn(question, aircraft_model, ata))
+        self._remember("assistant", answer_body)
+
+        metadata = self._metadata(aircraft_model, ata, is_fault_centric)
+        metadata["model_used"] = None
+        metadata["fault_history"] = self._history_report(history, "history_only")
+        metadata["context"] = context
+        return {
+            "respuesta": answer_body + "\n\n" + config.SAFETY_DISCLAIMER,
+            "fuentes": [],
+            # Exact records, not a generated answer.
+            "confianza": 1.0,
+            "tipo": "fault_history",
+            "metadata": metadata,
+        }
+
+    def _no_history(
+        self, aircraft_model: Optional[str], ata: Optional[str], is_fault_centric: bool, context: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """``history_only`` was requested but no known fault code matched: say so, without calling the LLM."""
+        metadata = self._metadata(aircraft_model, ata, is_fault_centric)
+        metadata["model_used"] = None
+        metadata["fault_history"] = {"mode": "history_only", "fault_codes": [], "tails": [], "atas": [], "record_ids": []}
+        metadata["context"] = context
+        return {
+            "respuesta": (
+                "No maintenance records of your organisation match a fault code in this question."
+                f"\n\n{config.SAFETY_DISCLAIMER}"
+            ),
+            "fuentes": [],
+            "confianza": 0.0,
+            "tipo": "fault_history",
+            "metadata": metadata,
+        }
+
+    def _build_messages(
+        self,
+        question: str,
+        aircraft_model: Optional[str],
+        ata: Optional[str],
+        docs: list,
+        history: Optional[Dict[str, Any]] = None,
+    ) -> tuple:
+        """Return ``(messages, token_report)`` for this turn within the prompt token budget."""
+        user_message = _user_turn(question, aircraft_model, ata)
+
+        # Turns still in memory that the rolling summary does not cover yet.
+        memory_start = self.turn_total - len(self.memory)
+        self.summary_upto = max(self.summary_upto, memory_start)
+        turns = self.memory[self.summary_upto - memory_start:]
+        messages, self.summary, n_folded, report = build_messages(
+            SYSTEM_PROMPT, turns, self.summary, user_message, docs, fault_history=history
+        )
+        self.summary_upto += n_folded
+
+        # Only the raw question is kept in memory; documents are re-retrieved per turn.
+        self._remember("user", user_message)
+        return messages, report
+
+    @staticmethod
+    def _grade(docs: list, confianza: float) -> tuple:
+        """Return (final_confidence, tipo, caution_prefix) from the RAG results."""
+        # Set confidence based on RAG results
+        if docs and confianza >= 0.75:
+            return confianza, "ok", ""
+        if docs and confianza >= 0.5:
+            caution_prefix = (
+                "⚠️ LOW-CONFIDENCE ADVISORY:\n"
+                "The following reasoning is based on limited context. "
+                "Verify carefully against OEM manuals and approved procedures.\n\n"
+            )
+            return confianza, "low_confidence", caution_prefix
+        # No RAG docs, but OpenAI answered with general knowledge
+        return 0.6, "general_knowledge", ""
+
+    @staticmethod
+    def _metadata(aircraft_model: Optional[str], ata: Optional[str], is_fault_centric: bool) -> Dict[str, Any]:
+        return {
+            "ata_hint": ata,
+            "aircraft_model": aircraft_model,
+            "fault_mode": is_fault_centric,
+            "model_used": config.OPENAI_MODEL_CHAT,
+        }
+
+    def _finish(
+        self,
+        answer_body: str,
+        docs: list,
+        confianza: float,
+        aircraft_model: Optional[str],
+        ata: Optional[str],
+        is_fault_centric: bool,
+        prompt_report: Optional[Dict[str, int]] = None,
+        rerank_report: Optional[Dict[str, int]] = None,
+        history: Optional[Dict[str, Any]] = None,
+        context: Optional[Dict[str, Any]] = None,
+        wait_ms: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        # Save assistant response to memory
+        self._remember("assistant", answer_body)
+
+        final_confidence, tipo, caution_prefix = self._grade(docs, confianza)
+        full_answer = caution_prefix + answer_body + "\n\n" + config.SAFETY_DISCLAIMER
+
+        metadata = self._metadata(aircraft_model, ata, is_fault_centric)
+        if prompt_report is not None:
+            metadata["prompt_tokens"] = prompt_report
+        if rerank_report is not None:
+            metadata["rerank"] = rerank_report
+        if history is not None:
+            metadata["fault_history"] = self._history_report(history, "prompt")
+        if context is not None:
+            metadata["context"] = context
+        if wait_ms is not None:
+            metadata["admission"] = {"wait_ms": round(wait_ms, 1)}
+        return {
+            "respuesta": full_answer,
+            "fuentes": docs,
+            "confianza": final_confidence,
+            "tipo": tipo,
+            "metadata": metadata,
+        }
+
+    @staticmethod
+    def _no_api_key() -> Dict[str, Any]:
+        return {
+            "respuesta": f"ERROR: OpenAI API key not configured. Please set OPENAI_API_KEY environment variable.\n\n{config.SAFETY_DISCLAIMER}",
+            "fuentes": [],
+            "confianza": 0.0,
+            "tipo": "error_no_api_key",
+            "metadata": {},
+        }
+
+    @staticmethod
+    def _error(e: Exception) -> Dict[str, Any]:
+        error_msg = f"Error calling OpenAI API: {str(e)}"
+        return {
+            "respuesta": f"{error_msg}\n\n{config.SAFETY_DISCLAIMER}",
+            "fuentes": [],
+            "confianza": 0.0,
+            "tipo": "error",
+            "metadata": {"error": str(e)},
+        }
+
+    @staticmethod
+    def _overloaded(e: Overloaded) -> Dict[str, Any]:
+        return {
+            "respuesta": (
+                "The assistant is at capacity for your organisation right now. Please retry in a few seconds."
+                f"\n\n{config.SAFETY_DISCLAIMER}"
+            ),
+            "fuentes": [],
+            "confianza": 0.0,
+            "tipo": "overloaded",
+            "metadata": {"admission": {"shed": e.reason, "wait_ms": round(e.wait_ms, 1)}},
+        }
+
+    def _answer_cache_probe(
+        self, question: str, aircraft_model: Optional[str], ata: Optional[str]
+    ) -> Optional[Dict[str, Any]]:
+        """Look the question up in the semantic answer cache.
+
+        Only first turns are cached: a follow-up depends on the conversation
+        history, so reusing another conversation's answer would be wrong.
+        """
+        if not config.ANSWER_CACHE_ENABLED or self.memory:
+            return None
+        pipeline = get_pipeline()
+        probe = {
+            "scope": make_scope(self.company_id, aircraft_model, ata),
+            "vector": pipeline.embed_query(question),
+            "version": pipeline.corpus_version(self.company_id),
+        }
+        probe["hit"] = answer_cache.lookup(probe["scope"], probe["vector"], probe["version"])
+        return probe
+
+    def _from_answer_cache(
+        self, question: str, aircraft_model: Optional[str], ata: Optional[str], hit: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        self._remember("user", _user_turn(question, aircraft_model, ata))
+        self._remember("assistant", hit["answer_body"])
+
+        cached = hit["result"]
+        metadata = dict(cached.get("metadata", {}))
+        metadata["answer_cache"] = {"hit": True, "similarity": hit["similarity"], "age_s": hit["age_s"]}
+        return {**cached, "fuentes": [dict(f) for f in cached.get("fuentes", [])], "metadata": metadata}
+
+    @staticmethod
+    def _answer_cache_store(probe: Optional[Dict[str, Any]], result: Dict[str, Any], answer_body: str) -> None:
+        if probe is None:
+            return
+        answer_cache.store(probe["scope"], probe["vector"], probe["version"], result, answer_body)
+        result["metadata"] = {**result.get("metadata", {}), "answer_cache": {"hit": False}}
+
+    def ask(
+        self, question: str, aircraft_model: Optional[str], ata: Optional[str], history_only: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        """Synchronous path, kept for scripts and non-async callers."""
+        is_fault_centric = contains_fault_indicators(question)
+        refs = extract_fault_refs(question)
+        atas = self._history_atas(refs, ata, is_fault_centric)
+        started, deadline = time.perf_counter(), time.monotonic() + config.AGENT_CONTEXT_DEADLINE_S
+        values, report = {}, {}
+        if self._wants_history_only(refs, history_only):
+            # The records lookup takes milliseconds and may make the rest of the turn unnecessary.
+            values, report = fanout.gather_sync(self._history_sources(refs, atas, aircraft_model), deadline)
+            if self._history_only(refs, values.get("failures_db"), history_only):
+                _, history, context = self._merge_context(values, report, started)
+                return self._from_fault_history(question, aircraft_model, ata, is_fault_centric, history, context)
+        if history_only:
+            # An explicit records-only request never falls through to the LLM.
+            _, _, context = self._merge_context(values, report, started)
+            return self._no_history(aircraft_model, ata, is_fault_centric, context)
+        # Answers built on live records are not cached (they go stale as records arrive).
+        probe = None if atas is not None else self._answer_cache_probe(question, aircraft_model, ata)
+        if probe and probe["hit"]:
+            return self._from_answer_cache(question, aircraft_model, ata, probe["hit"])
+        # Integration clients are async-only: this path reads the local mirror and the vector store.
+        more_values, more_report = fanout.gather_sync(
+            self._context_sources(question, aircraft_model, ata, refs, atas, report, live=False), deadline
+        )
+        rag_result, history, context = self._merge_context({**values, **more_values}, {**report, **more_report}, started)
         docs = rag_result.get("fuentes", [])
         confianza = float(rag_result.get("confianza", 0.0))
 
-        # Build context from RAG docs if available
-        rag_context = ""
-        if docs:
-            rag_context = "\n\nRELEVANT DOCUMENTS FROM KNOWLEDGE BASE:\n"
-            for i, doc in enumerate(docs, 1):
-                rag_context += f"\n[Doc {i}] {doc.get('doc_title', 'Unknown')}:\n{doc.get('content', '')[:1000]}\n"
-
-        # Build user message with context
-        user_message = question
-        if aircraft_model:
-            user_message = f"[Aircraft: {aircraft_model}] {user_message}"
-        if ata:
-            user_message = f"[ATA: {ata}] {user_message}"
-        if rag_context:
-            user_message += rag_context
-
         # Check if API key is configured
         if not config.OPENAI_API_KEY:
-            return {
-                "respuesta": f"ERROR: OpenAI API key not configured. Please set OPENAI_API_KEY environment variable.\n\n{config.SAFETY_DISCLAIMER}",
-                "fuentes": [],
-                "confianza": 0.0,
-                "tipo": "error_no_api_key",
-                "metadata": {},
-            }
+            return self._no_api_key()
 
+        try:
+            wait_ms = admission_controller.acquire_sync(self.company_id)
+        except Overloaded as e:
+            return self._overloaded(e)
         # Call OpenAI API
         try:
-            client = OpenAI(api_key=config.OPENAI_API_KEY)
-            
-            # Add to memory for context
-            self.memory.append({"role": "user", "content": user_message})
-            
-            # Build messages with conversation history (last 10 messages)
-            messages = [{"role": "system", "content": system_prompt}]
-            messages.extend(self.memory[-10:])
-            
-            response = client.chat.completions.create(
+            messages, prompt_report = self._build_messages(question, aircraft_model, ata, docs, history)
+            response = create_chat_completion(
                 model=config.OPENAI_MODEL_CHAT,
                 messages=messages,
                 temperature=0.3,
                 max_tokens=2000,
             )
-            
             answer_body = response.choices[0].message.content
-            
-            # Save assistant response to memory
-            self.memory.append({"role": "assistant", "content": answer_body})
-            
-            # Set confidence based on RAG results
-            if docs and confianza >= 0.75:
-                final_confidence = confianza
-                tipo = "ok"
-                caution_prefix = ""
-            elif docs and confianza >= 0.5:
-                final_confidence = confianza
-                tipo = "low_confidence"
-                caution_prefix = (
-                    "⚠️ LOW-CONFIDENCE ADVISORY:\n"
-                    "The following reasoning is based on limited context. "
-                    "Verify carefully against OEM manuals and approved procedures.\n\n"
+            result = self._finish(
+                answer_body, docs, confianza, aircraft_model, ata, is_fault_centric, prompt_report, rag_result.get("rerank"),
+                history, context, wait_ms,
+            )
+            self._answer_cache_store(probe, result, answer_body)
+            return result
+        except Exception as e:
+            return self._error(e)
+        finally:
+            admission_controller.release(self.company_id)
+
+    def _flight_key(
+        self, mode: str, question: str, aircraft_model: Optional[str], ata: Optional[str], history_only: Optional[bool]
+    ) -> Optional[tuple]:
+        """Single-flight key, or None when the turn must run on its own.
+
+        Like the answer cache, only first turns are shared: a follow-up depends
+        on this conversation's history.
+        """
+        if not config.SINGLEFLIGHT_ENABLED or self.memory:
+            return None
+        words = " ".join(re.findall(r"\w+", question.lower()))
+        return (mode, *make_scope(self.company_id, aircraft_model, ata), history_only, words)
+
+    def _from_flight(
+        self,
+        question: str,
+        aircraft_model: Optional[str],
+        ata: Optional[str],
+        result: Dict[str, Any],
+        answer_body: Optional[str],
+        started: float,
+    ) -> Dict[str, Any]:
+        """An identical in-flight request's result, recorded as this conversation's turn."""
+        if answer_body is not None:
+            self._remember("user", _user_turn(question, aircraft_model, ata))
+            self._remember("assistant", answer_body)
+        metadata = dict(result.get("metadata", {}))
+        metadata["singleflight"] = {"shared": True, "wait_ms": round((time.perf_counter() - started) * 1000, 1)}
+        return {**result, "fuentes": [dict(f) for f in result.get("fuentes", [])], "metadata": metadata}
+
+    async def aask(
+        self, question: str, aircraft_model: Optional[str], ata: Optional[str], history_only: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        """Async path used by the API: retrieval runs off-loop, the LLM call shares one pooled client.
+
+        Identical first-turn questions in flight at the same time share one computation.
+        """
+        key = self._flight_key("ask", question, aircraft_model, ata, history_only)
+        if key is None:
+            result, _ = await self._aanswer(question, aircraft_model, ata, history_only)
+            return result
+        started = time.perf_counter()
+        (result, answer_body), shared = await chat_flights.do(
+            key, lambda: self._aanswer(question, aircraft_model, ata, history_only)
+        )
+        if not shared:
+            return result
+        return await self._off_loop(self._from_flight, question, aircraft_model, ata, result, answer_body, started)
+
+    async def _aanswer(
+        self, question: str, aircraft_model: Optional[str], ata: Optional[str], history_only: Optional[bool]
+    ) -> Tuple[Dict[str, Any], Optional[str]]:
+        """``(result, answer_body)`` for ``aask``; ``answer_body`` is None when no turn was recorded."""
+        is_fault_centric = contains_fault_indicators(question)
+        refs = extract_fault_refs(question)
+        atas = self._history_atas(refs, ata, is_fault_centric)
+        started, deadline = time.perf_counter(), time.monotonic() + config.AGENT_CONTEXT_DEADLINE_S
+        values, report = {}, {}
+        if self._wants_history_only(refs, history_only):
+            values, report = await fanout.gather(self._history_sources(refs, atas, aircraft_model), deadline)
+            if self._history_only(refs, values.get("failures_db"), history_only):
+                _, history, context = self._merge_context(values, report, started)
+                result = await self._off_loop(
+                    self._from_fault_history, question, aircraft_model, ata, is_fault_centric, history, context
                 )
-            else:
-                # No RAG docs, but OpenAI answered with general knowledge
-                final_confidence = 0.6
-                tipo = "general_knowledge"
-                caution_prefix = ""
-
-            full_answer = caution_prefix + answer_body + "\n\n" + config.SAFETY_DISCLAIMER
-            
-            return {
-                "respuesta": full_answer,
-                "fuentes": docs,
-                "confianza": final_confidence,
-                "tipo": tipo,
-                "metadata": {
-                    "ata_hint": ata,
-                    "aircraft_model": aircraft_model,
-                    "fault_mode": is_fault_centric,
-                    "model_used": config.OPENAI_MODEL_CHAT,
-                },
-            }
+                return result, self._fault_history_body(history)
+        if history_only:
+            _, _, context = self._merge_context(values, report, started)
+            return self._no_history(aircraft_model, ata, is_fault_centric, context), None
+        probe = None if atas is not None else await asyncio.to_thread(self._answer_cache_probe, question, aircraft_model, ata)
+        if probe and probe["hit"]:
+            result = await self._off_loop(self._from_answer_cache, question, aircraft_model, ata, probe["hit"])
+            return result, probe["hit"]["answer_body"]
+        # RAG, the failures lookup and live integrations run concurrently under one deadline.
+        more_values, more_report = await fanout.gather(
+            self._context_sources(question, aircraft_model, ata, refs, atas, report), deadline
+        )
+        rag_result, history, context = self._merge_context({**values, **more_values}, {**report, **more_report}, started)
+        docs = rag_result.get("fuentes", [])
+        confianza = float(rag_result.get("confianza", 0.0))
+
+        if not config.OPENAI_API_KEY:
+            return self._no_api_key(), None
 
+        try:
+            wait_ms = await admission_controller.acquire(self.company_id)
+        except Overloaded as e:
+            return self._overloaded(e), None
+        try:
+            messages, prompt_report = await self._off_loop(
+                self._build_messages, question, aircraft_model, ata, docs, history
+            )
+            response = await acreate_chat_completion(
+                model=config.OPENAI_MODEL_CHAT,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=2000,
+            )
+            answer_body = response.choices[0].message.content
+            result = await self._off_loop(
+                self._finish,
+                answer_body, docs, confianza, aircraft_model, ata, is_fault_centric, prompt_report, rag_result.get("rerank"),
+                history, context, wait_ms,
+            )
+            self._answer_cache_store(probe, result, answer_body)
+            return result, answer_body
         except Exception as e:
-            error_msg = f"Error calling OpenAI API: {str(e)}"
-            return {
-                "respuesta": f"{error_msg}\n\n{config.SAFETY_DISCLAIMER}",
-                "fuentes": [],
-                "confianza": 0.0,
-                "tipo": "error",
-                "metadata": {"error": str(e)},
-            }
+            return self._error(e), None
+        finally:
+            admission_controller.release(self.company_id)
+
+    async def astream(
+        self, question: str, aircraft_model: Optional[str], ata: Optional[str], history_only: Optional[bool] = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Streaming variant of ``aask``.
+
+        Yields ``("sources", ...)`` as soon as context gathering finishes, then one
+        ``("token", {"delta": ...})`` per model chunk, and finally
+        ``("final", result)`` where ``result`` is exactly what ``aask`` returns.
+        Identical first-turn streams in flight at the same time share one
+        computation; a late joiner first receives the events sent so far.
+        """
+        key = self._flight_key("stream", question, aircraft_model, ata, history_only)
+        if key is None:
+            events, shared = self._astream(question, aircraft_model, ata, history_only), False
+        else:
+            events, shared = chat_flights.stream(key, lambda: self._astream(question, aircraft_model, ata, history_only))
+        started = time.perf_counter()
+        answer_body = None
+        async for event, data in events:
+            if event == "turn":
+                answer_body = data["answer_body"]
+                continue
+            if event == "final" and shared:
+                data = await self._off_loop(self._from_flight, question, aircraft_model, ata, data, answer_body, started)
+            yield event, data
+
+    async def _astream(
+        self, question: str, aircraft_model: Optional[str], ata: Optional[str], history_only: Optional[bool]
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Events of ``astream``, plus ``("turn", {"answer_body": ...})`` before ``final`` when a turn was recorded."""
+        is_fault_centric = contains_fault_indicators(question)
+        refs = extract_fault_refs(question)
+        atas = self._history_atas(refs, ata, is_fault_centric)
+        started, deadline = time.perf_counter(), time.monotonic() + config.AGENT_CONTEXT_DEADLINE_S
+        values, report = {}, {}
+        if self._wants_history_only(refs, history_only):
+            values, report = await fanout.gather(self._history_sources(refs, atas, aircraft_model), deadline)
+            if self._history_only(refs, values.get("failures_db"), history_only):
+                _, history, context = self._merge_context(values, report, started)
+                result = await self._off_loop(
+                    self._from_fault_history, question, aircraft_model, ata, is_fault_centric, history, context
+                )
+                yield "sources", {"fuentes": [], "num_documentos": 0}
+                yield "token", {"delta": self._fault_history_body(history)}
+                yield "turn", {"answer_body": self._fault_history_body(history)}
+                yield "final", result
+                return
+        if history_only:
+            yield "sources", {"fuentes": [], "num_documentos": 0}
+            _, _, context = self._merge_context(values, report, started)
+            yield "final", self._no_history(aircraft_model, ata, is_fault_centric, context)
+            return
+
+        probe = None if atas is not None else await asyncio.to_thread(self._answer_cache_probe, question, aircraft_model, ata)
+        if probe and probe["hit"]:
+            result = await self._off_loop(self._from_answer_cache, question, aircraft_model, ata, probe["hit"])
+            yield "sources", {"fuentes": result["fuentes"], "num_documentos": len(result["fuentes"])}
+            _, _, caution_prefix = self._grade(result["fuentes"], result["confianza"])
+            yield "token", {"delta": caution_prefix + probe["hit"]["answer_body"]}
+            yield "turn", {"answer_body": probe["hit"]["answer_body"]}
+            yield "final", result
+            return
+
+        more_values, more_report = await fanout.gather(
+            self._context_sources(question, aircraft_model, ata, refs, atas, report), deadline
+        )
+        rag_result, history, context = self._merge_context({**values, **more_values}, {**report, **more_report}, started)
+        docs = rag_result.get("fuentes", [])
+        confianza = float(rag_result.get("confianza", 0.0))
+        yield "sources", {"fuentes": docs, "num_documentos": len(docs)}
+
+        if not config.OPENAI_API_KEY:
+            yield "final", self._no_api_key()
+            return
+
+        try:
+            wait_ms = await admission_controller.acquire(self.company_id)
+        except Overloaded as e:
+            yield "final", self._overloaded(e)
+            return
+        _, _, caution_prefix = self._grade(docs, confianza)
+        parts = []
+        try:
+            messages, prompt_report = await self._off_loop(
+                self._build_messages, question, aircraft_model, ata, docs, history
+            )
+            if caution_prefix:
+                yield "token", {"delta": caution_prefix}
+            stream = await acreate_chat_completion(
+                model=config.OPENAI_MODEL_CHAT,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=2000,
+                stream=True,
+            )
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield "token", {"delta": delta}
+        except Exception as e:
+            yield "final", self._error(e)
+            return
+        finally:
+            admission_controller.release(self.company_id)
+
+        answer_body = "".join(parts)
+        result = await self._off_loop(
+            self._finish,
+            answer_body, docs, confianza, aircraft_model, ata, is_fault_centric, prompt_report, rag_result.get("rerank"),
+            history, context, wait_ms,
+        )
+        self._answer_cache_store(probe, result, answer_body)
+        yield "turn", {"answer_body": answer_body}
+        yield "final", result
 
 
 class AgentManager:
     """Multi-tenant agent manager.
     Maps (company_id, conversation_id) -> AeroAgent.
+
+    Agents are a hot, bounded cache in front of a SessionStore: conversations
+    are kept in LRU order and evicted when idle for longer than ``idle_ttl_s``,
+    when there are more than ``max_sessions``, or when the history of all
+    sessions exceeds ``memory_budget_bytes``. With a shared store, history
+    written by other workers is pulled in incrementally on each request.
     """
-    def __init__(self) -> None:
-        self.agents = {}
+    def __init__(
+        self,
+        max_sessions: Optional[int] = None,
+        idle_ttl_s: Optional[float] = None,
+        memory_budget_bytes: Optional[int] = None,
+        store: Optional[SessionStore] = None,
+    ) -> None:
+        self.max_sessions = max_sessions or config.SESSION_MAX_CONVERSATIONS
+        self.idle_ttl_s = idle_ttl_s if idle_ttl_s is not None else config.SESSION_IDLE_TTL_S
+        self.memory_budget_bytes = memory_budget_bytes or int(config.SESSION_MEMORY_BUDGET_MB * 1024 * 1024)
+        self.store = store or get_session_store()
+        self.agents: "OrderedDict[tuple, AeroAgent]" = OrderedDict()
+        self.meter = MemoryMeter()
+        self.sessions_created = 0
+        self.evictions = {"idle": 0, "lru": 0, "memory": 0}
+        self._lock = threading.Lock()
 
     def get_agent(self, company_id: Optional[int], conversation_id: Optional[str]) -> AeroAgent:
+        is_new_conversation = not conversation_id
         if not conversation_id:
             conversation_id = str(uuid4())
         key = (company_id, conversation_id)
-        if key not in self.agents:
-            self.agents[key] = AeroAgent(company_id=company_id, conversation_id=conversation_id)
-        return self.agents[key]
+        now = time.monotonic()
+        with self._lock:
+            agent = self.agents.get(key)
+            cached = agent is not None
+            if agent is None:
+                agent = AeroAgent(
+                    company_id=company_id, conversation_id=conversation_id, meter=self.meter, store=self.store
+                )
+                self.agents[key] = agent
+                self.sessions_created += 1
+            else:
+                self.agents.move_to_end(key)
+            agent.last_used = now
+            self._evict(now, keep=key)
+        # A freshly generated id cannot have history; otherwise catch up with the backend.
+        if not is_new_conversation and (not cached or self.store.shared):
+            agent.sync()
+        return agent
+
+    async def aget_agent(self, company_id: Optional[int], conversation_id: Optional[str]) -> AeroAgent:
+        """``get_agent`` for the event loop: the history sync runs in a worker thread for blocking stores."""
+        if self.store.blocking:
+            return await asyncio.to_thread(self.get_agent, company_id, conversation_id)
+        return self.get_agent(company_id, conversation_id)
+
+    def _drop(self, key: tuple, reason: str) -> None:
+        agent = self.agents.pop(key)
+        self.meter.bytes -= agent.size_bytes
+        agent.meter = None
+        self.store.evict(key)
+        self.evictions[reason] += 1
+
+    def _evict(self, now: float, keep: Optional[tuple]) -> None:
+        # Oldest-used sessions sit at the front of the OrderedDict.
+        while self.agents:
+            key, agent = next(iter(self.agents.items()))
+            if key == keep or now - agent.last_used <= self.idle_ttl_s:
+                break
+            self._drop(key, "idle")
+        while len(self.agents) > self.max_sessions:
+            key = next(iter(self.agents))
+            if key == keep:
+                break
+            self._drop(key, "lru")
+        while self.meter.bytes > self.memory_budget_bytes and len(self.agents) > 1:
+            key = next(iter(self.agents))
+            if key == keep:
+                break
+            self._drop(key, "memory")
 
-    
+    def sweep(self) -> None:
+        """Evict idle sessions without serving a request (run periodically)."""
+        with self._lock:
+            self._evict(time.monotonic(), keep=None)
+        if self.store.shared:
+            self.store.purge_idle(config.SESSION_RETENTION_S)
 
-    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "live_sessions": len(self.agents),
+            "sessions_created": self.sessions_created,
+            "memory_bytes": self.meter.bytes,
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "evictions": dict(self.evictions),
+            "backend": type(self.store).__name__,
+        }
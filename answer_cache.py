@@ -0,0 +1,165 @@
+"""Semantic answer cache in front of the LLM call.
+
+Questions that differ only in wording ("what does BLEED 1 FAULT mean on A320"
+vs "A320 bleed 1 fault meaning") land close together in embedding space, so a
+previous answer can be reused when the cosine similarity of the two query
+embeddings is above a threshold. Entries are scoped per tenant, aircraft model
+and ATA chapter, expire after a TTL, are evicted least-recently-used when the
+cache is full, and are dropped when the tenant's corpus version changes.
+"""
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import config
+
+
+Scope = Tuple[Optional[int], str, str]
+
+
+def make_scope(company_id: Optional[int], aircraft_model: Optional[str], ata: Optional[str]) -> Scope:
+    return (company_id, (aircraft_model or "").strip().upper(), (ata or "").strip().upper())
+
+
+class _Entry:
+    __slots__ = ("entry_id", "scope", "vector", "result", "answer_body", "created_at", "corpus_version")
+
+    def __init__(self, entry_id: int, scope: Scope, vector: np.ndarray, result: Dict[str, Any],
+                 answer_body: str, corpus_version: Hashable) -> None:
+        self.entry_id = entry_id
+        self.scope = scope
+        self.vector = vector
+        self.result = result
+        self.answer_body = answer_body
+        self.created_at = time.monotonic()
+        self.corpus_version = corpus_version
+
+
+class SemanticAnswerCache:
+    def __init__(
+        self,
+        threshold: float = 0.92,
+        ttl_s: float = 6 * 3600,
+        max_entries: int = 5000,
+        max_per_scope: int = 256,
+    ) -> None:
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max(1, max_entries)
+        self.max_per_scope = max(1, max_per_scope)
+        self._lru: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._by_scope: Dict[Scope, "OrderedDict[int, _Entry]"] = {}
+        self._matrix: Dict[Scope, Tuple[List[_Entry], np.ndarray]] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm else v
+
+    def _remove(self, entry: _Entry) -> None:
+        self._lru.pop(entry.entry_id, None)
+        scope_entries = self._by_scope.get(entry.scope)
+        if scope_entries is not None:
+            scope_entries.pop(entry.entry_id, None)
+            if not scope_entries:
+                del self._by_scope[entry.scope]
+        self._matrix.pop(entry.scope, None)
+
+    def lookup(self, scope: Scope, vector: List[float], corpus_version: Hashable) -> Optional[Dict[str, Any]]:
+        """Return ``{"result", "answer_body", "similarity", "age_s"}`` for the best match, or None."""
+        query = self._normalize(vector)
+        now = time.monotonic()
+        with self._lock:
+            scope_entries = self._by_scope.get(scope)
+            if not scope_entries:
+                self.misses += 1
+                return None
+
+            stale = [e for e in scope_entries.values()
+                     if e.corpus_version != corpus_version or now - e.created_at > self.ttl_s]
+            for e in stale:
+                self._remove(e)
+                self.evictions += 1
+            if scope not in self._by_scope:
+                self.misses += 1
+                return None
+
+            cached = self._matrix.get(scope)
+            if cached is None:
+                entries = list(self._by_scope[scope].values())
+                cached = (entries, np.vstack([e.vector for e in entries]))
+                self._matrix[scope] = cached
+            entries, matrix = cached
+
+            sims = matrix @ query
+            best = int(np.argmax(sims))
+            similarity = float(sims[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            entry = entries[best]
+            self._lru.move_to_end(entry.entry_id)
+            self.hits += 1
+            return {
+                "result": entry.result,
+                "answer_body": entry.answer_body,
+                "similarity": round(similarity, 4),
+                "age_s": round(now - entry.created_at, 1),
+            }
+
+    def store(self, scope: Scope, vector: List[float], corpus_version: Hashable,
+              result: Dict[str, Any], answer_body: str) -> None:
+        entry = _Entry(next(self._ids), scope, self._normalize(vector), result, answer_body, corpus_version)
+        with self._lock:
+            scope_entries = self._by_scope.setdefault(scope, OrderedDict())
+            scope_entries[entry.entry_id] = entry
+            self._lru[entry.entry_id] = entry
+            self._matrix.pop(scope, None)
+            while len(scope_entries) > self.max_per_scope:
+                self._remove(next(iter(scope_entries.values())))
+                self.evictions += 1
+            while len(self._lru) > self.max_entries:
+                self._remove(next(iter(self._lru.values())))
+                self.evictions += 1
+
+    def invalidate_company(self, company_id: Optional[int]) -> None:
+        with self._lock:
+            for scope in [s for s in self._by_scope if s[0] == company_id]:
+                for entry in list(self._by_scope[scope].values()):
+                    self._remove(entry)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lru.clear()
+            self._by_scope.clear()
+            self._matrix.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._lru),
+            "scopes": len(self._by_scope),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+answer_cache = SemanticAnswerCache(
+    threshold=config.ANSWER_CACHE_THRESHOLD,
+    ttl_s=config.ANSWER_CACHE_TTL_S,
+    max_entries=config.ANSWER_CACHE_MAX_ENTRIES,
+    max_per_scope=config.ANSWER_CACHE_MAX_PER_SCOPE,
+)
@@ -0,0 +1,66 @@
+"""Canonical aircraft and ATA keys shared by the RAG metadata and the failures table."""
+from typing import Optional
+import re
+
+_ATA_RE = re.compile(r"(\d{2})")
+_AIRCRAFT_STRIP_RE = re.compile(r"[\s\-_]")
+
+
+def normalize_aircraft(aircraft_model: Optional[str]) -> str:
+    """Canonical aircraft key: "b737 max" / "B-737MAX" -> "B737MAX"."""
+    return _AIRCRAFT_STRIP_RE.sub("", (aircraft_model or "").upper())
+
+
+def normalize_ata(ata_chapter: Optional[str]) -> str:
+    """Two-digit ATA chapter: "ATA 21", "21-52-01" -> "21"; "" if none."""
+    match = _ATA_RE.search(ata_chapter or "")
+    return match.group(1) if match else ""
+
+
+# Explicit references in free text (chat questions). Candidates only: callers
+# check codes and tails against the tenant's records before trusting them.
+_ATA_REF_RE = re.compile(r"\bATA[\s\-]*(\d{2})(?:-\d{2}){0,2}\b|\b(\d{2})-\d{2}-\d{2}\b")
+_TAIL_RE = re.compile(r"\b(?:[A-Z0-9]{1,2}-[A-Z0-9]{3,5}|N[1-9][0-9A-Z]{2,4})\b")
+_CODE_RE = re.compile(r"\b[A-Z0-9][A-Z0-9\-/]{2,15}\b")
+_AIRCRAFT_TYPE_RE = re.compile(r"^(?:A3\d\d|B7\d7|E1\d\d|E2\d\d|ATR\d\d|CRJ\d+|DHC\d|Q400)")
+
+
+def _unique(values) -> list:
+    return list(dict.fromkeys(values))
+
+
+def _drop(text: str, token: str) -> str:
+    return re.sub(rf"(?<![\w-]){re.escape(token)}(?![\w-])", " ", text)
+
+
+def extract_fault_refs(text: Optional[str]) -> dict:
+    """Fault codes, tail numbers and ATA chapters named in ``text``.
+
+    "ATA 21" / "21-52-01" -> ata "21"; "EC-MXV", "N123AB" -> tails; any other
+    token of 3+ characters with a digit that is not an aircraft type -> fault
+    code candidate. ``rest`` is what is left of the text once they are removed.
+    """
+    rest = (text or "").upper()
+    atas = [normalize_ata(m.group(1) or m.group(2)) for m in _ATA_REF_RE.finditer(rest)]
+    rest = _ATA_REF_RE.sub(" ", rest)
+
+    tails = []
+    for token in _TAIL_RE.findall(rest):
+        if not _AIRCRAFT_TYPE_RE.match(normalize_aircraft(token)):
+            tails.append(token)
+            rest = _drop(rest, token)
+
+    codes = []
+    for token in _CODE_RE.findall(rest):
+        if _AIRCRAFT_TYPE_RE.match(normalize_aircraft(token)):
+            rest = _drop(rest, token)
+        elif any(c.isdigit() for c in token):
+            codes.append(token)
+            rest = _drop(rest, token)
+
+    return {
+        "fault_codes": _unique(codes),
+        "tails": _unique(tails),
+        "atas": _unique(atas),
+        "rest": " ".join(rest.split()),
+    }
@@ -0,0 +1,119 @@
+"""Streaming, batched embedding + upsert stage for RAG ingestion.
+
+Chunks from many documents are collected into fixed-size batches of
+``EMBED_BATCH_SIZE``. Each full batch is embedded on a thread pool with at
+most ``EMBED_CONCURRENCY`` batches in flight and then upserted in one call.
+When that many batches are already being embedded, ``add_document`` blocks
+until the oldest one is written. That backpressure keeps memory flat (roughly
+``(EMBED_CONCURRENCY + 1) * EMBED_BATCH_SIZE`` chunks) however large the
+library is.
+
+A document can span several batches. Its ``on_done`` callback fires with the
+chunk ids once every one of its chunks has been upserted, which is when the
+ingestion manifest may record it.
+"""
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import config
+
+
+DocumentCallback = Callable[[List[str]], None]
+
+
+class _PendingDocument:
+    __slots__ = ("ids", "remaining", "on_done")
+
+    def __init__(self, ids: List[str], on_done: Optional[DocumentCallback]) -> None:
+        self.ids = ids
+        self.remaining = len(ids)
+        self.on_done = on_done
+
+
+class BatchIngestor:
+    def __init__(
+        self,
+        pipeline: Any,
+        batch_size: Optional[int] = None,
+        concurrency: Optional[int] = None,
+    ) -> None:
+        self.pipeline = pipeline
+        self.batch_size = max(1, batch_size or config.EMBED_BATCH_SIZE)
+        self.concurrency = max(1, concurrency or config.EMBED_CONCURRENCY)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="embed")
+        # Buffered (id, document, metadata, owner) tuples not yet submitted for embedding.
+        self._buffer: List[Tuple[str, str, Dict[str, Any], _PendingDocument]] = []
+        self._in_flight: Deque[Tuple[Future, List[Tuple[str, str, Dict[str, Any], _PendingDocument]]]] = deque()
+        self.started = time.perf_counter()
+        self.documents = 0
+        self.chunks = 0
+
+    def __enter__(self) -> "BatchIngestor":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def add_document(self, chunks: List[Dict[str, Any]], on_done: Optional[DocumentCallback] = None) -> None:
+        ids, documents, metadatas = self.pipeline.prepare_chunks(chunks)
+        owner = _PendingDocument(ids, on_done)
+        if not ids:
+            self._complete(owner)
+            return
+        for record in zip(ids, documents, metadatas):
+            self._buffer.append((*record, owner))
+            if len(self._buffer) >= self.batch_size:
+                self._submit()
+
+    def _submit(self) -> None:
+        batch, self._buffer = self._buffer, []
+        # Backpressure: never more than ``concurrency`` batches embedded-but-not-written.
+        while len(self._in_flight) >= self.concurrency:
+            self._write_oldest()
+        future = self._executor.submit(self.pipeline.embed_texts, [doc for _, doc, _, _ in batch])
+        self._in_flight.append((future, batch))
+
+    def _write_oldest(self) -> None:
+        future, batch = self._in_flight.popleft()
+        embeddings = future.result()
+        self.pipeline.upsert_prepared(
+            [record[0] for record in batch],
+            [record[1] for record in batch],
+            [record[2] for record in batch],
+            embeddings=embeddings,
+        )
+        self.chunks += len(batch)
+        for *_, owner in batch:
+            owner.remaining -= 1
+            if owner.remaining == 0:
+                self._complete(owner)
+
+    def _complete(self, owner: _PendingDocument) -> None:
+        self.documents += 1
+        if owner.on_done is not None:
+            owner.on_done(owner.ids)
+
+    def flush(self) -> None:
+        """Embed and write everything buffered so far."""
+        if self._buffer:
+            self._submit()
+        while self._in_flight:
+            self._write_oldest()
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, float]:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "documents": self.documents,
+            "chunks": self.chunks,
+            "elapsed_s": round(elapsed, 2),
+            "docs_per_s": round(self.documents / elapsed, 2) if elapsed > 0 else 0.0,
+            "chunks_per_s": round(self.chunks / elapsed, 2) if elapsed > 0 else 0.0,
+        }
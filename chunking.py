@@ -0,0 +1,168 @@
+"""Token-aware document chunker for RAG ingestion.
+
+Text is split into blocks (paragraphs, headings, MMEL items) and packed into
+chunks of at most ``CHUNK_MAX_TOKENS``. A heading or an MMEL item number
+("21-52-01 Pack Flow Control Valve") always starts a new chunk once the current
+one has at least ``CHUNK_MIN_TOKENS``, so items are not glued to their
+neighbours. Chunks that are cut only because of size repeat the last
+``CHUNK_OVERLAP_TOKENS`` of the previous chunk. Page numbers, the section
+heading and the ATA chapter of the MMEL item travel with each chunk.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import re
+
+import config
+from context_builder import count_tokens, token_windows, truncate_to_tokens
+
+
+# "21-52-01", "21-52", optionally followed by a title; ATA chapters are two digits.
+MMEL_ITEM_RE = re.compile(r"^\s*(\d{2})-(\d{2})(?:-(\d{2}))?(?:-\d+)*\b")
+MARKDOWN_HEADING_RE = re.compile(r"^\s{0,3}#{1,6}\s+\S")
+NUMBERED_HEADING_RE = re.compile(r"^\s*(?:\d+\.)+\d*\s+[A-Z][^.]{0,80}$")
+
+
+class _Block:
+    __slots__ = ("text", "page", "tokens", "is_heading", "is_item", "ata")
+
+    def __init__(self, text: str, page: Optional[int], is_heading: bool, is_item: bool, ata: str) -> None:
+        self.text = text
+        self.page = page
+        self.tokens = count_tokens(text)
+        self.is_heading = is_heading
+        self.is_item = is_item
+        self.ata = ata
+
+
+def _is_heading(line: str) -> bool:
+    stripped = line.strip()
+    if not stripped or len(stripped) > 100:
+        return False
+    if MARKDOWN_HEADING_RE.match(stripped) or NUMBERED_HEADING_RE.match(stripped):
+        return True
+    letters = [c for c in stripped if c.isalpha()]
+    # Short ALL-CAPS lines ("ATA 21 AIR CONDITIONING") are section titles in MMEL/MEL layouts.
+    return len(letters) >= 4 and len(stripped.split()) <= 10 and all(c.isupper() for c in letters)
+
+
+def _blocks(pages: Iterable[Tuple[Optional[int], str]]) -> List[_Block]:
+    blocks: List[_Block] = []
+    for page, text in pages:
+        paragraph: List[str] = []
+        ata = ""
+        is_item = False
+
+        def flush() -> None:
+            if paragraph:
+                blocks.append(_Block("\n".join(paragraph).strip(), page, False, is_item, ata))
+                paragraph.clear()
+
+        for line in (text or "").splitlines():
+            if not line.strip():
+                flush()
+                is_item = False
+                continue
+            item = MMEL_ITEM_RE.match(line)
+            if item:
+                flush()
+                ata, is_item = item.group(1), True
+                paragraph.append(line.rstrip())
+            elif _is_heading(line):
+                flush()
+                is_item = False
+                blocks.append(_Block(line.strip().lstrip("#").strip(), page, True, False, ""))
+            else:
+                paragraph.append(line.rstrip())
+        flush()
+    return [b for b in blocks if b.text]
+
+
+def _split_oversized(block: _Block, max_tokens: int, overlap: int) -> List[_Block]:
+    """Cut a block larger than a chunk into windows that repeat the last ``overlap`` tokens of the previous one."""
+    if overlap >= max_tokens:
+        raise ValueError(f"Chunk overlap ({overlap} tokens) must be smaller than the chunk size ({max_tokens})")
+    return [
+        _Block(piece, block.page, False, block.is_item, block.ata)
+        for piece in token_windows(block.text, max_tokens, max_tokens - overlap)
+    ]
+
+
+def chunk_pages(
+    pages: Iterable[Tuple[Optional[int], str]],
+    max_tokens: Optional[int] = None,
+    overlap_tokens: Optional[int] = None,
+    min_tokens: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Chunk ``(page_number, text)`` pairs; ``page_number`` may be None for non-paginated text.
+
+    Returns dicts with ``content``, ``page_start``, ``page_end``, ``section``,
+    ``ata_chapter`` (chapter of the first MMEL item in the chunk, or "") and
+    ``chunk_index``.
+    """
+    max_tokens = max_tokens or config.CHUNK_MAX_TOKENS
+    overlap_tokens = config.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    min_tokens = config.CHUNK_MIN_TOKENS if min_tokens is None else min_tokens
+    if overlap_tokens >= max_tokens:
+        raise ValueError(f"Chunk overlap ({overlap_tokens} tokens) must be smaller than the chunk size ({max_tokens})")
+    # A heading repeated atop continuation chunks gets at most half of the room left after the overlap,
+    # so a long one cannot shrink the windows of the text below it to a few tokens each.
+    section_budget = (max_tokens - overlap_tokens) // 2
+
+    chunks: List[Dict[str, Any]] = []
+    current: List[_Block] = []
+    current_tokens = 0
+    section = ""
+    # Heading in force when the current chunk started (repeated as context if the chunk starts mid-section).
+    chunk_section = ""
+
+    def emit() -> None:
+        body = [b for b in current if not b.is_heading]
+        if not body:
+            return
+        text = "\n\n".join(b.text for b in current)
+        if chunk_section and not current[0].is_heading:
+            text = f"{chunk_section}\n\n{text}"
+        pages_seen = [b.page for b in current if b.page is not None]
+        headings = [b.text for b in current if b.is_heading]
+        chunks.append({
+            "content": text,
+            "page_start": min(pages_seen) if pages_seen else None,
+            "page_end": max(pages_seen) if pages_seen else None,
+            "section": headings[-1] if headings else chunk_section,
+            "ata_chapter": next((b.ata for b in current if b.ata), ""),
+            "chunk_index": len(chunks),
+        })
+
+    for block in _blocks(pages):
+        # Leave room for the section heading that is repeated at the top of continuation chunks.
+        limit = max(max_tokens - count_tokens(section), overlap_tokens + 1)
+        pieces = _split_oversized(block, limit, overlap_tokens) if block.tokens > limit else [block]
+        for piece in pieces:
+            boundary = piece.is_heading or (piece.is_item and piece is pieces[0])
+            if boundary and current_tokens >= min_tokens:
+                emit()
+                current, current_tokens, chunk_section = [], count_tokens(section), section
+            elif current_tokens + piece.tokens > max_tokens and current:
+                emit()
+                # Size-driven cut: carry trailing blocks forward as overlap.
+                carried: List[_Block] = []
+                carried_tokens = 0
+                for prev in reversed(current):
+                    if prev.is_heading or carried_tokens + prev.tokens > overlap_tokens:
+                        break
+                    carried.insert(0, prev)
+                    carried_tokens += prev.tokens
+                section_tokens = count_tokens(section)
+                if section_tokens + carried_tokens + piece.tokens > max_tokens:
+                    carried, carried_tokens = [], 0
+                current, current_tokens, chunk_section = carried, section_tokens + carried_tokens, section
+            if piece.is_heading:
+                section = truncate_to_tokens(piece.text, section_budget)
+            current.append(piece)
+            current_tokens += piece.tokens
+    emit()
+    return chunks
+
+
+def chunk_text(text: str, **kwargs: Any) -> List[Dict[str, Any]]:
+    """Chunk non-paginated text such as markdown files."""
+    return chunk_pages([(None, text)], **kwargs)
@@ -10,15 +10,171 @@ load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file_
 OPENAI_API_KEY: Optional[str] = os.getenv("OPENAI_API_KEY")
 QDRANT_URL: str = os.getenv("QDRANT_URL", "http://localhost:6333")
 QDRANT_COLLECTION: str = os.getenv("QDRANT_COLLECTION", "aerobrain_docs")
+# In-process Qdrant on this directory (or ":memory:") instead of the QDRANT_URL server
+QDRANT_PATH: str = os.getenv("QDRANT_PATH", "")
 SQLITE_PATH: str = os.getenv("AEROBRAIN_SQLITE_PATH", "data/failures.db")
 
+# Failures database connection pool (WAL mode)
+DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT_S: float = float(os.getenv("DB_POOL_TIMEOUT_S", "10"))
+DB_BUSY_TIMEOUT_MS: int = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHE_MB: int = int(os.getenv("DB_CACHE_MB", "64"))
+DB_MMAP_MB: int = int(os.getenv("DB_MMAP_MB", "256"))
+
+# Bulk import of defect / reliability exports into failures (failures_import.py)
+FAILURES_IMPORT_CHUNK_ROWS: int = int(os.getenv("FAILURES_IMPORT_CHUNK_ROWS", "5000"))  # rows per executemany
+FAILURES_IMPORT_COMMIT_ROWS: int = int(os.getenv("FAILURES_IMPORT_COMMIT_ROWS", "100000"))  # rows per transaction / checkpoint
+FAILURES_IMPORT_DAY_FIRST: bool = os.getenv("FAILURES_IMPORT_DAY_FIRST", "true").lower() in ("1", "true", "yes")  # 03/04/2024 = 3 April
+
+# Failures search paging (keyset cursor) and streaming export
+FAULTS_PAGE_SIZE: int = int(os.getenv("FAULTS_PAGE_SIZE", "200"))
+FAULTS_PAGE_MAX: int = int(os.getenv("FAULTS_PAGE_MAX", "1000"))
+FAULTS_EXPORT_BATCH: int = int(os.getenv("FAULTS_EXPORT_BATCH", "2000"))  # rows per query / streamed chunk
+GZIP_MIN_BYTES: int = int(os.getenv("GZIP_MIN_BYTES", "1024"))  # smaller responses are sent uncompressed
+
+# Reliability trends (ml_faults.py, from the monthly rollup tables)
+TRENDS_MONTHS: int = int(os.getenv("TRENDS_MONTHS", "24"))
+TRENDS_ROLLING_MONTHS: int = int(os.getenv("TRENDS_ROLLING_MONTHS", "3"))
+TRENDS_TOP_CODES: int = int(os.getenv("TRENDS_TOP_CODES", "10"))
+
+# Repeat-defect detection (recurrence.py): N occurrences on one tail within X days
+RECURRENCE_MIN_OCCURRENCES: int = int(os.getenv("RECURRENCE_MIN_OCCURRENCES", "3"))
+RECURRENCE_WINDOW_DAYS: int = int(os.getenv("RECURRENCE_WINDOW_DAYS", "15"))
+RECURRENCE_INCREMENTAL_MAX_ROWS: int = int(os.getenv("RECURRENCE_INCREMENTAL_MAX_ROWS", "20000"))  # more new rows: rebuild tenants
+RECURRENCE_PAGE_SIZE: int = int(os.getenv("RECURRENCE_PAGE_SIZE", "50"))
+RECURRENCE_REFRESH_INTERVAL_S: float = float(os.getenv("RECURRENCE_REFRESH_INTERVAL_S", "300"))  # API background refresh
+
+# Vector store behind RAGPipeline: chroma | qdrant | numpy
+VECTOR_BACKEND: str = os.getenv("VECTOR_BACKEND", "chroma")
+# Stored vector precision for the numpy backend: float16 | int8 | float32
+NUMPY_INDEX_DTYPE: str = os.getenv("NUMPY_INDEX_DTYPE", "float16")
+
 OPENAI_MODEL_CHAT: str = os.getenv("OPENAI_MODEL_CHAT", "gpt-4o-mini")
 OPENAI_MODEL_VISION: str = os.getenv("OPENAI_MODEL_VISION", "gpt-4o-mini")
 OPENAI_MODEL_STT: str = os.getenv("OPENAI_MODEL_STT", "whisper-1")
 
+# OpenAI HTTP transport (shared, pooled clients)
+OPENAI_BASE_URL: Optional[str] = os.getenv("OPENAI_BASE_URL") or None  # e.g. a local stand-in server
+OPENAI_TIMEOUT_S: float = float(os.getenv("OPENAI_TIMEOUT_S", "60"))
+OPENAI_CONNECT_TIMEOUT_S: float = float(os.getenv("OPENAI_CONNECT_TIMEOUT_S", "5"))
+OPENAI_MAX_RETRIES: int = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+OPENAI_RETRY_BACKOFF_S: float = float(os.getenv("OPENAI_RETRY_BACKOFF_S", "0.5"))
+OPENAI_RETRY_MAX_BACKOFF_S: float = float(os.getenv("OPENAI_RETRY_MAX_BACKOFF_S", "8"))
+OPENAI_MAX_CONNECTIONS: int = int(os.getenv("OPENAI_MAX_CONNECTIONS", "500"))
+OPENAI_MAX_KEEPALIVE: int = int(os.getenv("OPENAI_MAX_KEEPALIVE", "100"))
+OPENAI_KEEPALIVE_EXPIRY_S: float = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY_S", "30"))
+
+# MRO integrations HTTP layer (integrations/transport.py): one pool, bucket and breaker per provider
+INTEGRATION_STUB_URL: Optional[str] = os.getenv("INTEGRATION_STUB_URL") or None  # tools/mro_stub_server.py; enables every provider
+INTEGRATION_TIMEOUT_S: float = float(os.getenv("INTEGRATION_TIMEOUT_S", "10"))  # default per-call deadline
+INTEGRATION_CONNECT_TIMEOUT_S: float = float(os.getenv("INTEGRATION_CONNECT_TIMEOUT_S", "3"))
+INTEGRATION_MAX_CONNECTIONS: int = int(os.getenv("INTEGRATION_MAX_CONNECTIONS", "20"))
+INTEGRATION_MAX_KEEPALIVE: int = int(os.getenv("INTEGRATION_MAX_KEEPALIVE", "10"))
+INTEGRATION_KEEPALIVE_EXPIRY_S: float = float(os.getenv("INTEGRATION_KEEPALIVE_EXPIRY_S", "30"))
+INTEGRATION_RATE_PER_S: float = float(os.getenv("INTEGRATION_RATE_PER_S", "10"))  # 0 disables rate limiting
+INTEGRATION_BURST: int = int(os.getenv("INTEGRATION_BURST", "20"))
+INTEGRATION_MAX_RETRIES: int = int(os.getenv("INTEGRATION_MAX_RETRIES", "3"))
+INTEGRATION_RETRY_BACKOFF_S: float = float(os.getenv("INTEGRATION_RETRY_BACKOFF_S", "0.2"))
+INTEGRATION_RETRY_MAX_BACKOFF_S: float = float(os.getenv("INTEGRATION_RETRY_MAX_BACKOFF_S", "5"))
+INTEGRATION_BREAKER_FAILURES: int = int(os.getenv("INTEGRATION_BREAKER_FAILURES", "5"))  # consecutive failed calls
+INTEGRATION_BREAKER_RESET_S: float = float(os.getenv("INTEGRATION_BREAKER_RESET_S", "30"))
+
+# MRO mirror (mro_sync.py): background delta sync of provider defects into failures
+MRO_SYNC_COMPANIES: str = os.getenv("MRO_SYNC_COMPANIES", "")  # comma-separated company ids; empty disables
+MRO_SYNC_INTERVAL_S: float = float(os.getenv("MRO_SYNC_INTERVAL_S", "300"))
+MRO_SYNC_PAGE_SIZE: int = int(os.getenv("MRO_SYNC_PAGE_SIZE", "500"))  # defects per change-feed page / transaction
+MRO_SYNC_MAX_PAGES: int = int(os.getenv("MRO_SYNC_MAX_PAGES", "200"))  # per pair and pass; the next pass continues
+MRO_SYNC_CONCURRENCY: int = int(os.getenv("MRO_SYNC_CONCURRENCY", "4"))  # (tenant, provider) syncs in parallel
+MRO_SYNC_PAGE_TIMEOUT_S: float = float(os.getenv("MRO_SYNC_PAGE_TIMEOUT_S", "30"))
+MRO_SYNC_LEASE_S: float = float(os.getenv("MRO_SYNC_LEASE_S", "300"))  # one worker per (tenant, provider) at a time
+
 RAG_TOP_K: int = int(os.getenv("RAG_TOP_K", "5"))
 RAG_MIN_SCORE: float = float(os.getenv("RAG_MIN_SCORE", "0.3"))
 
+# Retrieval caches (query embeddings and top-k results)
+RAG_COLLECTION: str = os.getenv("RAG_COLLECTION", "aerobrain_docs")
+RAG_CACHE_MAX_ENTRIES: int = int(os.getenv("RAG_CACHE_MAX_ENTRIES", "1024"))
+RAG_CACHE_TTL_S: float = float(os.getenv("RAG_CACHE_TTL_S", "600"))
+RAG_EMBED_CACHE_MAX_ENTRIES: int = int(os.getenv("RAG_EMBED_CACHE_MAX_ENTRIES", "4096"))
+RAG_EMBED_CACHE_TTL_S: float = float(os.getenv("RAG_EMBED_CACHE_TTL_S", "3600"))
+
+# Retrieval partitioning: "shared" (one collection, tenant filter) or "tenant" (one collection per tenant)
+RAG_PARTITION_MODE: str = os.getenv("RAG_PARTITION_MODE", "shared")
+
+# Hybrid retrieval: BM25 side index fused with vector results by reciprocal rank fusion
+RAG_HYBRID_ENABLED: bool = os.getenv("RAG_HYBRID_ENABLED", "true").lower() in ("1", "true", "yes")
+RAG_HYBRID_CANDIDATES: int = int(os.getenv("RAG_HYBRID_CANDIDATES", "20"))
+RAG_RRF_K: int = int(os.getenv("RAG_RRF_K", "60"))
+
+# Re-ranking before prompting: over-fetch, metadata boosts, RAG_MIN_SCORE floor, MMR diversity
+RAG_RERANK_ENABLED: bool = os.getenv("RAG_RERANK_ENABLED", "true").lower() in ("1", "true", "yes")
+RAG_RERANK_CANDIDATES: int = int(os.getenv("RAG_RERANK_CANDIDATES", "20"))
+RAG_BOOST_ATA: float = float(os.getenv("RAG_BOOST_ATA", "0.05"))
+RAG_BOOST_AIRCRAFT: float = float(os.getenv("RAG_BOOST_AIRCRAFT", "0.05"))
+RAG_BOOST_DOC_TYPE: float = float(os.getenv("RAG_BOOST_DOC_TYPE", "0.03"))
+RAG_BOOST_LEXICAL: float = float(os.getenv("RAG_BOOST_LEXICAL", "0.15"))
+RAG_PREFERRED_DOC_TYPES: str = os.getenv("RAG_PREFERRED_DOC_TYPES", "MEL,MMEL")
+RAG_MMR_LAMBDA: float = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+RAG_DEDUP_SIMILARITY: float = float(os.getenv("RAG_DEDUP_SIMILARITY", "0.95"))
+
+# Semantic answer cache (opt-in): reuse answers to near-identical first-turn questions
+ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+ANSWER_CACHE_THRESHOLD: float = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_TTL_S: float = float(os.getenv("ANSWER_CACHE_TTL_S", "21600"))
+ANSWER_CACHE_MAX_ENTRIES: int = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+ANSWER_CACHE_MAX_PER_SCOPE: int = int(os.getenv("ANSWER_CACHE_MAX_PER_SCOPE", "256"))
+
+# Single-flight: identical first-turn questions in flight at once share one retrieval + LLM call
+SINGLEFLIGHT_ENABLED: bool = os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Admission control in front of the chat LLM calls (admission.py): global and per-tenant slots, fair queuing
+ADMISSION_MAX_CONCURRENT: int = int(os.getenv("ADMISSION_MAX_CONCURRENT", "32"))
+ADMISSION_TENANT_MAX_CONCURRENT: int = int(os.getenv("ADMISSION_TENANT_MAX_CONCURRENT", "8"))
+ADMISSION_MAX_QUEUE: int = int(os.getenv("ADMISSION_MAX_QUEUE", "200"))  # waiting turns per tenant; more are shed at once
+ADMISSION_QUEUE_TIMEOUT_S: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_S", "20"))  # longer waits are shed
+ADMISSION_TENANT_WEIGHTS: str = os.getenv("ADMISSION_TENANT_WEIGHTS", "")  # "company:weight,..."; default weight 1
+
+# Ingestion chunking
+CHUNK_MAX_TOKENS: int = int(os.getenv("CHUNK_MAX_TOKENS", "400"))
+CHUNK_OVERLAP_TOKENS: int = int(os.getenv("CHUNK_OVERLAP_TOKENS", "60"))
+CHUNK_MIN_TOKENS: int = int(os.getenv("CHUNK_MIN_TOKENS", "80"))
+INGEST_MANIFEST_DIR: str = os.getenv("INGEST_MANIFEST_DIR", "")  # empty: ingest_manifests/ next to the RAG stores
+INGEST_WORKERS: int = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 2)))
+EMBED_BATCH_SIZE: int = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_CONCURRENCY: int = int(os.getenv("EMBED_CONCURRENCY", "2"))
+
+# Prompt assembly (token budgets, counted with tiktoken)
+PROMPT_TOKEN_BUDGET: int = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+PROMPT_HISTORY_MAX_TOKENS: int = int(os.getenv("PROMPT_HISTORY_MAX_TOKENS", "1500"))
+PROMPT_RECENT_TURNS: int = int(os.getenv("PROMPT_RECENT_TURNS", "8"))
+PROMPT_SUMMARY_MAX_TOKENS: int = int(os.getenv("PROMPT_SUMMARY_MAX_TOKENS", "300"))
+PROMPT_DOCS_MAX_TOKENS: int = int(os.getenv("PROMPT_DOCS_MAX_TOKENS", "3000"))
+PROMPT_DOC_MIN_TOKENS: int = int(os.getenv("PROMPT_DOC_MIN_TOKENS", "80"))
+
+# Chat agent fault history: failures DB lookups for codes / tails / ATA named in the question
+AGENT_FAULT_HISTORY_ENABLED: bool = os.getenv("AGENT_FAULT_HISTORY_ENABLED", "true").lower() in ("1", "true", "yes")
+AGENT_FAULT_HISTORY_ROWS: int = int(os.getenv("AGENT_FAULT_HISTORY_ROWS", "5"))  # most recent matching records
+AGENT_FAULT_HISTORY_ACTIONS: int = int(os.getenv("AGENT_FAULT_HISTORY_ACTIONS", "3"))  # top corrective actions per code
+AGENT_FAULT_HISTORY_MAX_TOKENS: int = int(os.getenv("AGENT_FAULT_HISTORY_MAX_TOKENS", "600"))  # taken from the documents budget
+AGENT_HISTORY_ONLY: str = os.getenv("AGENT_HISTORY_ONLY", "exact")  # off | exact (question is only codes/tails/ATA) | always
+
+# Chat agent context gathering: RAG, failures lookup and live integrations run concurrently
+AGENT_CONTEXT_DEADLINE_S: float = float(os.getenv("AGENT_CONTEXT_DEADLINE_S", "4.0"))  # sources still running are skipped
+AGENT_CONTEXT_WORKERS: int = int(os.getenv("AGENT_CONTEXT_WORKERS", "8"))  # thread pool of the synchronous ask()
+# Live provider lookups for fault-history questions of tenants not mirrored by mro_sync.py
+AGENT_LIVE_INTEGRATIONS: bool = os.getenv("AGENT_LIVE_INTEGRATIONS", "true").lower() in ("1", "true", "yes")
+AGENT_INTEGRATION_MAX_ROWS: int = int(os.getenv("AGENT_INTEGRATION_MAX_ROWS", "5"))  # defects read per provider
+
+# Conversation store (AgentManager)
+SESSION_MAX_CONVERSATIONS: int = int(os.getenv("SESSION_MAX_CONVERSATIONS", "10000"))
+SESSION_IDLE_TTL_S: float = float(os.getenv("SESSION_IDLE_TTL_S", "3600"))
+SESSION_MEMORY_BUDGET_MB: float = float(os.getenv("SESSION_MEMORY_BUDGET_MB", "256"))
+CONVERSATION_MAX_MESSAGES: int = int(os.getenv("CONVERSATION_MAX_MESSAGES", "20"))
+SESSION_BACKEND: str = os.getenv("SESSION_BACKEND", "memory")  # memory | sqlite
+SESSION_SQLITE_PATH: str = os.getenv("SESSION_SQLITE_PATH", "data/sessions.db")
+SESSION_RETENTION_S: float = float(os.getenv("SESSION_RETENTION_S", str(7 * 24 * 3600)))
+SESSION_SWEEP_INTERVAL_S: float = float(os.getenv("SESSION_SWEEP_INTERVAL_S", "300"))
+
 SAFETY_DISCLAIMER: str = (
     "This information is advisory only. Always verify with OEM manuals, MMEL/MEL, AMM, SRM, "
     "and approved organisational procedures before performing or certifying any work."
@@ -0,0 +1,258 @@
+"""Token-budgeted prompt assembly for AeroAgent.
+
+The prompt is built from five sections that compete for one budget:
+
+1. the system prompt and the current question (always sent in full),
+2. recent conversation turns, sent verbatim newest-first while they fit,
+3. a rolling summary of older turns, extended incrementally and cached on the agent,
+4. the tenant's own history for fault codes / tails named in the question, one line per item,
+5. retrieved documents, which share what is left in proportion to their relevance score.
+
+Token counts come from ``tiktoken`` for the configured chat model. If the
+encoding cannot be loaded (e.g. no network to fetch the BPE file), a
+characters/4 estimate is used so the budget still holds approximately.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import re
+
+import config
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken is in requirements.txt
+    tiktoken = None
+
+
+# Per-message framing tokens added by the chat format.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+_encoding_failed = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is not None or _encoding_failed:
+        return _encoding
+    try:
+        try:
+            _encoding = tiktoken.encoding_for_model(config.OPENAI_MODEL_CHAT)
+        except KeyError:
+            _encoding = tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        _encoding_failed = True
+        print(f"[CONTEXT] tiktoken unavailable, estimating tokens from length: {e}")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    enc = _get_encoding()
+    if enc is None:
+        return (len(text) + 3) // 4
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if max_tokens <= 0 or not text:
+        return ""
+    enc = _get_encoding()
+    if enc is None:
+        return text[: max_tokens * 4]
+    tokens = enc.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return enc.decode(tokens[:max_tokens])
+
+
+def token_windows(text: str, size: int, step: int) -> List[str]:
+    """``text`` cut into windows of ``size`` tokens starting every ``step`` tokens; the last may be shorter."""
+    if step <= 0:
+        raise ValueError(f"token_windows needs a positive step, got {step}")
+    enc = _get_encoding()
+    if enc is None:
+        tokens: Any = [text[i:i + 4] for i in range(0, len(text), 4)]  # the characters/4 estimate
+        decode = "".join
+    else:
+        tokens = enc.encode(text, disallowed_special=())
+        decode = enc.decode
+    windows = []
+    for start in range(0, len(tokens), step):
+        windows.append(decode(tokens[start:start + size]))
+        if start + size >= len(tokens):
+            break
+    return windows
+
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def _gist(text: str, max_words: int) -> str:
+    """First sentence of a turn, capped at ``max_words`` words."""
+    text = " ".join((text or "").split())
+    first = _SENTENCE_END.split(text, maxsplit=1)[0]
+    words = first.split()
+    return " ".join(words[:max_words]) + (" ..." if len(words) > max_words else "")
+
+
+def extend_summary(summary: str, turns: List[Tuple[str, str]], max_tokens: int) -> str:
+    """Fold ``turns`` into ``summary`` and keep only the most recent lines that fit."""
+    lines = summary.splitlines() if summary else []
+    for role, content in turns:
+        if role == "user":
+            lines.append(f"Q: {_gist(content, 30)}")
+        else:
+            lines.append(f"A: {_gist(content, 40)}")
+    while lines and count_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def allocate_documents(docs: List[Dict[str, Any]], budget: int) -> Tuple[str, Dict[str, int]]:
+    """Render documents into at most ``budget`` tokens, sharing it by relevance score.
+
+    Documents are visited best-first. Each gets a share of the remaining budget
+    proportional to its score (but never less than ``PROMPT_DOC_MIN_TOKENS``);
+    space a short document does not use flows to the next ones.
+    """
+    ranked = sorted(docs, key=lambda d: float(d.get("score", 0.0)), reverse=True)
+    remaining = max(0, budget - count_tokens("\n\nRELEVANT DOCUMENTS FROM KNOWLEDGE BASE:\n"))
+    remaining_score = sum(max(float(d.get("score", 0.0)), 0.01) for d in ranked)
+    parts = []
+    included = truncated = 0
+    for doc in ranked:
+        score = max(float(doc.get("score", 0.0)), 0.01)
+        header = f"\n[Doc {len(parts) + 1}] {doc.get('doc_title', 'Unknown')}:\n"
+        header_tokens = count_tokens(header)
+        share = int(remaining * score / remaining_score) if remaining_score else 0
+        remaining_score -= score
+        content = doc.get("content", "")
+        content_tokens = count_tokens(content)
+        allowance = min(content_tokens, max(share, config.PROMPT_DOC_MIN_TOKENS), remaining - header_tokens)
+        if allowance < min(content_tokens, config.PROMPT_DOC_MIN_TOKENS):
+            continue
+        if allowance < content_tokens:
+            content = truncate_to_tokens(content, allowance)
+            truncated += 1
+        parts.append(header + content + "\n")
+        remaining -= header_tokens + allowance
+        included += 1
+    if not parts:
+        return "", {"documents": 0, "docs_included": 0, "docs_truncated": 0}
+    text = "\n\nRELEVANT DOCUMENTS FROM KNOWLEDGE BASE:\n" + "".join(parts)
+    return text, {"documents": count_tokens(text), "docs_included": included, "docs_truncated": truncated}
+
+
+def fault_history_lines(fault_history: Dict[str, Any]) -> List[str]:
+    """One line per known fault code (top corrective actions), then one per recent record."""
+    lines = []
+    for code in fault_history["fault_codes"]:
+        line = f"{code['fault_code']}: {code['occurrences']} prior occurrences, last {code['last_date'] or 'undated'}"
+        if code["actions"]:
+            line += ". Corrective actions: " + "; ".join(
+                f"{_gist(a['corrective_action'], 12)} ({a['count']}x)" for a in code["actions"]
+            )
+        lines.append(line)
+    for record in fault_history["registros"]:
+        where = " ".join(filter(None, [
+            record["tail"] or record["aircraft"],
+            f"ATA {record['ata']}" if record["ata"] else "",
+            record["fault_code"],
+        ]))
+        # Records read live from a provider (not in the tenant's database yet) name it.
+        origin = f"[{record['live']}] " if record.get("live") else ""
+        line = f"- {origin}{record['occurrence_date'] or 'undated'} {where}: {_gist(record['description'], 20)}"
+        if record["corrective_action"]:
+            line += f" -> {_gist(record['corrective_action'], 20)}"
+        lines.append(line)
+    return lines
+
+
+def render_fault_history(fault_history: Optional[Dict[str, Any]], budget: int) -> Tuple[str, int]:
+    """Compact fault history lines that fit in ``budget`` tokens, and their token count."""
+    header = "\n\nTENANT FAULT HISTORY (own maintenance records, newest first):\n"
+    if not fault_history or budget <= 0:
+        return "", 0
+    lines = []
+    used = count_tokens(header)
+    for line in fault_history_lines(fault_history):
+        cost = count_tokens(line + "\n")
+        if used + cost > budget:
+            break
+        lines.append(line)
+        used += cost
+    if not lines:
+        return "", 0
+    return header + "\n".join(lines) + "\n", used
+
+
+def build_messages(
+    system_prompt: str,
+    history: List[Tuple[str, str]],
+    summary: str,
+    user_message: str,
+    docs: List[Dict[str, Any]],
+    budget: Optional[int] = None,
+    fault_history: Optional[Dict[str, Any]] = None,
+) -> Tuple[List[Dict[str, str]], str, int, Dict[str, int]]:
+    """Assemble chat messages within ``budget`` tokens.
+
+    ``history`` holds the turns not yet summarized (oldest first) and
+    ``summary`` the cached summary of everything before them. Returns
+    ``(messages, summary, n_folded, report)``: the updated summary now also
+    covers the ``n_folded`` oldest ``history`` turns that did not fit verbatim,
+    so the caller should cache it and skip those turns next time.
+    """
+    budget = budget or config.PROMPT_TOKEN_BUDGET
+    system_tokens = count_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS
+    question_tokens = count_tokens(user_message) + MESSAGE_OVERHEAD_TOKENS
+    remaining = budget - system_tokens - question_tokens
+
+    # Recent turns verbatim, newest first, within the history allowance.
+    history_budget = min(config.PROMPT_HISTORY_MAX_TOKENS, max(0, remaining // 2))
+    kept: List[Tuple[str, str]] = []
+    history_tokens = 0
+    for role, content in reversed(history[-config.PROMPT_RECENT_TURNS:] if config.PROMPT_RECENT_TURNS > 0 else []):
+        cost = count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+        if history_tokens + cost > history_budget:
+            break
+        kept.append((role, content))
+        history_tokens += cost
+    kept.reverse()
+    n_folded = len(history) - len(kept)
+
+    summary = extend_summary(summary, history[:n_folded], config.PROMPT_SUMMARY_MAX_TOKENS) if n_folded else summary
+    summary_message = f"CONVERSATION SUMMARY (earlier turns):\n{summary}" if summary else ""
+    summary_tokens = count_tokens(summary_message) + MESSAGE_OVERHEAD_TOKENS if summary_message else 0
+
+    # Tenant fault history is short and specific to the question: it goes before documents.
+    fault_context, fault_tokens = render_fault_history(
+        fault_history, min(config.AGENT_FAULT_HISTORY_MAX_TOKENS, remaining - history_tokens - summary_tokens)
+    )
+    doc_budget = min(
+        config.PROMPT_DOCS_MAX_TOKENS - fault_tokens, remaining - history_tokens - summary_tokens - fault_tokens
+    )
+    rag_context, doc_report = allocate_documents(docs, doc_budget)
+
+    messages = [{"role": "system", "content": system_prompt}]
+    if summary_message:
+        messages.append({"role": "system", "content": summary_message})
+    messages.extend({"role": role, "content": content} for role, content in kept)
+    messages.append({"role": "user", "content": user_message + fault_context + rag_context})
+
+    report = {
+        "system": system_tokens,
+        "summary": summary_tokens,
+        "history": history_tokens,
+        "question": question_tokens,
+        "fault_history": fault_tokens,
+        **doc_report,
+        "turns_verbatim": len(kept),
+        "turns_summarized": n_folded,
+        "budget": budget,
+    }
+    report["total"] = (
+        system_tokens + summary_tokens + history_tokens + question_tokens + fault_tokens + doc_report["documents"]
+    )
+    return messages, summary, n_folded, report
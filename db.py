@@ -0,0 +1,399 @@
+"""Shared access layer for the failures database (SQLite).
+
+One process-wide pool of WAL-mode connections with tuned pragmas replaces the
+per-request ``sqlite3.connect`` calls. The schema is versioned with
+``PRAGMA user_version``: ``init_db()`` applies the pending entries of
+``MIGRATIONS`` once at startup (the pool also runs it on first use, for
+scripts). Each migration re-checks the version under the write lock, so two
+workers starting at the same time apply it once.
+"""
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import config
+
+
+# (version, script). Append only; never edit an entry that has shipped.
+MIGRATIONS: List[Tuple[int, str]] = [
+    (1, """
+        CREATE TABLE IF NOT EXISTS failures (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            company_id INTEGER,
+            aircraft TEXT,
+            ata TEXT,
+            fault_code TEXT,
+            description TEXT,
+            corrective_action TEXT,
+            failure_type TEXT,
+            occurrence_date TEXT,
+            reliability_rate REAL
+        );
+    """),
+    (2, """
+        -- Full filter (aircraft + ATA + fault code) and its prefixes, already in date order.
+        CREATE INDEX IF NOT EXISTS idx_failures_company_aircraft_ata_code_date
+            ON failures (company_id, aircraft, ata, fault_code, occurrence_date);
+        -- Filters that skip a leading column of the composite index.
+        CREATE INDEX IF NOT EXISTS idx_failures_company_date ON failures (company_id, occurrence_date);
+        CREATE INDEX IF NOT EXISTS idx_failures_company_ata_date ON failures (company_id, ata, occurrence_date);
+        CREATE INDEX IF NOT EXISTS idx_failures_company_code_date ON failures (company_id, fault_code, occurrence_date);
+        ANALYZE failures;
+    """),
+    (3, """
+        -- Bulk imports (failures_import.py): tail number, originating export and dedupe key.
+        ALTER TABLE failures ADD COLUMN tail TEXT;
+        ALTER TABLE failures ADD COLUMN source TEXT;
+        ALTER TABLE failures ADD COLUMN natural_key TEXT;
+        -- Existing rows keep their values as entered; the importer canonicalizes the rows it writes.
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_failures_natural_key ON failures (company_id, natural_key);
+        -- One row per imported file: resume point and totals.
+        CREATE TABLE IF NOT EXISTS failure_imports (
+            company_id INTEGER NOT NULL,
+            source TEXT NOT NULL,
+            signature TEXT NOT NULL,
+            rows_done INTEGER NOT NULL DEFAULT 0,
+            inserted INTEGER NOT NULL DEFAULT 0,
+            duplicates INTEGER NOT NULL DEFAULT 0,
+            rejected INTEGER NOT NULL DEFAULT 0,
+            started_at TEXT,
+            finished_at TEXT,
+            PRIMARY KEY (company_id, source)
+        );
+    """),
+    (4, """
+        -- Monthly failure counts per tenant x aircraft x ATA (and fault code), kept
+        -- current by triggers so trends read O(buckets) rows instead of the history.
+        CREATE TABLE IF NOT EXISTS failure_rollup_monthly (
+            company_id INTEGER NOT NULL,
+            aircraft TEXT NOT NULL,
+            ata TEXT NOT NULL,
+            month TEXT NOT NULL,
+            failures INTEGER NOT NULL,
+            PRIMARY KEY (company_id, aircraft, ata, month)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS failure_rollup_code_monthly (
+            company_id INTEGER NOT NULL,
+            aircraft TEXT NOT NULL,
+            ata TEXT NOT NULL,
+            fault_code TEXT NOT NULL,
+            month TEXT NOT NULL,
+            failures INTEGER NOT NULL,
+            -- Month first: fault codes have high cardinality, trends only read a window.
+            PRIMARY KEY (company_id, month, aircraft, ata, fault_code)
+        ) WITHOUT ROWID;
+        INSERT INTO failure_rollup_monthly
+            SELECT company_id, COALESCE(aircraft, ''), COALESCE(ata, ''), COALESCE(substr(occurrence_date, 1, 7), ''), COUNT(*)
+            FROM failures WHERE company_id IS NOT NULL GROUP BY 1, 2, 3, 4;
+        INSERT INTO failure_rollup_code_monthly (company_id, aircraft, ata, fault_code, month, failures)
+            SELECT company_id, COALESCE(aircraft, ''), COALESCE(ata, ''), COALESCE(fault_code, ''),
+                   COALESCE(substr(occurrence_date, 1, 7), ''), COUNT(*)
+            FROM failures WHERE company_id IS NOT NULL GROUP BY 1, 2, 3, 4, 5;
+        CREATE TRIGGER IF NOT EXISTS failures_rollup_insert AFTER INSERT ON failures
+        WHEN NEW.company_id IS NOT NULL
+        BEGIN
+            INSERT INTO failure_rollup_monthly VALUES (
+                NEW.company_id, COALESCE(NEW.aircraft, ''), COALESCE(NEW.ata, ''),
+                COALESCE(substr(NEW.occurrence_date, 1, 7), ''), 1
+            ) ON CONFLICT DO UPDATE SET failures = failures + 1;
+            INSERT INTO failure_rollup_code_monthly (company_id, aircraft, ata, fault_code, month, failures) VALUES (
+                NEW.company_id, COALESCE(NEW.aircraft, ''), COALESCE(NEW.ata, ''), COALESCE(NEW.fault_code, ''),
+                COALESCE(substr(NEW.occurrence_date, 1, 7), ''), 1
+            ) ON CONFLICT DO UPDATE SET failures = failures + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS failures_rollup_delete AFTER DELETE ON failures
+        WHEN OLD.company_id IS NOT NULL
+        BEGIN
+            UPDATE failure_rollup_monthly SET failures = failures - 1
+            WHERE company_id = OLD.company_id AND aircraft = COALESCE(OLD.aircraft, '') AND ata = COALESCE(OLD.ata, '')
+                AND month = COALESCE(substr(OLD.occurrence_date, 1, 7), '');
+            UPDATE failure_rollup_code_monthly SET failures = failures - 1
+            WHERE company_id = OLD.company_id AND aircraft = COALESCE(OLD.aircraft, '') AND ata = COALESCE(OLD.ata, '')
+                AND fault_code = COALESCE(OLD.fault_code, '') AND month = COALESCE(substr(OLD.occurrence_date, 1, 7), '');
+        END;
+        CREATE TRIGGER IF NOT EXISTS failures_rollup_update
+        AFTER UPDATE OF company_id, aircraft, ata, fault_code, occurrence_date ON failures
+        BEGIN
+            UPDATE failure_rollup_monthly SET failures = failures - 1
+            WHERE OLD.company_id IS NOT NULL
+                AND company_id = OLD.company_id AND aircraft = COALESCE(OLD.aircraft, '') AND ata = COALESCE(OLD.ata, '')
+                AND month = COALESCE(substr(OLD.occurrence_date, 1, 7), '');
+            UPDATE failure_rollup_code_monthly SET failures = failures - 1
+            WHERE OLD.company_id IS NOT NULL
+                AND company_id = OLD.company_id AND aircraft = COALESCE(OLD.aircraft, '') AND ata = COALESCE(OLD.ata, '')
+                AND fault_code = COALESCE(OLD.fault_code, '') AND month = COALESCE(substr(OLD.occurrence_date, 1, 7), '');
+            INSERT INTO failure_rollup_monthly
+                SELECT NEW.company_id, COALESCE(NEW.aircraft, ''), COALESCE(NEW.ata, ''),
+                       COALESCE(substr(NEW.occurrence_date, 1, 7), ''), 1
+                WHERE NEW.company_id IS NOT NULL
+                ON CONFLICT DO UPDATE SET failures = failures + 1;
+            INSERT INTO failure_rollup_code_monthly (company_id, aircraft, ata, fault_code, month, failures)
+                SELECT NEW.company_id, COALESCE(NEW.aircraft, ''), COALESCE(NEW.ata, ''), COALESCE(NEW.fault_code, ''),
+                       COALESCE(substr(NEW.occurrence_date, 1, 7), ''), 1
+                WHERE NEW.company_id IS NOT NULL
+                ON CONFLICT DO UPDATE SET failures = failures + 1;
+        END;
+    """),
+    (5, """
+        -- Repeat defects (recurrence.py): one row per failure that closes a window of
+        -- RECURRENCE_MIN_OCCURRENCES on the same unit and ATA chapter / fault code.
+        CREATE TABLE IF NOT EXISTS failure_recurrences (
+            failure_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            company_id INTEGER NOT NULL,
+            unit TEXT NOT NULL,
+            aircraft TEXT NOT NULL,
+            ata TEXT NOT NULL,
+            code TEXT NOT NULL,
+            occurrence_date TEXT NOT NULL,
+            window_count INTEGER NOT NULL,
+            PRIMARY KEY (failure_id, kind)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_failure_recurrences_key
+            ON failure_recurrences (company_id, kind, unit, code, occurrence_date);
+        CREATE INDEX IF NOT EXISTS idx_failure_recurrences_date ON failure_recurrences (company_id, occurrence_date);
+        -- Incremental refresh watermark; params = "<occurrences>/<days>" the flags were computed with.
+        CREATE TABLE IF NOT EXISTS recurrence_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            last_failure_id INTEGER NOT NULL,
+            params TEXT NOT NULL
+        );
+        -- Tenants whose flags an edit or delete of failures invalidated; the next refresh rebuilds
+        -- just those tenants.
+        CREATE TABLE IF NOT EXISTS recurrence_dirty (
+            company_id INTEGER PRIMARY KEY
+        );
+        CREATE TRIGGER IF NOT EXISTS failures_recurrence_delete AFTER DELETE ON failures
+        WHEN OLD.company_id IS NOT NULL
+        BEGIN
+            INSERT OR IGNORE INTO recurrence_dirty (company_id) VALUES (OLD.company_id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS failures_recurrence_update
+        AFTER UPDATE OF company_id, aircraft, tail, ata, fault_code, occurrence_date ON failures
+        WHEN OLD.company_id IS NOT NEW.company_id OR OLD.aircraft IS NOT NEW.aircraft OR OLD.tail IS NOT NEW.tail
+            OR OLD.ata IS NOT NEW.ata OR OLD.fault_code IS NOT NEW.fault_code
+            OR OLD.occurrence_date IS NOT NEW.occurrence_date
+        BEGIN
+            INSERT OR IGNORE INTO recurrence_dirty (company_id) SELECT OLD.company_id WHERE OLD.company_id IS NOT NULL;
+            INSERT OR IGNORE INTO recurrence_dirty (company_id) SELECT NEW.company_id WHERE NEW.company_id IS NOT NULL;
+        END;
+    """),
+    (6, """
+        -- Tail-number lookups (chat agent fault history, tail filters).
+        CREATE INDEX IF NOT EXISTS idx_failures_company_tail_date ON failures (company_id, tail, occurrence_date);
+        ANALYZE failures;
+    """),
+    (7, """
+        -- MRO provider mirror (mro_sync.py): change-feed position and counters per tenant and provider.
+        CREATE TABLE IF NOT EXISTS mro_sync_state (
+            company_id INTEGER NOT NULL,
+            provider TEXT NOT NULL,
+            cursor TEXT,
+            mode TEXT NOT NULL DEFAULT 'delta',
+            rows_local INTEGER NOT NULL DEFAULT 0,
+            rows_inserted INTEGER NOT NULL DEFAULT 0,
+            rows_updated INTEGER NOT NULL DEFAULT 0,
+            rows_deleted INTEGER NOT NULL DEFAULT 0,
+            rows_last_run INTEGER NOT NULL DEFAULT 0,
+            last_attempt_at TEXT,
+            last_success_at TEXT,
+            last_error TEXT,
+            lease_until REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (company_id, provider)
+        );
+        -- Natural keys seen by an in-progress full resync; the rest are deleted when it completes.
+        CREATE TABLE IF NOT EXISTS mro_sync_seen (
+            company_id INTEGER NOT NULL,
+            provider TEXT NOT NULL,
+            natural_key TEXT NOT NULL,
+            PRIMARY KEY (company_id, provider, natural_key)
+        ) WITHOUT ROWID;
+    """),
+]
+
+
+def _configure(conn: sqlite3.Connection) -> None:
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(config.DB_BUSY_TIMEOUT_MS)}")
+    conn.execute(f"PRAGMA cache_size={-int(config.DB_CACHE_MB) * 1024}")
+    conn.execute(f"PRAGMA mmap_size={int(config.DB_MMAP_MB) * 1024 * 1024}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+
+def _statements(script: str) -> Iterator[str]:
+    pending = ""
+    for line in script.splitlines(keepends=True):
+        pending += line
+        if sqlite3.complete_statement(pending):
+            yield pending
+            pending = ""
+
+
+def migration_statements(version: int, prefix: str) -> List[str]:
+    """Statements of migration ``version`` that start with ``prefix`` (comments removed)."""
+    found = []
+    for statement in _statements(dict(MIGRATIONS)[version]):
+        body = "\n".join(line for line in statement.splitlines() if not line.strip().startswith("--")).strip()
+        if body.startswith(prefix):
+            found.append(body)
+    return found
+
+
+def drop_rollup_triggers(conn: sqlite3.Connection) -> None:
+    """Stop maintaining the monthly rollups (bulk loads); ``rebuild_rollups`` restores them."""
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'failures_rollup_%'").fetchall():
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.commit()
+
+
+def rebuild_rollups(conn: sqlite3.Connection) -> None:
+    """Recompute the monthly rollups from ``failures`` and re-create their triggers, in one transaction."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM failure_rollup_monthly")
+        conn.execute("DELETE FROM failure_rollup_code_monthly")
+        for statement in migration_statements(4, "INSERT INTO failure_rollup") + migration_statements(4, "CREATE TRIGGER"):
+            conn.execute(statement)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def ensure_rollups(conn: sqlite3.Connection) -> None:
+    """Rebuild the rollups if their triggers are missing (a bulk import that did not finish)."""
+    (present,) = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'failures_rollup_%'"
+    ).fetchone()
+    if present < len(migration_statements(4, "CREATE TRIGGER")):
+        print("[DB] Failure rollup triggers missing; rebuilding the monthly rollups")
+        rebuild_rollups(conn)
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply pending migrations; return the resulting schema version."""
+    for version, script in MIGRATIONS:
+        if version <= conn.execute("PRAGMA user_version").fetchone()[0]:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another worker may have applied it while we waited for the lock.
+            if conn.execute("PRAGMA user_version").fetchone()[0] < version:
+                for statement in _statements(script):
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {version}")
+                print(f"[DB] Migrated {config.SQLITE_PATH} to schema version {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections shared across threads."""
+
+    def __init__(self, path: str, size: int) -> None:
+        self.path = path
+        self.size = max(1, size)
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self.waits = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=config.DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        _configure(conn)
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        self.waits += 1
+        try:
+            return self._idle.get(timeout=config.DB_POOL_TIMEOUT_S)
+        except queue.Empty:
+            raise TimeoutError(f"No database connection free after {config.DB_POOL_TIMEOUT_S}s") from None
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self) -> None:
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.execute("PRAGMA optimize")
+            finally:
+                conn.close()
+            with self._lock:
+                self._created -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": self.size, "open": self._created, "idle": self._idle.qsize(), "waits": self.waits}
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def init_db() -> ConnectionPool:
+    """Create the pool and bring the schema up to date (idempotent)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = ConnectionPool(config.SQLITE_PATH, config.DB_POOL_SIZE)
+                with pool.connection() as conn:
+                    migrate(conn)
+                    ensure_rollups(conn)
+                _pool = pool
+    return _pool
+
+
+@contextmanager
+def connection() -> Iterator[sqlite3.Connection]:
+    """Borrow a pooled connection (``sqlite3.Row`` rows); commit writes explicitly."""
+    with init_db().connection() as conn:
+        yield conn
+
+
+def close_db() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def stats() -> Dict[str, Any]:
+    return _pool.stats() if _pool is not None else {}
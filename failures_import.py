@@ -0,0 +1,441 @@
+"""Bulk import of defect / reliability exports into the failures table.
+
+    python failures_import.py defects_2024.csv --company 3
+    python failures_import.py techlog.jsonl.gz --company 3 --source AMOS
+    python failures_import.py export.parquet --company 3
+
+Records are streamed (CSV, JSON lines, either optionally gzipped, or Parquet
+record batches), normalized (aircraft, ATA chapter, ISO date) and written with
+chunked ``executemany`` inside transactions of ``FAILURES_IMPORT_COMMIT_ROWS``
+rows, so memory stays flat whatever the file size. Every record gets a natural
+key: the export's own record id, namespaced by ``source``, when it has one
+(give successive exports of one system the same ``--source``), otherwise a hash
+of tail (or aircraft), ATA, fault code, date and description. The unique index
+on ``(company_id, natural_key)`` turns re-imports and overlapping exports into
+no-ops. Progress is checkpointed in ``failure_imports`` in the same transaction
+as the rows, so an interrupted import resumes where it stopped.
+
+``--bulk`` (initial loads) drops the search indexes and the monthly rollup
+triggers for the duration of the import and rebuilds both at the end, which is
+about twice as fast as maintaining them row by row; searches scan the table and
+trends lag meanwhile. Every import (and ``db.init_db``) repairs missing indexes
+and rollups before it starts, so a bulk run that was killed leaves nothing
+behind once it is resumed.
+"""
+import argparse
+import csv
+import gzip
+import hashlib
+import itertools
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+import config
+import db
+import recurrence
+from aviation_codes import normalize_aircraft, normalize_ata
+
+FORMATS = ("csv", "jsonl", "parquet")
+
+# Column names seen in MRO / tech-log exports, per failures field (compared lowercase, snake_case).
+COLUMN_ALIASES: Dict[str, Tuple[str, ...]] = {
+    "aircraft": ("aircraft", "aircraft_model", "aircraft_type", "ac_type", "a_c_type", "ac_model", "fleet"),
+    "tail": ("tail", "tail_number", "tail_no", "registration", "reg", "ac_reg", "a_c_reg"),
+    "ata": ("ata", "ata_chapter", "ata_code", "chapter"),
+    "fault_code": ("fault_code", "code", "fault", "defect_code", "ecam", "cas", "pfr_code"),
+    "description": ("description", "defect", "defect_description", "discrepancy", "finding", "text"),
+    "corrective_action": ("corrective_action", "action", "action_taken", "rectification", "resolution"),
+    "failure_type": ("failure_type", "category", "defect_type"),
+    "occurrence_date": ("occurrence_date", "date", "defect_date", "event_date", "reported_at", "reported_date"),
+    "reliability_rate": ("reliability_rate", "rate"),
+    "record_id": ("record_id", "defect_id", "techlog_id", "id", "reference", "ref"),
+}
+_ALIASES = {alias: field for field, aliases in COLUMN_ALIASES.items() for alias in aliases}
+
+_INSERT_SQL = """
+    INSERT INTO failures (
+        company_id, aircraft, tail, ata, fault_code, description, corrective_action,
+        failure_type, occurrence_date, reliability_rate, source, natural_key
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (company_id, natural_key) DO NOTHING
+"""
+
+
+def _search_index_sql() -> List[str]:
+    """``CREATE INDEX IF NOT EXISTS`` statements of the failures search indexes."""
+    return db.migration_statements(2, "CREATE INDEX") + db.migration_statements(6, "CREATE INDEX")
+
+
+def _drop_search_indexes(conn) -> None:
+    for statement in _search_index_sql():
+        name = re.search(r"IF NOT EXISTS (\w+)", statement).group(1)
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    conn.commit()
+
+
+def _create_search_indexes(conn) -> None:
+    for statement in _search_index_sql():
+        conn.execute(statement)
+    conn.commit()
+
+
+@lru_cache(maxsize=1024)
+def _field(column: str) -> Optional[str]:
+    return _ALIASES.get(re.sub(r"[^a-z0-9]+", "_", str(column).strip().lower()).strip("_"))
+
+
+def detect_format(filename: str) -> str:
+    name = filename.lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    ext = os.path.splitext(name)[1]
+    if ext in (".csv", ".tsv", ".txt"):
+        return "csv"
+    if ext in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    if ext in (".parquet", ".pq"):
+        return "parquet"
+    raise ValueError(f"Cannot tell the format of {filename!r}; expected one of {', '.join(FORMATS)}")
+
+
+def file_signature(path: str) -> str:
+    """Size plus a hash of the first MiB: cheap, and changes when the export is replaced."""
+    with open(path, "rb") as f:
+        head = f.read(1 << 20)
+    return f"{os.path.getsize(path)}:{hashlib.blake2b(head, digest_size=16).hexdigest()}"
+
+
+def _open_text(path: str):
+    if path.lower().endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8-sig", newline="")
+    return open(path, "r", encoding="utf-8-sig", newline="")
+
+
+def _read_csv(path: str) -> Iterator[Dict[str, Any]]:
+    with _open_text(path) as f:
+        sample = f.read(64 * 1024)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.DictReader(f, dialect=dialect)
+
+
+def _read_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    with _open_text(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def _read_parquet(path: str) -> Iterator[Dict[str, Any]]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet import needs pyarrow (pip install pyarrow)") from None
+    parquet = pq.ParquetFile(path)
+    for batch in parquet.iter_batches(batch_size=config.FAILURES_IMPORT_CHUNK_ROWS):
+        yield from batch.to_pylist()
+
+
+def read_records(path: str, fmt: str) -> Iterator[Dict[str, Any]]:
+    readers: Dict[str, Callable[[str], Iterator[Dict[str, Any]]]] = {
+        "csv": _read_csv,
+        "jsonl": _read_jsonl,
+        "parquet": _read_parquet,
+    }
+    if fmt not in readers:
+        raise ValueError(f"Unsupported format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    return readers[fmt](path)
+
+
+def _date_formats() -> Tuple[str, ...]:
+    numeric = ("%d/%m/%Y", "%d.%m.%Y", "%d-%m-%Y", "%d/%m/%y")
+    if not config.FAILURES_IMPORT_DAY_FIRST:
+        numeric = tuple(f.replace("%d", "#").replace("%m", "%d").replace("#", "%m") for f in numeric)
+    return numeric + ("%d-%b-%Y", "%d %b %Y", "%d%b%Y", "%Y/%m/%d", "%b %d, %Y")
+
+
+@lru_cache(maxsize=8192)
+def _parse_date_text(text: str) -> str:
+    try:
+        return date.fromisoformat(text[:10]).isoformat()
+    except ValueError:
+        pass
+    for candidate in (text, text.split(" ")[0]):
+        for fmt in _date_formats():
+            try:
+                return datetime.strptime(candidate, fmt).date().isoformat()
+            except ValueError:
+                continue
+    raise ValueError(text)
+
+
+def parse_date(value: Any) -> str:
+    """ISO ``YYYY-MM-DD`` for a date, datetime or date string; "" if empty."""
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    text = str(value).strip()
+    return _parse_date_text(text) if text else ""
+
+
+def _text(value: Any) -> str:
+    return "" if value is None else str(value).strip()
+
+
+def _rate(value: Any) -> Optional[float]:
+    try:
+        return float(value) if _text(value) else None
+    except ValueError:
+        return None
+
+
+def natural_key(
+    source: str, record_id: str, tail: str, ata: str, fault_code: str, occurrence_date: str, description: str
+) -> str:
+    if record_id:
+        # Record ids are only unique within one export system: two exports numbering rows 1..N must not collide.
+        parts = ("id", source, record_id)
+    else:
+        parts = ("row", tail, ata, fault_code, occurrence_date, " ".join(description.lower().split()))
+    return hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def normalize_record(raw: Dict[str, Any], company_id: int, source: str) -> Tuple[Optional[tuple], str]:
+    """Map one export record to a failures row; ``(None, reason)`` if it is rejected."""
+    fields: Dict[str, Any] = {}
+    for column, value in raw.items():
+        name = _field(column)
+        if name and name not in fields:
+            fields[name] = value
+
+    fault_code = _text(fields.get("fault_code")).upper()
+    description = _text(fields.get("description"))
+    if not fault_code and not description:
+        return None, "no_code_or_description"
+    try:
+        occurrence_date = parse_date(fields.get("occurrence_date"))
+    except ValueError:
+        return None, "bad_date"
+    if not occurrence_date:
+        return None, "no_date"
+
+    aircraft = normalize_aircraft(_text(fields.get("aircraft")))
+    tail = re.sub(r"\s", "", _text(fields.get("tail")).upper())
+    ata = normalize_ata(_text(fields.get("ata")))
+    key = natural_key(
+        source, _text(fields.get("record_id")), tail or aircraft, ata, fault_code, occurrence_date, description
+    )
+    return (
+        company_id,
+        aircraft,
+        tail,
+        ata,
+        fault_code,
+        description,
+        _text(fields.get("corrective_action")),
+        _text(fields.get("failure_type")),
+        occurrence_date,
+        _rate(fields.get("reliability_rate")),
+        source,
+        key,
+    ), ""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def import_file(
+    path: str,
+    company_id: int,
+    source: Optional[str] = None,
+    fmt: Optional[str] = None,
+    restart: bool = False,
+    bulk: bool = False,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """Stream ``path`` into ``failures`` for ``company_id``; resume a previous partial run.
+
+    ``source`` names the export (default: the file name) and is the resume key
+    together with the tenant. ``restart`` ignores the checkpoint; rows already
+    imported are still skipped by the natural key. ``bulk`` rebuilds the search
+    indexes and monthly rollups once at the end instead of updating them per row.
+    """
+    fmt = fmt or detect_format(path)
+    source = source or os.path.basename(path)
+    signature = file_signature(path)
+    stats: Dict[str, Any] = {
+        "source": source,
+        "format": fmt,
+        "status": "completed",
+        "resumed_from": 0,
+        "rows_read": 0,
+        "inserted": 0,
+        "duplicates": 0,
+        "rejected": 0,
+        "rejected_by_reason": {},
+    }
+    started = time.perf_counter()
+
+    with db.connection() as conn:
+        _create_search_indexes(conn)
+        db.ensure_rollups(conn)
+        state = conn.execute(
+            "SELECT signature, rows_done, finished_at FROM failure_imports WHERE company_id = ? AND source = ?",
+            (company_id, source),
+        ).fetchone()
+        if state is not None and state["signature"] == signature and not restart:
+            if state["finished_at"]:
+                stats["status"] = "already_imported"
+                stats["elapsed_s"] = 0.0
+                return stats
+            stats["resumed_from"] = state["rows_done"]
+        else:
+            conn.execute(
+                "INSERT OR REPLACE INTO failure_imports (company_id, source, signature, started_at) VALUES (?, ?, ?, ?)",
+                (company_id, source, signature, _now()),
+            )
+            conn.commit()
+
+        def write(chunk: List[tuple]) -> None:
+            inserted = conn.executemany(_INSERT_SQL, chunk).rowcount
+            stats["inserted"] += inserted
+            stats["duplicates"] += len(chunk) - inserted
+
+        def checkpoint(finished: bool) -> None:
+            conn.execute(
+                """UPDATE failure_imports
+                   SET rows_done = ?, inserted = inserted + ?, duplicates = duplicates + ?, rejected = rejected + ?,
+                       finished_at = ?
+                   WHERE company_id = ? AND source = ?""",
+                (
+                    stats["resumed_from"] + stats["rows_read"],
+                    stats["inserted"] - committed["inserted"],
+                    stats["duplicates"] - committed["duplicates"],
+                    stats["rejected"] - committed["rejected"],
+                    _now() if finished else None,
+                    company_id,
+                    source,
+                ),
+            )
+            conn.commit()
+            committed.update({k: stats[k] for k in committed})
+
+        committed = {"inserted": 0, "duplicates": 0, "rejected": 0}
+        records = read_records(path, fmt)
+        if stats["resumed_from"]:
+            records = itertools.islice(records, stats["resumed_from"], None)
+        if bulk:
+            _drop_search_indexes(conn)
+            db.drop_rollup_triggers(conn)
+        try:
+            chunk: List[tuple] = []
+            since_commit = 0
+            for raw in records:
+                stats["rows_read"] += 1
+                row, reason = normalize_record(raw, company_id, source)
+                if row is None:
+                    stats["rejected"] += 1
+                    stats["rejected_by_reason"][reason] = stats["rejected_by_reason"].get(reason, 0) + 1
+                else:
+                    chunk.append(row)
+                if len(chunk) >= config.FAILURES_IMPORT_CHUNK_ROWS:
+                    write(chunk)
+                    since_commit += len(chunk)
+                    chunk = []
+                    if since_commit >= config.FAILURES_IMPORT_COMMIT_ROWS:
+                        checkpoint(finished=False)
+                        since_commit = 0
+                        if progress is not None:
+                            progress(dict(stats, elapsed_s=time.perf_counter() - started))
+            if chunk:
+                write(chunk)
+            checkpoint(finished=True)
+        finally:
+            if bulk:
+                conn.rollback()
+                _create_search_indexes(conn)
+                db.rebuild_rollups(conn)
+                conn.execute("ANALYZE failures")
+                conn.commit()
+
+    # Flag repeat defects among the new rows (a tenant rebuild after large imports).
+    recurrence.refresh()
+    elapsed = time.perf_counter() - started
+    stats["elapsed_s"] = round(elapsed, 2)
+    stats["rows_per_s"] = int(stats["rows_read"] / elapsed) if elapsed > 0 else 0
+    return stats
+
+
+def import_upload(
+    fileobj: BinaryIO,
+    filename: str,
+    company_id: int,
+    source: Optional[str] = None,
+    fmt: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Import an uploaded export: spooled to a temporary file in 1 MiB copies, then streamed."""
+    fmt = fmt or detect_format(filename)
+    suffix = ".gz" if filename.lower().endswith(".gz") else ""
+    with tempfile.NamedTemporaryFile(suffix=suffix) as tmp:
+        shutil.copyfileobj(fileobj, tmp, 1 << 20)
+        tmp.flush()
+        return import_file(tmp.name, company_id, source=source or os.path.basename(filename), fmt=fmt)
+
+
+def _print_progress(stats: Dict[str, Any]) -> None:
+    rate = stats["rows_read"] / stats["elapsed_s"] if stats["elapsed_s"] > 0 else 0
+    print(
+        f"[IMPORT] {stats['resumed_from'] + stats['rows_read']} rows "
+        f"({stats['inserted']} new, {stats['duplicates']} duplicates, {stats['rejected']} rejected) "
+        f"{rate:,.0f} rows/s"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import defect / reliability exports into the failures database")
+    parser.add_argument("files", nargs="+", help="CSV, JSON lines (optionally .gz) or Parquet exports")
+    parser.add_argument("--company", type=int, required=True, help="Company (tenant) ID")
+    parser.add_argument("--source", type=str, default=None, help="Export name (default: file name); the resume key")
+    parser.add_argument("--format", choices=FORMATS, default=None, help="Override detection by file extension")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and read the file from the start")
+    parser.add_argument("--bulk", action="store_true", help="Rebuild search indexes and rollups at the end (initial loads)")
+    args = parser.parse_args()
+
+    try:
+        for path in args.files:
+            source = args.source if args.source and len(args.files) == 1 else None
+            result = import_file(
+                path, args.company, source=source, fmt=args.format, restart=args.restart,
+                bulk=args.bulk, progress=_print_progress,
+            )
+            if result["status"] == "already_imported":
+                print(f"[IMPORT] {result['source']}: already imported (use --restart to read it again)")
+                continue
+            if result["resumed_from"]:
+                print(f"[IMPORT] {result['source']}: resumed after {result['resumed_from']} rows")
+            print(
+                f"[IMPORT] {result['source']}: {result['rows_read']} rows in {result['elapsed_s']}s "
+                f"({result['rows_per_s']:,} rows/s): {result['inserted']} new, {result['duplicates']} duplicates, "
+                f"{result['rejected']} rejected {result['rejected_by_reason'] or ''}"
+            )
+    finally:
+        db.close_db()
+
+
+if __name__ == "__main__":
+    main()
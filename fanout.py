@@ -0,0 +1,102 @@
+"""Concurrent context gathering under one deadline (AeroAgent).
+
+A source is a callable taking the absolute ``time.monotonic()`` deadline.
+Coroutine functions run on the event loop; plain functions run in worker
+threads. Whatever has not finished by the deadline is skipped: a coroutine is
+cancelled, while a worker thread runs to completion in the background and its
+result is dropped. Gathering therefore costs max(sources), not sum(sources).
+"""
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional, Tuple
+import asyncio
+import threading
+import time
+
+import config
+
+Source = Callable[[float], Any]
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=config.AGENT_CONTEXT_WORKERS, thread_name_prefix="context")
+    return _executor
+
+
+def _entry(
+    status: str, started: float, error: Optional[BaseException] = None, ended: Optional[float] = None
+) -> Dict[str, Any]:
+    entry: Dict[str, Any] = {"status": status, "ms": round(((ended or time.perf_counter()) - started) * 1000, 1)}
+    if error is not None:
+        entry["error"] = str(error) or type(error).__name__
+    return entry
+
+
+async def gather(sources: Dict[str, Source], deadline: float) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """Run every source concurrently; return ``(values, report)`` for those done by ``deadline``.
+
+    ``report[name]`` is ``{"status": "ok" | "error" | "timeout", "ms": ...}``, ``ms``
+    counted from the start of the fan-out; ``values`` only holds the sources
+    that finished without error.
+    """
+    values: Dict[str, Any] = {}
+    report: Dict[str, Dict[str, Any]] = {}
+    started = time.perf_counter()
+
+    async def timed(name: str, source: Source) -> None:
+        try:
+            if asyncio.iscoroutinefunction(source):
+                values[name] = await source(deadline)
+            else:
+                values[name] = await asyncio.to_thread(source, deadline)
+            report[name] = _entry("ok", started)
+        except asyncio.CancelledError:
+            report[name] = _entry("timeout", started)
+            raise
+        except Exception as e:
+            report[name] = _entry("error", started, e)
+
+    tasks = [asyncio.ensure_future(timed(name, source)) for name, source in sources.items()]
+    if not tasks:
+        return values, report
+    _, pending = await asyncio.wait(tasks, timeout=max(0.0, deadline - time.monotonic()))
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.wait(pending)
+    return values, report
+
+
+def gather_sync(sources: Dict[str, Source], deadline: float) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """Thread-pool twin of ``gather`` for synchronous callers; coroutine sources are skipped."""
+    values: Dict[str, Any] = {}
+    report: Dict[str, Dict[str, Any]] = {}
+    started = time.perf_counter()
+    futures = {}
+    ended: Dict[str, float] = {}
+    for name, source in sources.items():
+        if asyncio.iscoroutinefunction(source):
+            report[name] = {"status": "skipped", "ms": 0.0}
+        else:
+            future = _get_executor().submit(source, deadline)
+            future.add_done_callback(lambda f, name=name: ended.setdefault(name, time.perf_counter()))
+            futures[future] = name
+    done, pending = wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+    for future in done:
+        name = futures[future]
+        error = future.exception()
+        if error is None:
+            values[name] = future.result()
+            report[name] = _entry("ok", started, ended=ended.get(name))
+        else:
+            report[name] = _entry("error", started, error, ended.get(name))
+    for future in pending:
+        future.cancel()
+        report[futures[future]] = _entry("timeout", started)
+    return values, report
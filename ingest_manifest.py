@@ -0,0 +1,124 @@
+"""Per-tenant ingestion manifest for incremental re-ingestion.
+
+The manifest remembers, for every ingested file, its size, mtime, content
+hash, the metadata it was ingested with and the ids of the chunks it produced.
+A re-run then only extracts and embeds new or changed files, and deletes the
+chunks of files that changed or disappeared. Unchanged files are recognised
+from (size, mtime) without re-reading them; the content hash is only computed
+when those differ, so a touched-but-identical file is not re-embedded.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def meta_signature(meta: Dict[str, Any]) -> str:
+    """Hash of the ingestion metadata, so re-tagging a file (e.g. new --doctype) re-ingests it."""
+    return hashlib.sha1(json.dumps(meta, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def make_chunk_id(company_id: Any, source_path: str, content: str, occurrence: int = 0) -> str:
+    """Stable chunk id derived from tenant, source file and chunk content.
+
+    ``occurrence`` separates identical chunks repeated within one file.
+    """
+    raw = f"{company_id}\x1f{source_path}\x1f{occurrence}\x1f{content}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class FileChange:
+    path: str
+    size: int
+    mtime: float
+    sha256: str
+    signature: str
+    old_chunk_ids: List[str] = field(default_factory=list)
+
+
+@dataclass
+class IngestPlan:
+    changed: List[FileChange] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    # path -> chunk ids of files that are gone from the scanned folder
+    removed: Dict[str, List[str]] = field(default_factory=dict)
+
+
+class IngestManifest:
+    def __init__(self, company_id: int, directory: Path, path: Optional[str] = None) -> None:
+        self.company_id = company_id
+        self.path = Path(path) if path else Path(directory) / f"company_{company_id}.json"
+        self.files: Dict[str, Dict[str, Any]] = {}
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as fh:
+                self.files = json.load(fh).get("files", {})
+
+    def plan(self, paths: Iterable[str], root: str, metas: Dict[str, Dict[str, Any]], full: bool = False) -> IngestPlan:
+        """Compare files found under ``root`` with the manifest.
+
+        ``metas`` maps each path to the metadata it would be ingested with.
+        With ``full=True`` every file is treated as changed.
+        """
+        plan = IngestPlan()
+        seen = set()
+        for path in paths:
+            key = os.path.abspath(path)
+            seen.add(key)
+            stat = os.stat(key)
+            signature = meta_signature(metas.get(path, {}))
+            entry = self.files.get(key)
+            if entry and not full and entry.get("signature") == signature:
+                if entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime:
+                    plan.unchanged.append(path)
+                    continue
+                sha = file_sha256(key)
+                if sha == entry.get("sha256"):
+                    entry["mtime"] = stat.st_mtime  # touched but identical
+                    plan.unchanged.append(path)
+                    continue
+            else:
+                sha = file_sha256(key)
+            plan.changed.append(FileChange(
+                path=path,
+                size=stat.st_size,
+                mtime=stat.st_mtime,
+                sha256=sha,
+                signature=signature,
+                old_chunk_ids=list(entry.get("chunk_ids", [])) if entry else [],
+            ))
+
+        root_prefix = os.path.join(os.path.abspath(root), "")
+        for key, entry in self.files.items():
+            if key.startswith(root_prefix) and key not in seen:
+                plan.removed[key] = list(entry.get("chunk_ids", []))
+        return plan
+
+    def record(self, change: FileChange, chunk_ids: List[str]) -> None:
+        self.files[os.path.abspath(change.path)] = {
+            "size": change.size,
+            "mtime": change.mtime,
+            "sha256": change.sha256,
+            "signature": change.signature,
+            "chunk_ids": chunk_ids,
+        }
+
+    def forget(self, path: str) -> None:
+        self.files.pop(os.path.abspath(path), None)
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump({"company_id": self.company_id, "files": self.files}, fh)
+        os.replace(tmp, self.path)
@@ -11,9 +11,17 @@ FORBIDDEN:
 """
 import argparse
 import os
-from typing import List, Dict, Any
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import List, Dict, Any, Tuple
 
-from ..rag_module import RAGPipeline
+import pymupdf
+
+from .. import config
+from ..batch_ingest import BatchIngestor
+from ..chunking import chunk_pages
+from ..ingest_manifest import FileChange, IngestManifest
+from ..rag_module import MANIFEST_DIR, get_pipeline
 
 
 FORBIDDEN_PREFIXES = ("AMM", "SRM", "IPC", "FCOM", "TSM", "WDM")
@@ -27,14 +35,29 @@ def is_forbidden_filename(name: str) -> bool:
     return any(k in upper for k in FORBIDDEN_KEYWORDS)
 
 
+def extract_pages(path: str) -> List[Tuple[int, str]]:
+    """Return ``(page_number, text)`` for every page, numbered from 1."""
+    with pymupdf.open(path) as doc:
+        return [(i, page.get_text("text")) for i, page in enumerate(doc, 1)]
+
+
 def extract_text_from_pdf(path: str) -> str:
-    # Minimal placeholder to avoid hard dependency on pypdf
-    # In production, replace with proper PDF text extraction (e.g. pypdf).
-    return f"[PDF content placeholder for {os.path.basename(path)}]"
+    return "\n\n".join(text for _, text in extract_pages(path))
 
 
-def build_chunks(text: str, meta: Dict[str, Any]) -> List[Dict[str, Any]]:
-    return [{"content": text, **meta}]
+def build_chunks(pages: List[Tuple[int, str]], meta: Dict[str, Any]) -> List[Dict[str, Any]]:
+    chunks = []
+    for chunk in chunk_pages(pages):
+        # MMEL item numbers in the text are more precise than the CLI --ata hint.
+        ata = chunk.pop("ata_chapter") or meta.get("ata_chapter", "")
+        chunks.append({**meta, **chunk, "ata_chapter": ata})
+    return chunks
+
+
+def process_pdf(fpath: str, meta: Dict[str, Any]) -> Tuple[str, int, List[Dict[str, Any]]]:
+    """Extract and chunk one PDF (runs in a worker process)."""
+    pages = extract_pages(fpath)
+    return fpath, len(pages), build_chunks(pages, meta)
 
 
 def main() -> None:
@@ -44,10 +67,16 @@ def main() -> None:
     parser.add_argument("--aircraft", type=str, required=False, default="", help="Aircraft model hint")
     parser.add_argument("--ata", type=str, required=False, default="", help="ATA chapter hint")
     parser.add_argument("--doctype", type=str, required=False, default="MMEL", help="Document type (MMEL, MEL, MOE, REG, HF, COMPANY_PROC, RELIABILITY)")
+    parser.add_argument("--workers", type=int, required=False, default=config.INGEST_WORKERS, help="Extraction processes")
+    parser.add_argument("--full", action="store_true", help="Re-ingest every file, ignoring the manifest")
+    parser.add_argument("--batch-size", type=int, required=False, default=config.EMBED_BATCH_SIZE, help="Chunks per embedding batch")
+    parser.add_argument("--embed-concurrency", type=int, required=False, default=config.EMBED_CONCURRENCY, help="Embedding batches in flight")
     args = parser.parse_args()
 
-    pipeline = RAGPipeline(collection="aerobrain_docs")
+    pipeline = get_pipeline()
+    manifest = IngestManifest(args.company, MANIFEST_DIR)
 
+    metas: Dict[str, Dict[str, Any]] = {}
     for root, _, files in os.walk(args.pdf_dir):
         for fname in files:
             if not fname.lower().endswith(".pdf"):
@@ -56,7 +85,6 @@ def main() -> None:
                 print(f"[SKIP] Forbidden-looking filename (possible OEM manual): {fname}")
                 continue
             fpath = os.path.join(root, fname)
-            text = extract_text_from_pdf(fpath)
             meta = {
                 "company_id": args.company,
                 "aircraft_model": args.aircraft,
@@ -65,10 +93,63 @@ def main() -> None:
                 "source_path": fpath,
                 "doc_title": os.path.splitext(fname)[0],
             }
-            chunks = build_chunks(text, meta)
-            pipeline.ingest_document(chunks)
-            print(f"[OK] Ingested {fname}")
-
+            metas[fpath] = meta
+
+    started = time.perf_counter()
+    plan = manifest.plan(metas.keys(), args.pdf_dir, metas, full=args.full)
+    for fpath, chunk_ids in plan.removed.items():
+        pipeline.delete_chunks(chunk_ids, args.company)
+        manifest.forget(fpath)
+        print(f"[DEL] Removed chunks of deleted file: {fpath}")
+
+    total_pages = done = 0
+
+    def on_done(change: FileChange):
+        def record(ids: List[str]) -> None:
+            nonlocal done
+            # Old chunks are only dropped once every new chunk of the file is written.
+            pipeline.delete_chunks(list(set(change.old_chunk_ids) - set(ids)), args.company)
+            manifest.record(change, ids)
+            done += 1
+            if done % 25 == 0:
+                manifest.save()
+        return record
+
+    workers = max(1, args.workers)
+    pending_changes = list(plan.changed)
+    ingestor = BatchIngestor(pipeline, batch_size=args.batch_size, concurrency=args.embed_concurrency)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures: Dict[Any, FileChange] = {}
+            while pending_changes or futures:
+                # Keep a bounded number of extracted-but-unembedded files in memory.
+                while pending_changes and len(futures) < workers * 2:
+                    change = pending_changes.pop(0)
+                    futures[pool.submit(process_pdf, change.path, metas[change.path])] = change
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    change = futures.pop(future)
+                    try:
+                        _, n_pages, chunks = future.result()
+                    except Exception as e:
+                        print(f"[ERROR] Failed to extract {change.path}: {e}")
+                        continue
+                    ingestor.add_document(chunks, on_done(change))
+                    total_pages += n_pages
+                    print(f"[OK] Extracted {os.path.basename(change.path)} ({n_pages} pages, {len(chunks)} chunks)")
+        ingestor.close()
+    finally:
+        manifest.save()
+        pipeline.persist()
+
+    stats = ingestor.stats()
+    elapsed = time.perf_counter() - started
+    rate = total_pages / elapsed if elapsed > 0 else 0.0
+    print(
+        f"[DONE] {done} ingested, {len(plan.unchanged)} unchanged, {len(plan.removed)} removed; "
+        f"{total_pages} pages, {stats['chunks']} chunks in {elapsed:.1f}s "
+        f"({rate:.1f} pages/s, {stats['docs_per_s']} docs/s, {stats['chunks_per_s']} chunks/s)"
+    )
 
 if __name__ == "__main__":
     main()
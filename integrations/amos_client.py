@@ -12,9 +12,9 @@ class AmosClient(BaseIntegrationClient):
     @classmethod
     def is_enabled(cls, company_id: int) -> bool:
         # TODO: read tenant-specific config from secure store
-        return False
+        return super().is_enabled(company_id)
 
     @classmethod
     def get_credentials(cls, company_id: int) -> Optional[Dict[str, Any]]:
         # TODO: obtain credentials securely per tenant
-        return None
+        return super().get_credentials(company_id)
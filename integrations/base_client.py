@@ -1,15 +1,27 @@
 """Base classes for external MRO/ERP/fleet health integrations.
 
-These connectors are pre-installed but DISABLED by default.
+These connectors are pre-installed but DISABLED by default. Every enabled
+client shares the pooled, rate-limited transport of its provider
+(see ``integrations/transport.py``). Setting ``INTEGRATION_STUB_URL`` points
+all providers at ``tools/mro_stub_server.py`` so they can run offline.
 """
 from typing import Any, Dict, List, Optional
 
+import config
+from .transport import IntegrationError, ProviderTransport, get_transport
+
 
 class BaseIntegrationClient:
     provider_name: str = "base"
+    # Read-only endpoints, relative to the tenant's base URL.
+    defects_path: str = "/defects"
+    trends_path: str = "/reliability/trends"
+    # Change feed used by mro_sync.py: defects created or modified after a cursor.
+    changes_path: str = "/defects/changes"
 
     def __init__(self, company_id: int):
         self.company_id = company_id
+        self._credentials = self.get_credentials(company_id)
 
     @classmethod
     def is_enabled(cls, company_id: int) -> bool:
@@ -17,17 +29,82 @@ class BaseIntegrationClient:
 
         In production this should read tenant-specific configuration from a secure store.
         """
-        return False
+        return config.INTEGRATION_STUB_URL is not None
 
     @classmethod
     def get_credentials(cls, company_id: int) -> Optional[Dict[str, Any]]:
-        """Return credential payload for this tenant, or None if not configured."""
+        """Return credential payload (``base_url``, optional ``token``) for this tenant, or None if not configured."""
+        if config.INTEGRATION_STUB_URL:
+            return {"base_url": f"{config.INTEGRATION_STUB_URL.rstrip('/')}/{cls.provider_name.lower()}", "token": "stub"}
         return None
 
-    def get_defect_history(self, aircraft: Optional[str] = None, ata: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
-        """Return recent defect history (read-only)."""
-        return []
+    @property
+    def transport(self) -> ProviderTransport:
+        if not self._credentials or not self._credentials.get("base_url"):
+            raise IntegrationError(f"{self.provider_name} is not configured for company {self.company_id}")
+        return get_transport(self.provider_name, self._credentials["base_url"])
+
+    def _headers(self) -> Dict[str, str]:
+        headers = {"Accept": "application/json"}
+        token = (self._credentials or {}).get("token")
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        return headers
+
+    @staticmethod
+    def _parse_defects(payload: Any) -> List[Dict[str, Any]]:
+        """Provider payload -> list of defect dicts; override for provider-specific shapes."""
+        if isinstance(payload, dict):
+            payload = payload.get("defects", [])
+        return [d for d in payload or [] if isinstance(d, dict)]
+
+    async def get_defect_history(
+        self,
+        aircraft: Optional[str] = None,
+        ata: Optional[str] = None,
+        limit: int = 50,
+        timeout: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """Return recent defect history (read-only) within ``timeout`` seconds."""
+        payload = await self.transport.request_json(
+            "GET",
+            self.defects_path,
+            params={"aircraft": aircraft, "ata": ata, "limit": limit},
+            headers=self._headers(),
+            timeout=timeout,
+        )
+        return self._parse_defects(payload)[:limit]
 
-    def get_reliability_trends(self, aircraft: Optional[str] = None) -> Dict[str, Any]:
-        """Return simple reliability trend information (read-only)."""
-        return {}
+    async def get_reliability_trends(self, aircraft: Optional[str] = None, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Return simple reliability trend information (read-only) within ``timeout`` seconds."""
+        payload = await self.transport.request_json(
+            "GET", self.trends_path, params={"aircraft": aircraft}, headers=self._headers(), timeout=timeout
+        )
+        return payload if isinstance(payload, dict) else {}
+
+    async def get_defect_changes(
+        self, cursor: Optional[str] = None, limit: int = 500, timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """One page of the change feed after ``cursor`` (None: from the beginning).
+
+        Returns ``{"defects": [...], "next_cursor": ..., "has_more": bool}``. Providers
+        without an opaque cursor are paged by watermark: the latest ``updated_at`` seen.
+        """
+        payload = await self.transport.request_json(
+            "GET",
+            self.changes_path,
+            params={"cursor": cursor, "limit": limit},
+            headers=self._headers(),
+            timeout=timeout,
+        )
+        defects = self._parse_defects(payload)
+        payload = payload if isinstance(payload, dict) else {}
+        next_cursor = payload.get("next_cursor")
+        if next_cursor is None:
+            next_cursor = max((str(d["updated_at"]) for d in defects if d.get("updated_at")), default=cursor)
+        has_more = payload.get("has_more")
+        return {
+            "defects": defects,
+            "next_cursor": next_cursor,
+            "has_more": bool(has_more) if has_more is not None else len(defects) >= limit,
+        }
@@ -0,0 +1,298 @@
+"""Shared async HTTP layer for the MRO integration clients.
+
+One ``ProviderTransport`` per (provider, base URL), created on first use and
+reused by every tenant and request:
+
+- a keep-alive ``httpx.AsyncClient`` pool per provider;
+- a token bucket (``INTEGRATION_RATE_PER_S`` / ``INTEGRATION_BURST``) so one
+  busy tenant cannot push a provider into throttling us;
+- retries of connection errors, timeouts, 429 and 5xx with full-jitter
+  exponential backoff (``Retry-After`` is honoured as a floor);
+- a circuit breaker: after ``INTEGRATION_BREAKER_FAILURES`` consecutive failed
+  calls the provider is skipped for ``INTEGRATION_BREAKER_RESET_S``, then one
+  probe call decides whether it closes again;
+- a per-call deadline covering rate-limit waits, every attempt and backoff.
+"""
+from typing import Any, Dict, Optional, Tuple
+import asyncio
+import random
+import threading
+import time
+
+import httpx
+
+import config
+
+RETRYABLE_STATUS = frozenset([429, 500, 502, 503, 504])
+
+
+class IntegrationError(Exception):
+    """A provider call failed (after retries) or returned an unusable response."""
+
+
+class CircuitOpenError(IntegrationError):
+    """The provider's circuit breaker is open; the call was not attempted."""
+
+
+class DeadlineExceeded(IntegrationError):
+    """The per-call deadline passed before a response arrived."""
+
+
+class RateLimitExceeded(DeadlineExceeded):
+    """Our own token bucket could not grant a call slot before the deadline."""
+
+
+class IntegrationClientError(IntegrationError):
+    """The provider rejected the request (4xx other than 429); not retried."""
+
+
+class _Retryable(IntegrationError):
+    def __init__(self, message: str, retry_after: float = 0.0) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Async token bucket: ``rate`` tokens per second, at most ``burst`` banked."""
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, deadline: float) -> None:
+        """Take one token, waiting for it unless that would pass ``deadline``."""
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        self._refill(now)
+        wait = (1.0 - self.tokens) / self.rate if self.tokens < 1.0 else 0.0
+        if now + wait > deadline:
+            raise RateLimitExceeded("Rate limit wait exceeds the call deadline")
+        # Reserve the token now (the balance may go negative), so waiters are served in arrival order.
+        self.tokens -= 1.0
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self.tokens += 1.0
+                raise
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open (one probe) -> closed."""
+
+    def __init__(self, failure_threshold: int, reset_timeout_s: float) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout_s = reset_timeout_s
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.probing or time.monotonic() - self.opened_at >= self.reset_timeout_s:
+            return "half_open"
+        return "open"
+
+    def before_call(self) -> bool:
+        """Raise ``CircuitOpenError`` if calls are blocked; return True if this call is the probe."""
+        state = self.state
+        if state == "open" or (state == "half_open" and self.probing):
+            raise CircuitOpenError("Circuit open after repeated failures")
+        if state == "half_open":
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def release_probe(self) -> None:
+        """The probe call never reached the provider: let the next call probe instead."""
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.probing or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                self.times_opened += 1
+            self.opened_at = time.monotonic()
+            self.probing = False
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter for the given (0-based) retry attempt."""
+    ceiling = min(config.INTEGRATION_RETRY_MAX_BACKOFF_S, config.INTEGRATION_RETRY_BACKOFF_S * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+def _retry_after(response: httpx.Response) -> float:
+    try:
+        return max(0.0, float(response.headers.get("Retry-After", 0)))
+    except ValueError:
+        return 0.0
+
+
+class ProviderTransport:
+    """Pooled, rate-limited, retrying JSON client for one provider endpoint."""
+
+    def __init__(self, provider: str, base_url: str) -> None:
+        self.provider = provider
+        self.base_url = base_url
+        self.bucket = TokenBucket(config.INTEGRATION_RATE_PER_S, config.INTEGRATION_BURST)
+        self.breaker = CircuitBreaker(config.INTEGRATION_BREAKER_FAILURES, config.INTEGRATION_BREAKER_RESET_S)
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            limits=httpx.Limits(
+                max_connections=config.INTEGRATION_MAX_CONNECTIONS,
+                max_keepalive_connections=config.INTEGRATION_MAX_KEEPALIVE,
+                keepalive_expiry=config.INTEGRATION_KEEPALIVE_EXPIRY_S,
+            ),
+            timeout=httpx.Timeout(config.INTEGRATION_TIMEOUT_S, connect=config.INTEGRATION_CONNECT_TIMEOUT_S),
+        )
+        self.counters = {"calls": 0, "ok": 0, "retries": 0, "failed": 0, "rejected_open": 0, "deadline_exceeded": 0}
+
+    def _attempt_timeout(self, deadline: float) -> httpx.Timeout:
+        remaining = max(0.001, deadline - time.monotonic())
+        return httpx.Timeout(remaining, connect=min(remaining, config.INTEGRATION_CONNECT_TIMEOUT_S))
+
+    async def request_json(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """Call ``path`` and return the decoded JSON body, within ``timeout`` seconds overall."""
+        deadline = time.monotonic() + (timeout if timeout is not None else config.INTEGRATION_TIMEOUT_S)
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+        self.counters["calls"] += 1
+        try:
+            probe = self.breaker.before_call()
+        except CircuitOpenError:
+            self.counters["rejected_open"] += 1
+            raise
+
+        attempt = 0
+        try:
+            while True:
+                await self.bucket.acquire(deadline)
+                try:
+                    body = await self._attempt(method, path, params, headers, deadline)
+                    break
+                except _Retryable as e:
+                    if attempt >= config.INTEGRATION_MAX_RETRIES:
+                        raise IntegrationError(str(e)) from None
+                    if self.breaker.state == "open":
+                        # Other calls tripped the breaker meanwhile: stop hammering the provider.
+                        raise IntegrationError(f"{e}; circuit opened") from None
+                    delay = max(backoff_delay(attempt), e.retry_after)
+                    if time.monotonic() + delay >= deadline:
+                        raise DeadlineExceeded(f"{e}; no time left to retry") from None
+                    self.counters["retries"] += 1
+                    await asyncio.sleep(delay)
+                    attempt += 1
+        except IntegrationClientError:
+            # The provider answered: a rejected request says nothing bad about its health.
+            self.breaker.record_success()
+            self.counters["failed"] += 1
+            raise
+        except IntegrationError as e:
+            if isinstance(e, DeadlineExceeded):
+                self.counters["deadline_exceeded"] += 1
+            if isinstance(e, RateLimitExceeded) and attempt == 0:
+                # Queued behind our own rate limit: the provider was never asked.
+                if probe:
+                    self.breaker.release_probe()
+            else:
+                self.breaker.record_failure()
+            self.counters["failed"] += 1
+            raise
+        except asyncio.CancelledError:
+            if probe:
+                self.breaker.release_probe()
+            raise
+        self.breaker.record_success()
+        self.counters["ok"] += 1
+        return body
+
+    async def _attempt(
+        self,
+        method: str,
+        path: str,
+        params: Dict[str, Any],
+        headers: Optional[Dict[str, str]],
+        deadline: float,
+    ) -> Any:
+        """One HTTP attempt returning the decoded body; raises ``_Retryable`` for transient failures."""
+        try:
+            response = await self.client.request(
+                method, path, params=params, headers=headers, timeout=self._attempt_timeout(deadline)
+            )
+        except httpx.TimeoutException:
+            if time.monotonic() >= deadline:
+                raise DeadlineExceeded(f"{self.provider}: call deadline exceeded") from None
+            raise _Retryable(f"{self.provider}: request timed out") from None
+        except httpx.TransportError as e:
+            raise _Retryable(f"{self.provider}: connection failed: {e}") from None
+
+        if response.status_code in RETRYABLE_STATUS:
+            raise _Retryable(f"{self.provider}: HTTP {response.status_code}", _retry_after(response))
+        if response.status_code >= 400:
+            raise IntegrationClientError(f"{self.provider}: HTTP {response.status_code}: {response.text[:200]}")
+        try:
+            return response.json()
+        except ValueError:
+            raise IntegrationError(f"{self.provider}: response is not JSON") from None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "breaker": self.breaker.state,
+            "breaker_opened": self.breaker.times_opened,
+            "tokens": round(self.bucket.tokens, 2),
+        }
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+_transports: Dict[Tuple[str, str], ProviderTransport] = {}
+_lock = threading.Lock()
+
+
+def get_transport(provider: str, base_url: str) -> ProviderTransport:
+    """Process-wide transport for ``provider`` at ``base_url`` (one pool, bucket and breaker each)."""
+    key = (provider, base_url.rstrip("/"))
+    transport = _transports.get(key)
+    if transport is None:
+        with _lock:
+            transport = _transports.get(key)
+            if transport is None:
+                transport = _transports[key] = ProviderTransport(provider, key[1])
+    return transport
+
+
+def stats() -> Dict[str, Any]:
+    return {f"{provider} {url}": t.stats() for (provider, url), t in list(_transports.items())}
+
+
+async def aclose() -> None:
+    """Close every provider pool (called on application shutdown)."""
+    with _lock:
+        transports = list(_transports.values())
+        _transports.clear()
+    for transport in transports:
+        await transport.aclose()
@@ -0,0 +1,292 @@
+"""BM25 side index for exact-token retrieval (fault codes, ECAM messages, MEL items).
+
+Dense embeddings blur tokens such as "21-52-01" or "HYD G RSVR LO LVL"; this
+index scores them exactly and its ranking is fused with the vector results.
+
+Postings are kept in compressed-sparse-row form: one ``array('I')`` of doc
+numbers and one ``array('H')`` of term frequencies for all terms, plus an
+offset per term. Chunks added since the last compaction go to small per-term
+delta arrays, and removed chunks are tombstoned. ``save()`` folds both into
+the base arrays and writes them next to the Chroma data. Loading is a single
+unpickle of a few flat arrays, so it stays fast at startup.
+"""
+from typing import Any, Collection, Dict, Iterable, Iterator, List, Optional, Tuple
+import heapq
+import math
+import os
+import pickle
+import re
+import threading
+import time
+from array import array
+from pathlib import Path
+
+
+# Metadata kept per chunk so searches can apply the same tenant/aircraft/ATA filter as Chroma.
+FILTER_FIELDS = ("company_id", "aircraft_model", "ata_chapter")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+_FORMAT_VERSION = 1
+_MAX_TF = 0xFFFF
+# How often a read-only process checks whether another process rewrote the index file.
+_RELOAD_CHECK_S = 5.0
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-/.][a-z0-9]+)*")
+_SPLIT_RE = re.compile(r"[-/.]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens; compound codes are kept whole and also split.
+
+    "21-52-01" -> ["21-52-01", "21", "52", "01"], so the exact item number
+    scores highest while "ATA 21" still matches the chapter part.
+    """
+    tokens = []
+    for token in _TOKEN_RE.findall((text or "").lower()):
+        tokens.append(token)
+        if _SPLIT_RE.search(token):
+            tokens.extend(part for part in _SPLIT_RE.split(token) if part)
+    return tokens
+
+
+class LexicalIndex:
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = Path(path) if path else None
+        self._lock = threading.RLock()
+        self._reset()
+        self.dirty = False
+        self._loaded_mtime = 0.0
+        self._last_reload_check = 0.0
+        if self.path is not None and self.path.exists():
+            self.load()
+
+    def _reset(self) -> None:
+        self.doc_ids: List[str] = []
+        self.doc_slot: Dict[str, int] = {}
+        self.doc_len = array("I")
+        # None marks a removed chunk (tombstone until the next compaction).
+        self.doc_meta: List[Optional[Tuple[str, ...]]] = []
+        self.live_docs = 0
+        self.total_len = 0
+        self.dead_docs = 0
+        # Base postings (CSR) and per-term deltas for chunks added since.
+        self.terms: Dict[str, int] = {}
+        self.offsets = array("Q", [0])
+        self.post_docs = array("I")
+        self.post_tfs = array("H")
+        self.delta: Dict[str, Tuple[array, array]] = {}
+
+    def __len__(self) -> int:
+        return self.live_docs
+
+    # -- updates --------------------------------------------------------
+
+    def add(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """Index chunks; an id that is already indexed is replaced."""
+        with self._lock:
+            self._remove_locked(ids)
+            for chunk_id, text, meta in zip(ids, documents, metadatas):
+                counts: Dict[str, int] = {}
+                tokens = tokenize(text)
+                for token in tokens:
+                    counts[token] = counts.get(token, 0) + 1
+                slot = len(self.doc_ids)
+                self.doc_ids.append(chunk_id)
+                self.doc_slot[chunk_id] = slot
+                self.doc_len.append(len(tokens))
+                self.doc_meta.append(tuple(str(meta.get(f, "")) for f in FILTER_FIELDS))
+                self.live_docs += 1
+                self.total_len += len(tokens)
+                for token, tf in counts.items():
+                    postings = self.delta.get(token)
+                    if postings is None:
+                        postings = self.delta[token] = (array("I"), array("H"))
+                    postings[0].append(slot)
+                    postings[1].append(min(tf, _MAX_TF))
+            self.dirty = True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+            self.dirty = True
+
+    def remove(self, ids: Iterable[str]) -> None:
+        with self._lock:
+            if self._remove_locked(ids):
+                self.dirty = True
+
+    def _remove_locked(self, ids: Iterable[str]) -> int:
+        removed = 0
+        for chunk_id in ids:
+            slot = self.doc_slot.pop(chunk_id, None)
+            if slot is None:
+                continue
+            self.doc_meta[slot] = None
+            self.total_len -= self.doc_len[slot]
+            self.live_docs -= 1
+            self.dead_docs += 1
+            removed += 1
+        return removed
+
+    def compact(self) -> None:
+        """Fold deltas into the base arrays and drop tombstoned chunks."""
+        with self._lock:
+            remap = array("I", [0]) * len(self.doc_ids)
+            doc_ids: List[str] = []
+            doc_len = array("I")
+            doc_meta: List[Optional[Tuple[str, ...]]] = []
+            for slot, meta in enumerate(self.doc_meta):
+                if meta is None:
+                    continue
+                remap[slot] = len(doc_ids)
+                doc_ids.append(self.doc_ids[slot])
+                doc_len.append(self.doc_len[slot])
+                doc_meta.append(meta)
+
+            terms: Dict[str, int] = {}
+            offsets = array("Q", [0])
+            post_docs = array("I")
+            post_tfs = array("H")
+            for term in set(self.terms) | set(self.delta):
+                start = len(post_docs)
+                for slot, tf in self._postings(term):
+                    if self.doc_meta[slot] is not None:
+                        post_docs.append(remap[slot])
+                        post_tfs.append(tf)
+                if len(post_docs) > start:
+                    terms[term] = len(terms)
+                    offsets.append(len(post_docs))
+
+            self.doc_ids, self.doc_len, self.doc_meta = doc_ids, doc_len, doc_meta
+            self.doc_slot = {chunk_id: slot for slot, chunk_id in enumerate(doc_ids)}
+            self.dead_docs = 0
+            self.terms, self.offsets, self.post_docs, self.post_tfs = terms, offsets, post_docs, post_tfs
+            self.delta = {}
+
+    def _postings(self, term: str) -> Iterator[Tuple[int, int]]:
+        slot = self.terms.get(term)
+        if slot is not None:
+            start, end = self.offsets[slot], self.offsets[slot + 1]
+            yield from zip(self.post_docs[start:end], self.post_tfs[start:end])
+        delta = self.delta.get(term)
+        if delta is not None:
+            yield from zip(*delta)
+
+    def _doc_freq(self, term: str) -> int:
+        slot = self.terms.get(term)
+        df = self.offsets[slot + 1] - self.offsets[slot] if slot is not None else 0
+        delta = self.delta.get(term)
+        return df + (len(delta[0]) if delta is not None else 0)
+
+    # -- queries ----------------------------------------------------------
+
+    def search(
+        self, query: str, top_k: int, filters: Optional[Dict[str, Collection[str]]] = None
+    ) -> List[Tuple[str, float]]:
+        """Best ``top_k`` ``(chunk_id, bm25_score)`` among chunks passing ``filters``.
+
+        ``filters`` maps a field of ``FILTER_FIELDS`` to its allowed values.
+        """
+        self.maybe_reload()
+        terms = set(tokenize(query))
+        checks = [(FILTER_FIELDS.index(f), set(allowed)) for f, allowed in (filters or {}).items()]
+        with self._lock:
+            if not terms or not self.live_docs:
+                return []
+            avg_len = self.total_len / self.live_docs or 1.0
+            accepted: Dict[int, bool] = {}
+            scores: Dict[int, float] = {}
+            for term in terms:
+                df = self._doc_freq(term)
+                if not df:
+                    continue
+                idf = math.log(1.0 + (self.live_docs - df + 0.5) / (df + 0.5))
+                for slot, tf in self._postings(term):
+                    ok = accepted.get(slot)
+                    if ok is None:
+                        meta = self.doc_meta[slot]
+                        ok = accepted[slot] = meta is not None and all(meta[i] in allowed for i, allowed in checks)
+                    if not ok:
+                        continue
+                    norm = BM25_K1 * (1.0 - BM25_B + BM25_B * self.doc_len[slot] / avg_len)
+                    scores[slot] = scores.get(slot, 0.0) + idf * tf * (BM25_K1 + 1.0) / (tf + norm)
+            best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+            return [(self.doc_ids[slot], score) for slot, score in best]
+
+    def meta(self, chunk_id: str) -> Optional[Dict[str, str]]:
+        slot = self.doc_slot.get(chunk_id)
+        if slot is None or self.doc_meta[slot] is None:
+            return None
+        return dict(zip(FILTER_FIELDS, self.doc_meta[slot]))
+
+    # -- persistence ------------------------------------------------------
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            self.compact()
+            state = {
+                "version": _FORMAT_VERSION,
+                "doc_ids": self.doc_ids,
+                "doc_len": self.doc_len,
+                "doc_meta": self.doc_meta,
+                "terms": list(self.terms),
+                "offsets": self.offsets,
+                "post_docs": self.post_docs,
+                "post_tfs": self.post_tfs,
+            }
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            with open(tmp, "wb") as fh:
+                pickle.dump(state, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.path)
+            self.dirty = False
+            self._loaded_mtime = self.path.stat().st_mtime
+
+    def load(self) -> None:
+        with open(self.path, "rb") as fh:
+            state = pickle.load(fh)
+        if state.get("version") != _FORMAT_VERSION:
+            print(f"[LEXICAL] Ignoring index with unknown format: {self.path}")
+            return
+        with self._lock:
+            self._reset()
+            self.doc_ids = state["doc_ids"]
+            self.doc_len = state["doc_len"]
+            self.doc_meta = state["doc_meta"]
+            self.doc_slot = {chunk_id: slot for slot, chunk_id in enumerate(self.doc_ids)}
+            self.live_docs = len(self.doc_ids)
+            self.total_len = sum(self.doc_len)
+            self.terms = {term: slot for slot, term in enumerate(state["terms"])}
+            self.offsets = state["offsets"]
+            self.post_docs = state["post_docs"]
+            self.post_tfs = state["post_tfs"]
+            self.dirty = False
+            self._loaded_mtime = self.path.stat().st_mtime
+
+    def maybe_reload(self) -> bool:
+        """Pick up an index file rewritten by an ingestion run in another process; True if reloaded."""
+        if self.path is None or self.dirty:
+            return False
+        now = time.monotonic()
+        if now - self._last_reload_check < _RELOAD_CHECK_S:
+            return False
+        self._last_reload_check = now
+        try:
+            mtime = self.path.stat().st_mtime
+        except FileNotFoundError:
+            return False
+        if mtime == self._loaded_mtime:
+            return False
+        self.load()
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "chunks": self.live_docs,
+            "terms": len(set(self.terms) | set(self.delta)),
+            "postings": len(self.post_docs) + sum(len(d[0]) for d in self.delta.values()),
+            "tombstones": self.dead_docs,
+        }
@@ -0,0 +1,112 @@
+"""Shared OpenAI clients with pooled HTTP connections, timeouts and retry/backoff."""
+from typing import Any, Optional
+import asyncio
+import random
+import threading
+import time
+
+import httpx
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    AsyncOpenAI,
+    InternalServerError,
+    OpenAI,
+    RateLimitError,
+)
+
+import config
+
+# Errors worth retrying; anything else (auth, bad request) fails immediately.
+RETRYABLE_ERRORS = (APIConnectionError, APITimeoutError, RateLimitError, InternalServerError)
+
+_async_client: Optional[AsyncOpenAI] = None
+_sync_client: Optional[OpenAI] = None
+_lock = threading.Lock()
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(config.OPENAI_TIMEOUT_S, connect=config.OPENAI_CONNECT_TIMEOUT_S)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=config.OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=config.OPENAI_MAX_KEEPALIVE,
+        keepalive_expiry=config.OPENAI_KEEPALIVE_EXPIRY_S,
+    )
+
+
+def get_async_client() -> AsyncOpenAI:
+    """Process-wide AsyncOpenAI client backed by one keep-alive connection pool."""
+    global _async_client
+    if _async_client is None:
+        with _lock:
+            if _async_client is None:
+                _async_client = AsyncOpenAI(
+                    api_key=config.OPENAI_API_KEY,
+                    base_url=config.OPENAI_BASE_URL,
+                    timeout=_timeout(),
+                    max_retries=0,  # retries are handled below with our own backoff
+                    http_client=httpx.AsyncClient(limits=_limits(), timeout=_timeout()),
+                )
+    return _async_client
+
+
+def get_sync_client() -> OpenAI:
+    """Process-wide synchronous client for scripts and non-async callers."""
+    global _sync_client
+    if _sync_client is None:
+        with _lock:
+            if _sync_client is None:
+                _sync_client = OpenAI(
+                    api_key=config.OPENAI_API_KEY,
+                    base_url=config.OPENAI_BASE_URL,
+                    timeout=_timeout(),
+                    max_retries=0,
+                    http_client=httpx.Client(limits=_limits(), timeout=_timeout()),
+                )
+    return _sync_client
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter for the given (0-based) retry attempt."""
+    ceiling = min(config.OPENAI_RETRY_MAX_BACKOFF_S, config.OPENAI_RETRY_BACKOFF_S * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+async def acreate_chat_completion(**kwargs: Any) -> Any:
+    client = get_async_client()
+    attempt = 0
+    while True:
+        try:
+            return await client.chat.completions.create(**kwargs)
+        except RETRYABLE_ERRORS:
+            if attempt >= config.OPENAI_MAX_RETRIES:
+                raise
+            await asyncio.sleep(backoff_delay(attempt))
+            attempt += 1
+
+
+def create_chat_completion(**kwargs: Any) -> Any:
+    client = get_sync_client()
+    attempt = 0
+    while True:
+        try:
+            return client.chat.completions.create(**kwargs)
+        except RETRYABLE_ERRORS:
+            if attempt >= config.OPENAI_MAX_RETRIES:
+                raise
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
+
+
+async def aclose() -> None:
+    """Close pooled connections (called on application shutdown)."""
+    global _async_client, _sync_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+    if _sync_client is not None:
+        _sync_client.close()
+        _sync_client = None
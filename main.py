@@ -1,17 +1,31 @@
-from typing import Optional, Dict, Any
-from fastapi import FastAPI, Body, UploadFile, File, Form
+from typing import Optional, Dict, Any, AsyncIterator
+import asyncio
+import json
+import orjson
+from fastapi import FastAPI, Body, UploadFile, File, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from uuid import uuid4
 
 # main.py: REEMPLAZA las líneas que tienen 'from ....' con esto
 import config
-from agents import AgentManager
+from agents import AgentManager, contains_fault_indicators
+from rag_module import get_pipeline
+from admission import admission_controller
+from answer_cache import answer_cache
+from singleflight import chat_flights
+import llm_client
+import db
 from vision_module import analyze_image
 from stt_module import transcribe_audio
-from sql_agent import search_failures
-from ml_faults import compute_trends # Asegúrate de que esta esté en la lista si la usas
-from .ml_faults import compute_trends
+from sql_agent import EXPORT_FORMATS, export_failures, search_failures
+from ml_faults import compute_trends
+from failures_import import FORMATS, import_upload
+import recurrence
+from integrations import transport as integration_transport
+import mro_sync
 
 
 app = FastAPI(title="AeroEngineer AI Brain V3")
@@ -22,10 +36,75 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Fault history pages and exports compress well; SSE responses are left alone by Starlette.
+app.add_middleware(GZipMiddleware, minimum_size=config.GZIP_MIN_BYTES)
 
 agent_manager = AgentManager()
 
 
+@app.on_event("startup")
+def init_failures_db() -> None:
+    # Run schema migrations and open the connection pool once, not per request.
+    db.init_db()
+
+
+@app.on_event("startup")
+def warm_up_rag() -> None:
+    # Build the shared pipeline (and load the embedding model) before the first chat.
+    get_pipeline().warm_up()
+
+
+async def _sweep_sessions_forever() -> None:
+    while True:
+        await asyncio.sleep(config.SESSION_SWEEP_INTERVAL_S)
+        try:
+            await asyncio.to_thread(agent_manager.sweep)
+        except Exception as e:
+            print(f"[SESSIONS] Sweep error: {e}")
+
+
+@app.on_event("startup")
+async def start_session_sweeper() -> None:
+    app.state.session_sweeper = asyncio.create_task(_sweep_sessions_forever())
+
+
+async def _refresh_recurrences_forever() -> None:
+    # Picks up edits and deletes made outside the import and sync paths (which refresh themselves).
+    while True:
+        await asyncio.sleep(config.RECURRENCE_REFRESH_INTERVAL_S)
+        try:
+            await asyncio.to_thread(recurrence.refresh)
+        except Exception as e:
+            print(f"[RECURRENCE] Refresh error: {e}")
+
+
+@app.on_event("startup")
+async def start_recurrence_refresher() -> None:
+    app.state.recurrence_refresher = asyncio.create_task(_refresh_recurrences_forever())
+
+
+@app.on_event("startup")
+async def start_mro_sync() -> None:
+    # Chat and fault search read the local mirror; only this task talks to the providers.
+    if mro_sync.companies():
+        app.state.mro_sync = asyncio.create_task(mro_sync.run_forever())
+
+
+@app.on_event("shutdown")
+async def close_llm_clients() -> None:
+    await llm_client.aclose()
+
+
+@app.on_event("shutdown")
+async def close_integration_pools() -> None:
+    await integration_transport.aclose()
+
+
+@app.on_event("shutdown")
+def close_failures_db() -> None:
+    db.close_db()
+
+
 class ChatRequest(BaseModel):
     pregunta: str
     modelo: Optional[str] = None
@@ -33,6 +112,9 @@ class ChatRequest(BaseModel):
     conversation_id: Optional[str] = None
     language: Optional[str] = "es"
     user_id: Optional[int] = None
+    # True: answer from the tenant's records only, never the LLM (so the domain check is not needed);
+    # None: AGENT_HISTORY_ONLY decides.
+    history_only: Optional[bool] = None
 
     company_id: Optional[int] = None
 
@@ -63,7 +145,7 @@ def is_aviation_question(question: str, modelo: Optional[str], ata: Optional[str
             return True
     if ata and ata.strip():
         return True
-    return any(kw in q for kw in AVIATION_KEYWORDS)
+    return any(kw in q for kw in AVIATION_KEYWORDS) or contains_fault_indicators(q)
 
 
 @app.get("/health")
@@ -71,25 +153,38 @@ def health() -> Dict[str, Any]:
     return {"status": "ok"}
 
 
-@app.post("/api/chat", response_model=ChatResponse)
-def chat_endpoint(payload: ChatRequest = Body(...)) -> ChatResponse:
-    correlation_id = str(uuid4())
+@app.get("/api/metrics")
+def metrics() -> Dict[str, Any]:
+    pipeline = get_pipeline()
+    return {
+        "sessions": agent_manager.stats(),
+        "rag": {
+            "embedding_cache": pipeline.embed_cache.stats(),
+            "result_cache": pipeline.result_cache.stats(),
+        },
+        "answer_cache": answer_cache.stats(),
+        "singleflight": chat_flights.stats(),
+        "admission": admission_controller.stats(),
+        "db_pool": db.stats(),
+        "integrations": integration_transport.stats(),
+        "mro_sync": mro_sync.stats(),
+    }
+
+
+def _out_of_domain_response(correlation_id: str) -> ChatResponse:
+    respuesta = "Out of aviation domain. Please rephrase.\n\n" + config.SAFETY_DISCLAIMER
+    return ChatResponse(
+        respuesta=respuesta,
+        fuentes=[],
+        confianza=0.0,
+        num_documentos=0,
+        tipo="out_of_domain",
+        correlation_id=correlation_id,
+        metadata={},
+    )
 
-    if not is_aviation_question(payload.pregunta, payload.modelo, payload.ata):
-        respuesta = "Out of aviation domain. Please rephrase.\n\n" + config.SAFETY_DISCLAIMER
-        return ChatResponse(
-            respuesta=respuesta,
-            fuentes=[],
-            confianza=0.0,
-            num_documentos=0,
-            tipo="out_of_domain",
-            correlation_id=correlation_id,
-            metadata={},
-        )
-
-    agent = agent_manager.get_agent(payload.company_id, payload.conversation_id)
-    result = agent.ask(payload.pregunta, payload.modelo, payload.ata)
 
+def _to_chat_response(result: Dict[str, Any], correlation_id: str) -> ChatResponse:
     fuentes = result.get("fuentes", [])
     confianza = float(result.get("confianza", 0.0))
     tipo = result.get("tipo", "ok")
@@ -106,6 +201,53 @@ def chat_endpoint(payload: ChatRequest = Body(...)) -> ChatResponse:
     )
 
 
+@app.post("/api/chat", response_model=ChatResponse)
+async def chat_endpoint(payload: ChatRequest = Body(...)) -> ChatResponse:
+    correlation_id = str(uuid4())
+
+    if not payload.history_only and not is_aviation_question(payload.pregunta, payload.modelo, payload.ata):
+        return _out_of_domain_response(correlation_id)
+
+    agent = await agent_manager.aget_agent(payload.company_id, payload.conversation_id)
+    result = await agent.aask(payload.pregunta, payload.modelo, payload.ata, payload.history_only)
+    return _to_chat_response(result, correlation_id)
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/api/chat/stream")
+async def chat_stream_endpoint(payload: ChatRequest = Body(...)) -> StreamingResponse:
+    """Server-sent events: ``sources`` first, then ``token`` deltas, then ``final``.
+
+    The ``final`` event carries a complete ChatResponse (including the full
+    ``respuesta`` with the safety disclaimer) so clients can replace the
+    streamed text with the canonical answer.
+    """
+    correlation_id = str(uuid4())
+
+    async def events() -> AsyncIterator[str]:
+        if not payload.history_only and not is_aviation_question(payload.pregunta, payload.modelo, payload.ata):
+            final = _out_of_domain_response(correlation_id).dict()
+            yield _sse("final", {**final, "disclaimer": config.SAFETY_DISCLAIMER})
+            return
+
+        agent = await agent_manager.aget_agent(payload.company_id, payload.conversation_id)
+        async for event, data in agent.astream(payload.pregunta, payload.modelo, payload.ata, payload.history_only):
+            if event == "final":
+                final = _to_chat_response(data, correlation_id).dict()
+                yield _sse("final", {**final, "disclaimer": config.SAFETY_DISCLAIMER})
+            else:
+                yield _sse(event, {**data, "correlation_id": correlation_id})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.post("/api/vision/analyze")
 async def vision_analyze(
     image: UploadFile = File(...),
@@ -133,14 +275,91 @@ def faults_search(
     aircraft: Optional[str] = None,
     ata: Optional[str] = None,
     fault_code: Optional[str] = None,
+    tail: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
 ):
-    filters = {"aircraft": aircraft, "ata": ata, "fault_code": fault_code}
-    result = search_failures(company_id, filters)
+    filters = {"aircraft": aircraft, "ata": ata, "fault_code": fault_code, "tail": tail}
+    try:
+        result = search_failures(company_id, filters, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     result["respuesta"] = result.get("respuesta", "") + "\n\n" + config.SAFETY_DISCLAIMER
-    return result
+    # Pages can hold FAULTS_PAGE_MAX rows: serialize with orjson, skip FastAPI's encoder.
+    return Response(orjson.dumps(result), media_type="application/json")
+
+
+@app.get("/api/faults/export")
+def faults_export(
+    company_id: int,
+    aircraft: Optional[str] = None,
+    ata: Optional[str] = None,
+    fault_code: Optional[str] = None,
+    tail: Optional[str] = None,
+    format: str = "ndjson",
+):
+    # Full history, streamed batch by batch from the keyset cursor.
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    filters = {"aircraft": aircraft, "ata": ata, "fault_code": fault_code, "tail": tail}
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_failures(company_id, filters, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="failures_{company_id}.{format}"'},
+    )
 
 
 @app.get("/api/faults/trends")
-def faults_trends(company_id: int):
-    data = compute_trends(company_id)
+def faults_trends(
+    company_id: int,
+    aircraft: Optional[str] = None,
+    ata: Optional[str] = None,
+    months: Optional[int] = None,
+    flight_hours: Optional[float] = None,
+):
+    # flight_hours: fleet flight hours per month, enables the per-1000 FH rates.
+    data = compute_trends(company_id, aircraft=aircraft, ata=ata, months=months, flight_hours=flight_hours)
     return data
+
+
+@app.get("/api/integrations/sync")
+def integrations_sync_status(company_id: Optional[int] = None):
+    # Mirror state per provider: cursor, local row counts, lag since the last successful sync.
+    return {"proveedores": mro_sync.status(company_id)}
+
+
+@app.post("/api/faults/import")
+def faults_import(
+    file: UploadFile = File(...),
+    company_id: int = Form(...),
+    source: Optional[str] = Form(None),
+    format: Optional[str] = Form(None),
+):
+    # Sync endpoint: the import runs in the threadpool and streams the upload from disk.
+    if format is not None and format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(FORMATS)}")
+    try:
+        return import_upload(file.file, file.filename or "upload", company_id, source=source, fmt=format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/faults/recurrences")
+def faults_recurrences(
+    company_id: int,
+    aircraft: Optional[str] = None,
+    tail: Optional[str] = None,
+    ata: Optional[str] = None,
+    fault_code: Optional[str] = None,
+    kind: Optional[str] = None,
+    since: Optional[str] = None,
+    limit: Optional[int] = None,
+):
+    filters = {"aircraft": aircraft, "tail": tail, "ata": ata, "fault_code": fault_code}
+    try:
+        result = recurrence.find_recurrences(company_id, filters, kind=kind, since=since, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    result["respuesta"] = result.get("respuesta", "") + "\n\n" + config.SAFETY_DISCLAIMER
+    return result
@@ -1,30 +1,184 @@
-from typing import Dict, Any
-import sqlite3
-import os
-from . import config
+"""Reliability trends from the monthly failure rollups (db migration 4).
 
+Only ``failure_rollup_monthly`` and ``failure_rollup_code_monthly`` are read, so
+a call costs O(aircraft x ATA x month buckets) for the tenant, not O(failures).
+Metrics are computed on month x ATA frames with pandas:
 
-def _get_conn() -> sqlite3.Connection:
-    os.makedirs(os.path.dirname(config.SQLITE_PATH), exist_ok=True)
-    conn = sqlite3.connect(config.SQLITE_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+- ``rolling_mean``: failures per month over the last ``TRENDS_ROLLING_MONTHS``;
+- ``mom_change``: month-over-month change (None when the previous month had none);
+- ``rate_per_1000_fh`` / ``rolling_rate_per_1000_fh``: when fleet flight hours
+  per month are given (one figure, or one per ``YYYY-MM``).
+"""
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Union
 
+import pandas as pd
 
-def compute_trends(company_id: int) -> Dict[str, Any]:
-    conn = _get_conn()
-    cur = conn.cursor()
+import config
+import db
+from aviation_codes import normalize_aircraft, normalize_ata
 
-    # Simple stats by ATA and aircraft
-    cur.execute("SELECT ata, COUNT(*) as count FROM failures WHERE company_id = ? GROUP BY ata", (company_id,))
-    by_ata = [dict(r) for r in cur.fetchall()]
+FlightHours = Union[float, Mapping[str, float], None]
 
-    cur.execute("SELECT aircraft, COUNT(*) as count FROM failures WHERE company_id = ? GROUP BY aircraft", (company_id,))
-    by_aircraft = [dict(r) for r in cur.fetchall()]
 
-    conn.close()
+def _bucket_filter(company_id: int, aircraft: Optional[str], ata: Optional[str]) -> Tuple[str, List[Any]]:
+    where = ["company_id = ?"]
+    params: List[Any] = [company_id]
+    if aircraft:
+        where.append("aircraft = ?")
+        params.append(normalize_aircraft(aircraft))
+    if ata:
+        where.append("ata = ?")
+        params.append(normalize_ata(ata))
+    return " AND ".join(where), params
 
-    return {
-        "by_ata": by_ata,
-        "by_aircraft": by_aircraft,
+
+def _flight_hours(flight_hours: FlightHours, index: pd.PeriodIndex) -> Optional[pd.Series]:
+    if flight_hours is None:
+        return None
+    if isinstance(flight_hours, Mapping):
+        hours = pd.Series({pd.Period(month, "M"): float(v) for month, v in flight_hours.items()}, dtype=float)
+        hours = hours.reindex(index)
+    else:
+        hours = pd.Series(float(flight_hours), index=index)
+    return hours.where(hours > 0)
+
+
+def _metrics(counts: pd.DataFrame, hours: Optional[pd.Series], window: int) -> Dict[str, pd.DataFrame]:
+    """Trend metrics for every column of a month-indexed count frame at once."""
+    previous = counts.shift(1)
+    metrics = {
+        "failures": counts,
+        "rolling_mean": counts.rolling(window, min_periods=1).mean(),
+        "mom_change": (counts - previous) / previous.where(previous > 0),
+    }
+    if hours is not None:
+        metrics["rate_per_1000_fh"] = counts.div(hours, axis=0) * 1000
+        rolling_hours = hours.rolling(window, min_periods=1).sum()
+        metrics["rolling_rate_per_1000_fh"] = counts.rolling(window, min_periods=1).sum().div(rolling_hours, axis=0) * 1000
+    return metrics
+
+
+def _value(v: Any) -> Optional[float]:
+    return None if pd.isna(v) else round(float(v), 4)
+
+
+def _row(metrics: Dict[str, pd.DataFrame], month: pd.Period, column: Any) -> Dict[str, Any]:
+    row = {name: _value(frame.at[month, column]) for name, frame in metrics.items()}
+    row["failures"] = int(metrics["failures"].at[month, column])
+    return row
+
+
+def compute_trends(
+    company_id: int,
+    aircraft: Optional[str] = None,
+    ata: Optional[str] = None,
+    months: Optional[int] = None,
+    flight_hours: FlightHours = None,
+) -> Dict[str, Any]:
+    """All-time counts plus monthly and per-ATA trends over the last ``months`` with data."""
+    months = max(1, months or config.TRENDS_MONTHS)
+    window = max(1, config.TRENDS_ROLLING_MONTHS)
+    where, params = _bucket_filter(company_id, aircraft, ata)
+
+    with db.connection() as conn:
+        buckets = pd.DataFrame(
+            conn.execute(
+                f"SELECT ata, month, SUM(failures) FROM failure_rollup_monthly WHERE {where} GROUP BY ata, month",
+                params,
+            ).fetchall(),
+            columns=["ata", "month", "failures"],
+        )
+        by_aircraft = [
+            {"aircraft": r[0], "count": r[1]}
+            for r in conn.execute(
+                f"SELECT aircraft, SUM(failures) FROM failure_rollup_monthly WHERE {where} GROUP BY aircraft "
+                "HAVING SUM(failures) > 0",
+                params,
+            ).fetchall()
+        ]
+
+        by_ata_totals = buckets.groupby("ata")["failures"].sum()
+        result: Dict[str, Any] = {
+            "by_ata": [{"ata": a, "count": int(n)} for a, n in by_ata_totals.items() if n > 0],
+            "by_aircraft": by_aircraft,
+            "monthly": [],
+            "ata_trends": [],
+            "top_fault_codes": [],
+            "window": None,
+        }
+        dated = buckets[buckets["month"] != ""]
+        if dated.empty or dated["failures"].sum() == 0:
+            return result
+
+        # The window ends at the latest month with data, so historical imports still show a trend.
+        end = pd.Period(dated.loc[dated["failures"] > 0, "month"].max(), "M")
+        shown = pd.period_range(end=end, periods=months, freq="M")
+        # Extra leading months so the first shown month has a full rolling window and a previous month.
+        index = pd.period_range(end=end, periods=months + window, freq="M")
+        start = str(index[0])
+
+        # Pick the top codes in SQL, then load only their monthly series.
+        top_codes = [r[0] for r in conn.execute(
+            f"SELECT fault_code FROM failure_rollup_code_monthly WHERE {where} AND month BETWEEN ? AND ? "
+            "GROUP BY fault_code HAVING SUM(failures) > 0 ORDER BY SUM(failures) DESC, fault_code LIMIT ?",
+            [*params, str(shown[0]), str(end), config.TRENDS_TOP_CODES],
+        ).fetchall()]
+        codes = pd.DataFrame(
+            conn.execute(
+                f"SELECT fault_code, month, SUM(failures) FROM failure_rollup_code_monthly "
+                f"WHERE {where} AND month BETWEEN ? AND ? AND fault_code IN ({', '.join('?' * len(top_codes))}) "
+                "GROUP BY fault_code, month",
+                [*params, start, str(end), *top_codes],
+            ).fetchall(),
+            columns=["fault_code", "month", "failures"],
+        )
+
+    dated = dated[dated["month"] >= start]
+    per_ata = dated.pivot_table(index="month", columns="ata", values="failures", aggfunc="sum", fill_value=0)
+    per_ata.index = pd.PeriodIndex(per_ata.index, freq="M")
+    per_ata = per_ata.reindex(index, fill_value=0)
+    hours = _flight_hours(flight_hours, index)
+
+    total = _metrics(per_ata.sum(axis=1).to_frame("all"), hours, window)
+    result["monthly"] = [
+        {"month": str(month), **_row(total, month, "all")}
+        for month in shown
+    ]
+
+    by_ata = _metrics(per_ata, hours, window)
+    in_window = per_ata.loc[shown].sum()
+    ata_trends = [
+        {
+            "ata": column,
+            "failures_in_window": int(in_window[column]),
+            **_row(by_ata, end, column),
+        }
+        for column in per_ata.columns
+        if in_window[column] > 0
+    ]
+    result["ata_trends"] = sorted(ata_trends, key=lambda t: t["rolling_mean"] or 0.0, reverse=True)
+
+    if not codes.empty:
+        per_code = codes.pivot_table(index="month", columns="fault_code", values="failures", aggfunc="sum", fill_value=0)
+        per_code.index = pd.PeriodIndex(per_code.index, freq="M")
+        per_code = per_code.reindex(index, fill_value=0)
+        code_metrics = _metrics(per_code, hours, window)
+        code_totals = per_code.loc[shown].sum()
+        result["top_fault_codes"] = [
+            {
+                "fault_code": code,
+                "failures_in_window": int(code_totals[code]),
+                "rolling_mean": _value(code_metrics["rolling_mean"].at[end, code]),
+                "mom_change": _value(code_metrics["mom_change"].at[end, code]),
+            }
+            for code in top_codes
+        ]
+
+    result["window"] = {
+        "from": str(shown[0]),
+        "to": str(end),
+        "months": months,
+        "rolling_months": window,
+        "flight_hours": flight_hours is not None,
     }
+    return result
@@ -0,0 +1,377 @@
+"""Local mirror of MRO provider defect history (AMOS, TRAX, CAMP, AVIATAR, airnavX).
+
+    python mro_sync.py --company 3                      # one delta pass over the enabled providers
+    python mro_sync.py --company 3 --provider AMOS --full
+    python mro_sync.py --status
+
+Chat, ``/api/faults/search`` and the trends read ``failures``, which this
+module keeps current for the tenants in ``MRO_SYNC_COMPANIES``; only the chat
+agent asks the enabled providers live, and only for tenants not mirrored here
+(``live_records``). Each (tenant, provider) pair follows the provider's change
+feed from the cursor kept in ``mro_sync_state``. Every page is upserted under
+the natural key of the provider's id (namespaced by source ``mro:<provider>``)
+and the cursor advances in the same transaction, so a crash costs at most one
+page. Edits that only touch text columns are written without touching the
+indexed ones, so they do not churn the rollups or force a recurrence recompute.
+
+A full resync replays the feed from the start, one page at a time, records the
+natural keys it sees in ``mro_sync_seen`` and, once it reaches the head,
+deletes this provider's rows the provider no longer has. An interrupted full
+resync resumes from its cursor. A lease in ``mro_sync_state`` keeps several
+workers from syncing the same pair at once.
+"""
+import argparse
+import asyncio
+import sqlite3
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import config
+import db
+import recurrence
+from failures_import import normalize_record
+from integrations import transport
+from integrations.airnavx_client import AirnavxClient
+from integrations.amos_client import AmosClient
+from integrations.aviatar_client import AviatarClient
+from integrations.base_client import BaseIntegrationClient
+from integrations.camp_client import CampClient
+from integrations.trax_client import TraxClient
+from integrations.transport import IntegrationError
+
+PROVIDERS = (AmosClient, TraxClient, CampClient, AviatarClient, AirnavxClient)
+
+# failures columns in normalize_record order (after company_id). Changes to the key columns feed the
+# indexes, rollups and recurrence flags; text-only edits are written without touching them.
+_ROW_COLUMNS = ("aircraft", "tail", "ata", "fault_code", "description", "corrective_action",
+                "failure_type", "occurrence_date", "reliability_rate")
+_KEY_COLUMNS = ("aircraft", "tail", "ata", "fault_code", "occurrence_date")
+_TEXT_COLUMNS = ("description", "corrective_action", "failure_type", "reliability_rate")
+
+_INSERT_SQL = """
+    INSERT INTO failures (
+        company_id, aircraft, tail, ata, fault_code, description, corrective_action,
+        failure_type, occurrence_date, reliability_rate, source, natural_key
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (company_id, natural_key) DO NOTHING
+"""
+_UPDATE_TEXT_SQL = (
+    f"UPDATE failures SET {', '.join(f'{c} = ?' for c in _TEXT_COLUMNS)} WHERE company_id = ? AND natural_key = ?"
+)
+_UPDATE_ALL_SQL = (
+    f"UPDATE failures SET {', '.join(f'{c} = ?' for c in _ROW_COLUMNS)} WHERE company_id = ? AND natural_key = ?"
+)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def source_name(provider: str) -> str:
+    """``failures.source`` of the rows mirrored from ``provider``."""
+    return f"mro:{provider}"
+
+
+def companies() -> List[int]:
+    return [int(c) for c in config.MRO_SYNC_COMPANIES.split(",") if c.strip()]
+
+
+def _claim(company_id: int, provider: str, full: bool) -> Optional[Tuple[Optional[str], str]]:
+    """Take the pair's lease; return ``(cursor, mode)`` or None if another worker holds it."""
+    now = time.time()
+    with db.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT OR IGNORE INTO mro_sync_state (company_id, provider) VALUES (?, ?)", (company_id, provider))
+            claimed = conn.execute(
+                "UPDATE mro_sync_state SET lease_until = ?, last_attempt_at = ? "
+                "WHERE company_id = ? AND provider = ? AND lease_until < ?",
+                (now + config.MRO_SYNC_LEASE_S, _now(), company_id, provider, now),
+            ).rowcount
+            if claimed and full:
+                conn.execute(
+                    "UPDATE mro_sync_state SET mode = 'full', cursor = NULL WHERE company_id = ? AND provider = ?",
+                    (company_id, provider),
+                )
+                conn.execute("DELETE FROM mro_sync_seen WHERE company_id = ? AND provider = ?", (company_id, provider))
+            state = conn.execute(
+                "SELECT cursor, mode FROM mro_sync_state WHERE company_id = ? AND provider = ?", (company_id, provider)
+            ).fetchone()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return (state["cursor"], state["mode"]) if claimed else None
+
+
+def _normalize(company_id: int, provider: str, defects: Iterable[Dict[str, Any]]) -> Tuple[Dict[str, tuple], int]:
+    """Failures rows by natural key (the last version of a defect in the page wins) and the rejected count."""
+    rows: Dict[str, tuple] = {}
+    rejected = 0
+    for defect in defects:
+        # The natural key namespaces the provider's id with the row source ("mro:<provider>").
+        raw = {"record_id": defect["id"], **defect} if defect.get("id") is not None else defect
+        row, _ = normalize_record(raw, company_id, source_name(provider))
+        if row is None:
+            rejected += 1
+        else:
+            rows[row[-1]] = row
+    return rows, rejected
+
+
+def live_records(company_id: int, provider: str, defects: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Provider defects as failures-shaped records (not stored), tagged ``live``, for the chat agent."""
+    rows, _ = _normalize(company_id, provider, defects)
+    columns = ("company_id", *_ROW_COLUMNS, "source")
+    return [{"id": None, **dict(zip(columns, row)), "live": provider} for row in rows.values()]
+
+
+def _apply_page(
+    company_id: int, provider: str, defects: List[Dict[str, Any]], next_cursor: Optional[str], mode: str
+) -> Dict[str, int]:
+    """Upsert one change-feed page and advance the cursor, in one transaction."""
+    rows, rejected = _normalize(company_id, provider, defects)
+    keys = list(rows)
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0, "rejected": rejected}
+    with db.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            existing = {
+                r[0]: tuple(r[1:])
+                for r in conn.execute(
+                    f"SELECT natural_key, {', '.join(_ROW_COLUMNS)} FROM failures "
+                    f"WHERE company_id = ? AND natural_key IN ({', '.join('?' * len(keys))})",
+                    [company_id, *keys],
+                ).fetchall()
+            } if keys else {}
+
+            inserts, text_updates, full_updates = [], [], []
+            for key, row in rows.items():
+                values = row[1:10]
+                old = existing.get(key)
+                if old is None:
+                    inserts.append(row)
+                elif old == values:
+                    counts["unchanged"] += 1
+                elif tuple(old[_ROW_COLUMNS.index(c)] for c in _KEY_COLUMNS) == tuple(
+                    values[_ROW_COLUMNS.index(c)] for c in _KEY_COLUMNS
+                ):
+                    text_updates.append((*(values[_ROW_COLUMNS.index(c)] for c in _TEXT_COLUMNS), company_id, key))
+                else:
+                    full_updates.append((*values, company_id, key))
+            counts["inserted"] = conn.executemany(_INSERT_SQL, inserts).rowcount if inserts else 0
+            if text_updates:
+                conn.executemany(_UPDATE_TEXT_SQL, text_updates)
+            if full_updates:
+                conn.executemany(_UPDATE_ALL_SQL, full_updates)
+            counts["updated"] = len(text_updates) + len(full_updates)
+
+            if mode == "full" and keys:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO mro_sync_seen (company_id, provider, natural_key) VALUES (?, ?, ?)",
+                    [(company_id, provider, key) for key in keys],
+                )
+            conn.execute(
+                """UPDATE mro_sync_state
+                   SET cursor = ?, rows_local = rows_local + ?, rows_inserted = rows_inserted + ?,
+                       rows_updated = rows_updated + ?, lease_until = ?
+                   WHERE company_id = ? AND provider = ?""",
+                (next_cursor, counts["inserted"], counts["inserted"], counts["updated"],
+                 time.time() + config.MRO_SYNC_LEASE_S, company_id, provider),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return counts
+
+
+def _complete(company_id: int, provider: str, mode: str, rows_changed: int) -> int:
+    """Close a successful run (sweeping rows a full resync did not see); return the rows deleted."""
+    deleted = 0
+    with db.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if mode == "full":
+                deleted = conn.execute(
+                    "DELETE FROM failures WHERE company_id = ? AND source = ? AND natural_key NOT IN "
+                    "(SELECT natural_key FROM mro_sync_seen WHERE company_id = ? AND provider = ?)",
+                    (company_id, source_name(provider), company_id, provider),
+                ).rowcount
+                conn.execute("DELETE FROM mro_sync_seen WHERE company_id = ? AND provider = ?", (company_id, provider))
+            conn.execute(
+                """UPDATE mro_sync_state
+                   SET mode = 'delta', rows_local = rows_local - ?, rows_deleted = rows_deleted + ?,
+                       rows_last_run = ?, last_success_at = ?, last_error = NULL, lease_until = 0
+                   WHERE company_id = ? AND provider = ?""",
+                (deleted, deleted, rows_changed + deleted, _now(), company_id, provider),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return deleted
+
+
+def _release(company_id: int, provider: str, error: Optional[str]) -> None:
+    """Give the lease back after a failed or partial run; the cursor (and a full resync) resume next time."""
+    with db.connection() as conn:
+        conn.execute(
+            "UPDATE mro_sync_state SET last_error = ?, lease_until = 0 WHERE company_id = ? AND provider = ?",
+            (error[:500] if error else None, company_id, provider),
+        )
+        conn.commit()
+
+
+async def sync_provider(client_cls: type, company_id: int, full: bool = False) -> Dict[str, Any]:
+    """Pull ``client_cls``'s changes for ``company_id`` up to the head of its feed.
+
+    At most ``MRO_SYNC_MAX_PAGES`` pages per call (status ``partial``), so a
+    large backlog or a fast-moving feed cannot monopolise a sync pass.
+    """
+    provider = client_cls.provider_name
+    stats: Dict[str, Any] = {
+        "company_id": company_id, "provider": provider, "status": "ok", "mode": "full" if full else "delta",
+        "pages": 0, "inserted": 0, "updated": 0, "unchanged": 0, "rejected": 0, "deleted": 0,
+    }
+    started = time.perf_counter()
+    state = await asyncio.to_thread(_claim, company_id, provider, full)
+    if state is None:
+        stats["status"] = "busy"
+        return stats
+    cursor, stats["mode"] = state
+    client: BaseIntegrationClient = client_cls(company_id)
+    try:
+        while True:
+            page = await client.get_defect_changes(cursor, config.MRO_SYNC_PAGE_SIZE, timeout=config.MRO_SYNC_PAGE_TIMEOUT_S)
+            if page["has_more"] and page["next_cursor"] == cursor:
+                raise IntegrationError(f"{provider}: change feed cursor did not advance past {cursor!r}")
+            counts = await asyncio.to_thread(
+                _apply_page, company_id, provider, page["defects"], page["next_cursor"], stats["mode"]
+            )
+            for name, n in counts.items():
+                stats[name] += n
+            stats["pages"] += 1
+            cursor = page["next_cursor"]
+            if not page["has_more"]:
+                break
+            if stats["pages"] >= config.MRO_SYNC_MAX_PAGES:
+                stats["status"] = "partial"
+                break
+        if stats["status"] == "partial":
+            await asyncio.to_thread(_release, company_id, provider, None)
+        else:
+            stats["deleted"] = await asyncio.to_thread(
+                _complete, company_id, provider, stats["mode"], stats["inserted"] + stats["updated"]
+            )
+    except (IntegrationError, sqlite3.Error) as e:
+        print(f"[MRO_SYNC] {provider} company {company_id}: {e}")
+        await asyncio.to_thread(_release, company_id, provider, str(e))
+        stats.update(status="error", error=str(e))
+    except asyncio.CancelledError:
+        # Off the loop like every other write; shielded so a second cancel cannot abandon the release.
+        await asyncio.shield(asyncio.to_thread(_release, company_id, provider, "cancelled"))
+        raise
+    stats["elapsed_s"] = round(time.perf_counter() - started, 2)
+    return stats
+
+
+async def sync_all(
+    company_ids: Optional[List[int]] = None, providers: Optional[List[str]] = None, full: bool = False
+) -> List[Dict[str, Any]]:
+    """Sync every enabled (tenant, provider) pair, ``MRO_SYNC_CONCURRENCY`` at a time."""
+    wanted = {p.upper() for p in providers} if providers else None
+    pairs = [
+        (client_cls, company_id)
+        for company_id in (company_ids if company_ids is not None else companies())
+        for client_cls in PROVIDERS
+        if (wanted is None or client_cls.provider_name in wanted) and client_cls.is_enabled(company_id)
+    ]
+    semaphore = asyncio.Semaphore(max(1, config.MRO_SYNC_CONCURRENCY))
+
+    async def run(client_cls: type, company_id: int) -> Dict[str, Any]:
+        async with semaphore:
+            return await sync_provider(client_cls, company_id, full)
+
+    results = await asyncio.gather(*(run(c, company_id) for c, company_id in pairs))
+    if any(r["inserted"] or r["updated"] or r["deleted"] for r in results):
+        await asyncio.to_thread(recurrence.refresh)
+    return list(results)
+
+
+async def run_forever() -> None:
+    """Background scheduler: one delta pass every ``MRO_SYNC_INTERVAL_S``."""
+    while True:
+        try:
+            for result in await sync_all():
+                if result["status"] == "ok" and (result["inserted"] or result["updated"] or result["deleted"]):
+                    print(
+                        f"[MRO_SYNC] {result['provider']} company {result['company_id']}: "
+                        f"{result['inserted']} new, {result['updated']} updated, {result['deleted']} deleted"
+                    )
+        except Exception as e:
+            print(f"[MRO_SYNC] Sync pass failed: {e}")
+        await asyncio.sleep(config.MRO_SYNC_INTERVAL_S)
+
+
+def _lag_s(last_success_at: Optional[str]) -> Optional[float]:
+    if not last_success_at:
+        return None
+    return round((datetime.now(timezone.utc) - datetime.fromisoformat(last_success_at)).total_seconds(), 1)
+
+
+def status(company_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Per (tenant, provider): cursor, row counts, lag since the last successful sync, last error."""
+    where, params = ("WHERE company_id = ?", [company_id]) if company_id is not None else ("", [])
+    with db.connection() as conn:
+        rows = conn.execute(f"SELECT * FROM mro_sync_state {where} ORDER BY company_id, provider", params).fetchall()
+    now = time.time()
+    return [
+        {
+            **{k: row[k] for k in row.keys() if k != "lease_until"},
+            "lag_s": _lag_s(row["last_success_at"]),
+            "syncing": row["lease_until"] > now,
+        }
+        for row in rows
+    ]
+
+
+def stats() -> Dict[str, Any]:
+    """Per provider: tenants mirrored, local rows, worst lag and pairs whose last run failed."""
+    summary: Dict[str, Any] = {}
+    for row in status():
+        entry = summary.setdefault(row["provider"], {"tenants": 0, "rows_local": 0, "max_lag_s": None, "failing": 0})
+        entry["tenants"] += 1
+        entry["rows_local"] += row["rows_local"]
+        if row["lag_s"] is not None:
+            entry["max_lag_s"] = max(entry["max_lag_s"] or 0.0, row["lag_s"])
+        entry["failing"] += 1 if row["last_error"] else 0
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mirror MRO provider defects into the failures table.")
+    parser.add_argument("--company", type=int, action="append", help="Tenant id (repeatable; default MRO_SYNC_COMPANIES)")
+    parser.add_argument("--provider", action="append", help="Provider name, e.g. AMOS (repeatable; default all enabled)")
+    parser.add_argument("--full", action="store_true", help="Replay the whole feed and delete rows the provider dropped")
+    parser.add_argument("--status", action="store_true", help="Print the sync state and exit")
+    args = parser.parse_args()
+
+    if args.status:
+        for row in status(args.company[0] if args.company else None):
+            print(row)
+        return
+
+    async def run() -> List[Dict[str, Any]]:
+        try:
+            return await sync_all(args.company, args.provider, args.full)
+        finally:
+            await transport.aclose()
+
+    for result in asyncio.run(run()):
+        print(result)
+
+
+if __name__ == "__main__":
+    main()
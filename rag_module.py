@@ -1,65 +1,347 @@
-"""RAG module using ChromaDB for aviation documents."""
-from typing import List, Dict, Any, Optional
+"""RAG module for aviation documents (vector store selected by VECTOR_BACKEND)."""
+from typing import Callable, List, Dict, Any, Optional, Tuple
 import os
+import threading
+import time
 from pathlib import Path
 
-import chromadb
-from chromadb.config import Settings
+import numpy as np
+from chromadb.utils import embedding_functions
 
-# Initialize ChromaDB with persistent storage
-DB_PATH = Path(__file__).parent.parent / "data" / "chromadb"
-DB_PATH.mkdir(parents=True, exist_ok=True)
+import config
+from answer_cache import answer_cache
+from aviation_codes import normalize_aircraft, normalize_ata
+from batch_ingest import BatchIngestor
+from cache_utils import TTLCache, normalize_question
+from chunking import chunk_text
+from ingest_manifest import FileChange, IngestManifest, make_chunk_id
+from lexical_index import LexicalIndex
+from rerank import rerank
+from vector_store import VectorBackend, VectorCollection, get_vector_backend
 
-client = chromadb.PersistentClient(path=str(DB_PATH))
+# Local data: vector store files (data/chromadb, data/vectors, ...) and the lexical index
+DATA_DIR = Path(__file__).parent.parent / "data"
+DATA_DIR.mkdir(parents=True, exist_ok=True)
+# Per-tenant ingestion manifests; kept with the data they describe, not relative to the working directory.
+MANIFEST_DIR = Path(config.INGEST_MANIFEST_DIR) if config.INGEST_MANIFEST_DIR else DATA_DIR / "ingest_manifests"
+
+# Same model Chroma uses by default; held explicitly so query embeddings can be cached.
+embedding_fn = embedding_functions.DefaultEmbeddingFunction()
+
+_backend: Optional[VectorBackend] = None
+_backend_lock = threading.Lock()
 
-def get_or_create_collection(name: str = "aerobrain_docs"):
-    """Get or create a ChromaDB collection."""
-    return client.get_or_create_collection(
-        name=name,
-        metadata={"description": "Aviation documents for AeroEngineer AI Brain"}
-    )
+
+def get_backend() -> VectorBackend:
+    """Process-wide vector backend, opened on first use."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = get_vector_backend(DATA_DIR, embedding_fn)
+    return _backend
+
+# company_id of the shared public documents (MMELs, regulations, HF handbooks).
+PUBLIC_COMPANY_ID = "0"
+_RELOAD_CHECK_S = 5.0  # how often tenants without a collection are looked up again
+# aircraft_model values that apply to every fleet.
+FLEET_WIDE_AIRCRAFT = ("", "COMMON")
+
+
+def filter_values(
+    company_id: Optional[int],
+    aircraft_model: Optional[str],
+    ata_chapter: Optional[str],
+    tenant_filter: bool = True,
+) -> Dict[str, List[str]]:
+    """Allowed metadata values, per field, for one tenant's view of the corpus.
+    
+    A tenant sees its own documents plus the public ones (anonymous callers
+    only the public ones). Documents without an aircraft or ATA chapter are
+    general and stay eligible when those filters are set.
+    """
+    values: Dict[str, List[str]] = {}
+    if tenant_filter:
+        values["company_id"] = sorted({PUBLIC_COMPANY_ID, *([] if company_id is None else [str(company_id)])})
+    aircraft = normalize_aircraft(aircraft_model)
+    if aircraft:
+        values["aircraft_model"] = [aircraft, *FLEET_WIDE_AIRCRAFT]
+    ata = normalize_ata(ata_chapter)
+    if ata:
+        values["ata_chapter"] = [ata, ""]
+    return values
 
 
 class RAGPipeline:
-    """ChromaDB-based RAG for aviation documents."""
+    """Vector + lexical retrieval over aviation documents.
     
-    def __init__(self, collection: str = "aerobrain_docs"):
-        self.collection = get_or_create_collection(collection)
+    In ``shared`` partition mode all tenants live in one collection and are
+    separated by a metadata filter. In ``tenant`` mode each tenant gets its own
+    collection (``<name>__c<company_id>``) and a query only searches the
+    tenant's collection and the public one, so its cost follows the size of
+    that tenant's corpus rather than the whole platform's.
+    """
     
-    def ingest_document(self, chunks: List[Dict[str, Any]]) -> None:
-        """Ingest document chunks into ChromaDB."""
-        if not chunks:
-            return
+    def __init__(self, collection: str = "aerobrain_docs", partition: Optional[str] = None, backend: Optional[VectorBackend] = None):
+        self.name = collection
+        self.partition = (partition or config.RAG_PARTITION_MODE).lower()
+        if self.partition not in ("shared", "tenant"):
+            raise ValueError(f"Unknown RAG_PARTITION_MODE: {self.partition}")
+        self.backend = backend or get_backend()
+        self._collections: Dict[str, VectorCollection] = {}
+        self._collections_lock = threading.Lock()
+        # Tenants found without a collection; one appearing later (another process ingested) bumps its version.
+        self._missing: set = set()
+        self._last_missing_check = 0.0
+        # Shared mode: the only collection. Tenant mode: the public partition.
+        self.collection = self._collection_for(PUBLIC_COMPANY_ID)
+        # Bumped on every upsert; cached results from older versions are never served.
+        self.version = 0
+        # Per-tenant counters ("0" = shared public docs) for tenant-scoped caches.
+        self.tenant_versions: Dict[str, int] = {}
+        self._version_lock = threading.Lock()
+        self.embed_cache = TTLCache(config.RAG_EMBED_CACHE_MAX_ENTRIES, config.RAG_EMBED_CACHE_TTL_S)
+        self.result_cache = TTLCache(config.RAG_CACHE_MAX_ENTRIES, config.RAG_CACHE_TTL_S)
+        # BM25 side index over the same chunks, persisted next to the vector data.
+        self.lexical = LexicalIndex(DATA_DIR / "lexical" / f"{collection}.bm25") if config.RAG_HYBRID_ENABLED else None
+    
+    def _bump_version(self, company_ids: Optional[set] = None) -> None:
+        with self._version_lock:
+            self.version += 1
+            for cid in company_ids or ():
+                self.tenant_versions[cid] = self.tenant_versions.get(cid, 0) + 1
+        self.result_cache.clear()
+        # Stale answers would never be served again (their corpus version no longer
+        # matches); drop them now instead of letting them hold cache slots until the TTL.
+        for cid in company_ids or ():
+            if cid == PUBLIC_COMPANY_ID:
+                answer_cache.clear()
+            else:
+                answer_cache.invalidate_company(int(cid))
+    
+    def _sync_reloads(self) -> None:
+        """Invalidate cached results for data another process (an ingestion run) flushed to disk.
+
+        The stores reload such data on their own; this maps what was reloaded to
+        the tenants whose version must move. A shared collection or the lexical
+        index may hold any tenant, so those bump the public version, which is
+        part of every tenant's ``corpus_version``.
+        """
+        now = time.monotonic()
+        if self._missing and now - self._last_missing_check >= _RELOAD_CHECK_S:
+            self._last_missing_check = now
+            for company_id in list(self._missing):
+                self._existing_collection(company_id)
+        changed = set()
+        if self.lexical is not None and self.lexical.maybe_reload():
+            changed.add(PUBLIC_COMPANY_ID)
+        prefix = f"{self.name}__c"
+        for name, coll in list(self._collections.items()):
+            if coll.maybe_reload():
+                changed.add(name[len(prefix):] if self.partition == "tenant" else PUBLIC_COMPANY_ID)
+        if changed:
+            print(f"[RAG] Reloaded data written by another process (tenants: {', '.join(sorted(changed))})")
+            self._bump_version(changed)
+    
+    def corpus_version(self, company_id: Optional[int]) -> tuple:
+        """Changes whenever the tenant's own or the shared public documents change."""
+        self._sync_reloads()
+        return (self.tenant_versions.get(str(company_id), 0), self.tenant_versions.get("0", 0))
+    
+    def _partition_name(self, company_id: str) -> str:
+        return self.name if self.partition == "shared" else f"{self.name}__c{company_id}"
+    
+    def _collection_for(self, company_id: str) -> VectorCollection:
+        """Collection holding ``company_id``'s chunks, created on first write."""
+        name = self._partition_name(company_id)
+        coll = self._collections.get(name)
+        if coll is None:
+            with self._collections_lock:
+                coll = self._collections.get(name)
+                if coll is None:
+                    coll = self.backend.open(name)
+                    self._collections[name] = coll
+        return coll
+    
+    def _existing_collection(self, company_id: str) -> Optional[VectorCollection]:
+        """Like ``_collection_for`` but None for a tenant that has never ingested anything."""
+        name = self._partition_name(company_id)
+        coll = self._collections.get(name)
+        if coll is not None:
+            return coll
+        coll = self.backend.open(name, create=False)
+        if coll is None:
+            self._missing.add(company_id)
+            return None
+        with self._collections_lock:
+            coll = self._collections.setdefault(name, coll)
+        if company_id in self._missing:
+            self._missing.discard(company_id)
+            self._bump_version({company_id})
+        return coll
+    
+    def _partitions(self) -> List[VectorCollection]:
+        if self.partition == "shared":
+            return [self.collection]
+        prefix = f"{self.name}__c"
+        names = self.backend.list_collections()
+        return [self._collection_for(n[len(prefix):]) for n in names if n.startswith(prefix)]
+    
+    def _search_targets(
+        self, company_id: Optional[int], aircraft_model: Optional[str], ata_chapter: Optional[str]
+    ) -> List[Tuple[VectorCollection, Dict[str, List[str]]]]:
+        """``(collection, filters)`` pairs to search for one tenant."""
+        if self.partition == "shared":
+            return [(self.collection, filter_values(company_id, aircraft_model, ata_chapter))]
+        where = filter_values(company_id, aircraft_model, ata_chapter, tenant_filter=False)
+        tenants = [PUBLIC_COMPANY_ID] if company_id is None else sorted({str(company_id), PUBLIC_COMPANY_ID})
+        targets = []
+        for tenant in tenants:
+            coll = self._existing_collection(tenant)
+            if coll is not None:
+                targets.append((coll, where))
+        return targets
+    
+    def warm_up(self) -> None:
+        """Load the embedding model and open the collection before the first request."""
+        try:
+            self.embed_query("aircraft maintenance warm-up")
+            if self.collection.count() and self.lexical is not None and not len(self.lexical):
+                self.rebuild_lexical_index()
+        except Exception as e:
+            print(f"[RAG] Warm-up error: {e}")
+    
+    def rebuild_lexical_index(self, page_size: int = 1000) -> int:
+        """Rebuild the BM25 index from the vector store (e.g. for data ingested before it existed)."""
+        if self.lexical is None:
+            return 0
+        self.lexical.clear()
+        for coll in self._partitions():
+            for page in coll.scan(page_size):
+                self.lexical.add([h.id for h in page], [h.document for h in page], [h.metadata for h in page])
+        self.lexical.save()
+        print(f"[RAG] Rebuilt lexical index: {len(self.lexical)} chunks")
+        return len(self.lexical)
+    
+    def persist(self) -> None:
+        """Flush the vector store and the lexical index; call at the end of an ingestion run."""
+        for coll in list(self._collections.values()):
+            coll.flush()
+        if self.lexical is not None and self.lexical.dirty:
+            self.lexical.save()
+    
+    def embed_query(self, question: str) -> List[float]:
+        """Embed a question, reusing the cached vector for repeated questions."""
+        text = " ".join((question or "").split())
+        key = text.lower()
+        cached = self.embed_cache.get(key)
+        if cached is not None:
+            return cached
+        vector = [float(x) for x in embedding_fn([text])[0]]
+        self.embed_cache.set(key, vector)
+        return vector
+    
+    @staticmethod
+    def prepare_chunks(chunks: List[Dict[str, Any]]) -> tuple:
+        """Turn chunk dicts into ``(ids, documents, metadatas)`` ready for upsert.
         
+        Ids are derived from tenant, source path and chunk content, so
+        re-ingesting an unchanged chunk overwrites it instead of duplicating it.
+        """
         documents = []
         metadatas = []
         ids = []
+        occurrences: Dict[tuple, int] = {}
         
-        for i, chunk in enumerate(chunks):
+        for chunk in chunks:
             content = chunk.get("content", "")
             if not content.strip():
                 continue
-                
-            doc_id = f"{chunk.get('doc_title', 'doc')}_{chunk.get('aircraft_model', 'unknown')}_{i}"
+            
+            doc_id = chunk.get("chunk_id")
+            if not doc_id:
+                dup_key = (chunk.get("source_path", ""), content)
+                occurrence = occurrences.get(dup_key, 0)
+                occurrences[dup_key] = occurrence + 1
+                doc_id = make_chunk_id(chunk.get("company_id", 0), chunk.get("source_path", ""), content, occurrence)
             
             documents.append(content)
-            metadatas.append({
+            metadata = {
                 "company_id": str(chunk.get("company_id", 0)),
-                "aircraft_model": chunk.get("aircraft_model", ""),
-                "ata_chapter": chunk.get("ata_chapter", ""),
+                "aircraft_model": normalize_aircraft(chunk.get("aircraft_model")),
+                "ata_chapter": normalize_ata(chunk.get("ata_chapter")),
                 "doc_type": chunk.get("doc_type", ""),
                 "source_path": chunk.get("source_path", ""),
                 "doc_title": chunk.get("doc_title", ""),
-            })
+            }
+            # Optional positional metadata from the chunker (Chroma rejects None values).
+            for key in ("page_start", "page_end", "section", "chunk_index"):
+                if chunk.get(key) is not None:
+                    metadata[key] = chunk[key]
+            metadatas.append(metadata)
             ids.append(doc_id)
-        
-        if documents:
-            # Upsert to handle duplicates
-            self.collection.upsert(
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
+        return ids, documents, metadatas
+    
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents in EMBED_BATCH_SIZE batches."""
+        vectors: List[List[float]] = []
+        for start in range(0, len(texts), config.EMBED_BATCH_SIZE):
+            vectors.extend(embedding_fn(texts[start:start + config.EMBED_BATCH_SIZE]))
+        return vectors
+    
+    def upsert_prepared(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+        embeddings: Optional[List[List[float]]] = None,
+    ) -> None:
+        """Write one batch of prepared chunks (embedding them first if needed)."""
+        if not ids:
+            return
+        if embeddings is None:
+            embeddings = self.embed_texts(documents)
+        # Group by partition (a single group in shared mode); upsert handles duplicates.
+        groups: Dict[str, List[int]] = {}
+        for i, meta in enumerate(metadatas):
+            groups.setdefault(self._partition_name(meta["company_id"]), []).append(i)
+        for rows in groups.values():
+            self._collection_for(metadatas[rows[0]]["company_id"]).upsert(
+                [ids[i] for i in rows],
+                [embeddings[i] for i in rows],
+                [documents[i] for i in rows],
+                [metadatas[i] for i in rows],
             )
+        if self.lexical is not None:
+            self.lexical.add(ids, documents, metadatas)
+        self._bump_version({m["company_id"] for m in metadatas})
+    
+    def ingest_document(self, chunks: List[Dict[str, Any]]) -> List[str]:
+        """Ingest document chunks, persist them and return their ids."""
+        if not chunks:
+            return []
+        ids, documents, metadatas = self.prepare_chunks(chunks)
+        self.upsert_prepared(ids, documents, metadatas)
+        self.persist()
+        return ids
+    
+    def delete_chunks(self, ids: List[str], company_id: Optional[int] = None) -> None:
+        """Remove chunks by id (e.g. those of a changed or deleted source file)."""
+        ids = list(ids)
+        if not ids:
+            return
+        if self.partition == "shared":
+            collections = [self.collection]
+        elif company_id is not None:
+            collections = [self._collection_for(str(company_id))]
+        else:
+            collections = self._partitions()
+        for coll in collections:
+            for start in range(0, len(ids), 1000):
+                coll.delete(ids[start:start + 1000])
+        if self.lexical is not None:
+            self.lexical.remove(ids)
+        self._bump_version({str(company_id)} if company_id is not None else None)
     
     def query(
         self,
@@ -71,53 +353,158 @@ class RAGPipeline:
     ) -> Dict[str, Any]:
         """Query the vector store."""
         
-        # Build where filter
-        where_filter = None
-        if aircraft_model:
-            # Match aircraft model (case insensitive matching done via contains)
-            aircraft_upper = aircraft_model.upper()
-            where_filter = {"aircraft_model": {"$eq": aircraft_upper}}
+        self._sync_reloads()
+        cache_key = (
+            self.version,
+            normalize_question(question),
+            company_id,
+            normalize_aircraft(aircraft_model),
+            normalize_ata(ata_chapter),
+            top_k,
+        )
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            return _copy_result(cached)
         
         try:
-            results = self.collection.query(
-                query_texts=[question],
-                n_results=top_k,
-                where=where_filter if where_filter else None,
-            )
+            result = self.search(self.embed_query(question), company_id, aircraft_model, ata_chapter, top_k, question)
         except Exception as e:
             print(f"[RAG] Query error: {e}")
             return {"fuentes": [], "confianza": 0.0}
         
+        self.result_cache.set(cache_key, result)
+        return _copy_result(result)
+    
+    def search(
+        self,
+        embedding: List[float],
+        company_id: Optional[int],
+        aircraft_model: Optional[str],
+        ata_chapter: Optional[str],
+        top_k: int = 5,
+        question: str = "",
+    ) -> Dict[str, Any]:
+        """Filtered nearest-neighbour search for a precomputed query embedding (uncached).
+        
+        With ``question`` and hybrid retrieval enabled, BM25 hits for the
+        question are fused with the vector hits by reciprocal rank fusion.
+        With re-ranking enabled, ``RAG_RERANK_CANDIDATES`` are fetched and the
+        rerank stage picks the final ``top_k``.
+        """
+        hybrid = bool(question) and self.lexical is not None
+        n_pool = max(top_k, config.RAG_RERANK_CANDIDATES) if config.RAG_RERANK_ENABLED else top_k
+        n_candidates = max(n_pool, config.RAG_HYBRID_CANDIDATES) if hybrid else n_pool
+        
+        # chunk_id -> (distance, document, metadata, embedding or None)
+        hits: Dict[str, tuple] = {}
+        for coll, filters in self._search_targets(company_id, aircraft_model, ata_chapter):
+            for hit in coll.query(embedding, n_candidates, filters, with_embeddings=config.RAG_RERANK_ENABLED):
+                hits[hit.id] = (hit.distance, hit.document, hit.metadata or {}, hit.embedding)
+        # Tenant mode searches two partitions; rank across both.
+        vector_ranked = sorted(hits, key=lambda chunk_id: hits[chunk_id][0])
+        
+        if hybrid:
+            lexical_ranked = [chunk_id for chunk_id, _ in self.lexical.search(
+                question, n_candidates, filter_values(company_id, aircraft_model, ata_chapter)
+            )]
+            matched = {chunk_id: ("both" if chunk_id in hits else "lexical") for chunk_id in lexical_ranked}
+            ranked = self._fuse(vector_ranked, lexical_ranked)[:n_pool]
+            self._fetch_missing([chunk_id for chunk_id in ranked if chunk_id not in hits], embedding, hits)
+            ranked = [chunk_id for chunk_id in ranked if chunk_id in hits]
+        else:
+            ranked = vector_ranked[:n_pool]
+            matched = {}
+        
         fuentes = []
-        total_score = 0.0
+        for chunk_id in ranked:
+            dist, doc, meta, _ = hits[chunk_id]
+            # Backends return squared L2 between unit vectors; convert to similarity score
+            # Lower distance = higher similarity
+            score = max(0, 1 - (dist / 2))
+            fuentes.append({
+                "content": doc,
+                "doc_title": meta.get("doc_title", "Unknown"),
+                "aircraft_model": meta.get("aircraft_model", ""),
+                "doc_type": meta.get("doc_type", ""),
+                "ata_chapter": meta.get("ata_chapter", ""),
+                "source_path": meta.get("source_path", ""),
+                "page_start": meta.get("page_start"),
+                "page_end": meta.get("page_end"),
+                "score": round(score, 3),
+                "match": matched.get(chunk_id, "vector"),
+            })
         
-        if results and results.get("documents") and results["documents"][0]:
-            docs = results["documents"][0]
-            metas = results["metadatas"][0] if results.get("metadatas") else [{}] * len(docs)
-            distances = results["distances"][0] if results.get("distances") else [1.0] * len(docs)
-            
-            for doc, meta, dist in zip(docs, metas, distances):
-                # ChromaDB returns L2 distance, convert to similarity score
-                # Lower distance = higher similarity
-                score = max(0, 1 - (dist / 2))
-                total_score += score
-                
-                fuentes.append({
-                    "content": doc,
-                    "doc_title": meta.get("doc_title", "Unknown"),
-                    "aircraft_model": meta.get("aircraft_model", ""),
-                    "doc_type": meta.get("doc_type", ""),
-                    "source_path": meta.get("source_path", ""),
-                    "score": round(score, 3)
-                })
+        report = None
+        if config.RAG_RERANK_ENABLED:
+            fuentes, report = rerank(
+                fuentes,
+                [hits[chunk_id][3] for chunk_id in ranked],
+                normalize_aircraft(aircraft_model),
+                normalize_ata(ata_chapter),
+                top_k,
+            )
         
         # Calculate average confidence
-        confianza = (total_score / len(fuentes)) if fuentes else 0.0
+        confianza = (sum(f["score"] for f in fuentes) / len(fuentes)) if fuentes else 0.0
         
-        return {
+        result = {
             "fuentes": fuentes,
             "confianza": round(confianza, 3)
         }
+        if report is not None:
+            result["rerank"] = report
+        return result
+    
+    @staticmethod
+    def _fuse(*rankings: List[str]) -> List[str]:
+        """Reciprocal rank fusion: sum of 1 / (RAG_RRF_K + rank) over the rankings."""
+        fused: Dict[str, float] = {}
+        for ranking in rankings:
+            for rank, chunk_id in enumerate(ranking, 1):
+                fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (config.RAG_RRF_K + rank)
+        return sorted(fused, key=fused.get, reverse=True)
+    
+    def _fetch_missing(self, ids: List[str], embedding: List[float], hits: Dict[str, tuple]) -> None:
+        """Load lexical-only hits from the vector store and score them like the vector search does."""
+        if not ids:
+            return
+        by_tenant: Dict[str, List[str]] = {}
+        for chunk_id in ids:
+            meta = self.lexical.meta(chunk_id) or {}
+            by_tenant.setdefault(meta.get("company_id", PUBLIC_COMPANY_ID), []).append(chunk_id)
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        for tenant, tenant_ids in by_tenant.items():
+            coll = self._existing_collection(tenant)
+            if coll is None:
+                continue
+            for hit in coll.get(tenant_ids, with_embeddings=True):
+                vector = np.asarray(hit.embedding, dtype=np.float32)
+                # 2 - 2*cos: squared L2 between unit vectors, as every backend reports.
+                dist = float(2.0 - 2.0 * (vector @ query) / (np.linalg.norm(vector) or 1.0))
+                hits[hit.id] = (dist, hit.document, hit.metadata or {}, hit.embedding)
+
+
+def _copy_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Hand out copies so callers cannot mutate cached entries."""
+    return {**result, "fuentes": [dict(f) for f in result.get("fuentes", [])]}
+
+
+_pipelines: Dict[str, RAGPipeline] = {}
+_pipelines_lock = threading.Lock()
+
+
+def get_pipeline(collection: Optional[str] = None) -> RAGPipeline:
+    """Return the process-wide pipeline for a collection, creating it once."""
+    name = collection or (config.QDRANT_COLLECTION if config.VECTOR_BACKEND.lower() == "qdrant" else config.RAG_COLLECTION)
+    pipeline = _pipelines.get(name)
+    if pipeline is None:
+        with _pipelines_lock:
+            pipeline = _pipelines.get(name)
+            if pipeline is None:
+                pipeline = RAGPipeline(collection=name)
+                _pipelines[name] = pipeline
+    return pipeline
 
 
 def query_rag(
@@ -127,63 +514,98 @@ def query_rag(
     ata_chapter: Optional[str]
 ) -> Dict[str, Any]:
     """Entry point used by the agent."""
-    pipeline = RAGPipeline(collection="aerobrain_docs")
-    return pipeline.query(question, company_id, aircraft_model, ata_chapter, top_k=5)
+    pipeline = get_pipeline()
+    return pipeline.query(question, company_id, aircraft_model, ata_chapter, top_k=config.RAG_TOP_K)
 
 
-def ingest_markdown_folder(folder_path: str, aircraft_model: str = "", company_id: int = 1) -> int:
-    """Ingest all markdown files from a folder into RAG."""
-    pipeline = RAGPipeline()
+def _markdown_meta(md_file: Path, aircraft_model: str, company_id: int) -> Dict[str, Any]:
+    # Determine aircraft from parent folder name if not specified
+    detected_aircraft = aircraft_model
+    parent_name = md_file.parent.name.upper()
+    if not detected_aircraft:
+        if "737MAX" in parent_name or "B737MAX" in parent_name:
+            detected_aircraft = "B737MAX"
+        elif "737NG" in parent_name or "B737NG" in parent_name:
+            detected_aircraft = "B737NG"
+        elif "767" in parent_name:
+            detected_aircraft = "B767"
+        elif "777" in parent_name:
+            detected_aircraft = "B777"
+        elif "787" in parent_name:
+            detected_aircraft = "B787"
+        elif "COMMON" in parent_name:
+            detected_aircraft = "COMMON"
+    
+    # Determine doc type from filename
+    filename = md_file.stem.lower()
+    if "translator" in filename:
+        doc_type = "TRANSLATOR"
+    elif "few_shot" in filename:
+        doc_type = "FEW_SHOT"
+    elif "acronym" in filename:
+        doc_type = "ACRONYMS"
+    else:
+        doc_type = "REFERENCE"
+    
+    return {
+        "company_id": company_id,
+        "aircraft_model": detected_aircraft,
+        "doc_type": doc_type,
+        "source_path": str(md_file),
+        "doc_title": md_file.stem,
+    }
+
+
+def ingest_markdown_folder(folder_path: str, aircraft_model: str = "", company_id: int = 1, full: bool = False) -> int:
+    """Ingest new or changed markdown files from a folder into RAG.
+    
+    Files listed in the tenant's manifest with unchanged content are skipped;
+    chunks of changed or deleted files are removed. Returns the number of
+    files (re)ingested. ``full=True`` re-ingests everything.
+    """
+    pipeline = get_pipeline()
+    manifest = IngestManifest(company_id, MANIFEST_DIR)
     count = 0
     
     folder = Path(folder_path)
-    for md_file in folder.rglob("*.md"):
-        try:
-            content = md_file.read_text(encoding="utf-8")
-            
-            # Determine aircraft from parent folder name if not specified
-            detected_aircraft = aircraft_model
-            parent_name = md_file.parent.name.upper()
-            if not detected_aircraft:
-                if "737MAX" in parent_name or "B737MAX" in parent_name:
-                    detected_aircraft = "B737MAX"
-                elif "737NG" in parent_name or "B737NG" in parent_name:
-                    detected_aircraft = "B737NG"
-                elif "767" in parent_name:
-                    detected_aircraft = "B767"
-                elif "777" in parent_name:
-                    detected_aircraft = "B777"
-                elif "787" in parent_name:
-                    detected_aircraft = "B787"
-                elif "COMMON" in parent_name:
-                    detected_aircraft = "COMMON"
-            
-            # Determine doc type from filename
-            filename = md_file.stem.lower()
-            if "translator" in filename:
-                doc_type = "TRANSLATOR"
-            elif "few_shot" in filename:
-                doc_type = "FEW_SHOT"
-            elif "acronym" in filename:
-                doc_type = "ACRONYMS"
-            else:
-                doc_type = "REFERENCE"
-            
-            chunks = [{
-                "content": content,
-                "company_id": company_id,
-                "aircraft_model": detected_aircraft,
-                "ata_chapter": "",
-                "doc_type": doc_type,
-                "source_path": str(md_file),
-                "doc_title": md_file.stem,
-            }]
-            
-            pipeline.ingest_document(chunks)
-            count += 1
-            print(f"[OK] Ingested: {md_file.name} -> {detected_aircraft}")
-            
-        except Exception as e:
-            print(f"[ERROR] Failed to ingest {md_file}: {e}")
+    metas = {str(md_file): _markdown_meta(md_file, aircraft_model, company_id) for md_file in sorted(folder.rglob("*.md"))}
+    plan = manifest.plan(metas.keys(), folder_path, metas, full=full)
     
-    return count
\ No newline at end of file
+    for path, chunk_ids in plan.removed.items():
+        pipeline.delete_chunks(chunk_ids, company_id)
+        manifest.forget(path)
+        print(f"[DEL] Removed chunks of deleted file: {path}")
+    
+    def on_done(change: FileChange) -> Callable[[List[str]], None]:
+        def record(ids: List[str]) -> None:
+            # Old chunks are only dropped once every new chunk of the file is written.
+            pipeline.delete_chunks(list(set(change.old_chunk_ids) - set(ids)), company_id)
+            manifest.record(change, ids)
+        return record
+    
+    ingestor = BatchIngestor(pipeline)
+    try:
+        for change in plan.changed:
+            md_file = Path(change.path)
+            meta = metas[change.path]
+            try:
+                content = md_file.read_text(encoding="utf-8")
+                chunks = [{**chunk, **meta} for chunk in chunk_text(content)]
+                ingestor.add_document(chunks, on_done(change))
+                count += 1
+                print(f"[OK] Queued: {md_file.name} -> {meta['aircraft_model']} ({len(chunks)} chunks)")
+                
+            except Exception as e:
+                print(f"[ERROR] Failed to ingest {md_file}: {e}")
+        ingestor.close()
+    finally:
+        manifest.save()
+        pipeline.persist()
+    
+    stats = ingestor.stats()
+    print(
+        f"[DONE] {count} ingested, {len(plan.unchanged)} unchanged, {len(plan.removed)} removed; "
+        f"{stats['chunks']} chunks in {stats['elapsed_s']}s "
+        f"({stats['docs_per_s']} docs/s, {stats['chunks_per_s']} chunks/s)"
+    )
+    return count
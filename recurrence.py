@@ -0,0 +1,361 @@
+"""Repeat-defect detection: N occurrences on the same unit within X days.
+
+A unit is the tail number, or the aircraft type for records without one. For
+every unit and ATA chapter (kind ``ata``) and every unit and fault code (kind
+``fault_code``), a failure is flagged when the ``RECURRENCE_WINDOW_DAYS`` days
+ending on its date hold at least ``RECURRENCE_MIN_OCCURRENCES`` failures.
+Flags live in ``failure_recurrences``.
+
+- ``rebuild`` recomputes whole tenants in one vectorized pass: rows are sorted
+  by (key, day) and each window count is two ``searchsorted`` lookups, so the
+  cost is O(n log n) with no pairwise comparisons and a few arrays of memory.
+- ``refresh`` is the incremental path. Failures above the ``recurrence_state``
+  watermark only re-evaluate their own keys, over the days their windows can
+  reach. Large deltas (bulk imports) rebuild the affected tenants instead, and
+  edits or deletes of failures mark their tenant in ``recurrence_dirty`` so the
+  next refresh rebuilds that tenant.
+- ``find_recurrences`` groups flags into episodes (flagged failures less than
+  a window apart) and lists every failure involved.
+
+    python recurrence.py --rebuild [--company 3]
+"""
+import argparse
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+import config
+import db
+from aviation_codes import normalize_aircraft, normalize_ata
+
+KINDS = ("ata", "fault_code")
+# Tail number when the record has one, else the aircraft type.
+UNIT_SQL = "COALESCE(NULLIF(tail, ''), NULLIF(aircraft, ''), '')"
+_INSERT_SQL = """
+    INSERT OR REPLACE INTO failure_recurrences
+        (failure_id, kind, company_id, unit, aircraft, ata, code, occurrence_date, window_count)
+    SELECT id, ?, company_id, {unit}, COALESCE(aircraft, ''), COALESCE(ata, ''), COALESCE({column}, ''), occurrence_date, ?
+    FROM failures WHERE id = ?
+"""
+_DAY_STRIDE = 1 << 24  # larger than any julian day number: keeps keys apart in one sorted array
+_FETCH_ROWS = 100_000
+
+_lock = threading.Lock()
+
+
+def _params() -> str:
+    return f"{config.RECURRENCE_MIN_OCCURRENCES}/{config.RECURRENCE_WINDOW_DAYS}"
+
+
+def window_counts(keys: np.ndarray, days: np.ndarray, window_days: int) -> np.ndarray:
+    """Rows of the same key in the ``window_days`` days ending on each row's day (inclusive)."""
+    order = np.lexsort((days, keys))
+    stamps = keys[order].astype(np.int64) * _DAY_STRIDE + days[order].astype(np.int64)
+    lower = np.searchsorted(stamps, stamps - (window_days - 1), side="left")
+    upper = np.searchsorted(stamps, stamps, side="right")
+    counts = np.empty(len(stamps), dtype=np.int64)
+    counts[order] = upper - lower
+    return counts
+
+
+def _flagged(ids: np.ndarray, keys: np.ndarray, days: np.ndarray) -> List[Tuple[int, int]]:
+    """``(failure_id, window_count)`` of the rows whose window reaches the threshold."""
+    if len(ids) == 0:
+        return []
+    counts = window_counts(keys, days, config.RECURRENCE_WINDOW_DAYS)
+    hit = counts >= config.RECURRENCE_MIN_OCCURRENCES
+    return list(zip(ids[hit].tolist(), counts[hit].tolist()))
+
+
+def _write_flags(conn, kind: str, flags: Iterable[Tuple[int, int]]) -> int:
+    sql = _INSERT_SQL.format(unit=UNIT_SQL, column=kind)
+    cursor = conn.executemany(sql, ((kind, count, failure_id) for failure_id, count in flags))
+    return max(cursor.rowcount, 0)
+
+
+def _scan_tenant(conn, company_id: int) -> Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Per kind: ids, key numbers and julian days of the tenant's dated, attributable failures."""
+    cursor = conn.cursor()
+    cursor.row_factory = None  # plain tuples: this reads the whole tenant
+    cursor.execute(
+        f"SELECT id, CAST(julianday(occurrence_date) AS INTEGER), "
+        f"{UNIT_SQL} || char(31) || COALESCE(ata, ''), {UNIT_SQL} || char(31) || COALESCE(fault_code, '') "
+        f"FROM failures WHERE company_id = ? AND {UNIT_SQL} != '' AND julianday(occurrence_date) IS NOT NULL",
+        (company_id,),
+    )
+    key_maps: Dict[str, Dict[str, int]] = {kind: {} for kind in KINDS}
+    chunks: Dict[str, List[Tuple[np.ndarray, np.ndarray, np.ndarray]]] = {kind: [] for kind in KINDS}
+    while True:
+        rows = cursor.fetchmany(_FETCH_ROWS)
+        if not rows:
+            break
+        columns = list(zip(*rows))
+        ids = np.asarray(columns[0], dtype=np.int64)
+        days = np.asarray(columns[1], dtype=np.int64)
+        for kind, keys in zip(KINDS, columns[2:]):
+            codes, uniques = pd.factorize(np.asarray(keys, dtype=object))
+            key_map = key_maps[kind]
+            # A key ending in the separator has no code for this kind: -1, dropped below.
+            numbers = np.asarray(
+                [-1 if u.endswith("\x1f") else key_map.setdefault(u, len(key_map)) for u in uniques], dtype=np.int64
+            )
+            keep = numbers[codes] >= 0
+            chunks[kind].append((ids[keep], numbers[codes][keep], days[keep]))
+    empty = np.empty(0, dtype=np.int64)
+    return {
+        kind: tuple(np.concatenate(parts) for parts in zip(*chunks[kind])) if chunks[kind] else (empty, empty, empty)
+        for kind in KINDS
+    }
+
+
+def _rebuild_tenants(conn, company_ids: Sequence[int]) -> int:
+    flags = 0
+    for company_id in company_ids:
+        scanned = _scan_tenant(conn, company_id)
+        conn.execute("DELETE FROM failure_recurrences WHERE company_id = ?", (company_id,))
+        for kind in KINDS:
+            flags += _write_flags(conn, kind, _flagged(*scanned[kind]))
+    return flags
+
+
+def _refresh_keys(conn, low_id: int, high_id: int) -> int:
+    """Re-evaluate the keys of failures ``low_id < id <= high_id`` around their dates."""
+    window = config.RECURRENCE_WINDOW_DAYS
+    touched: Dict[Tuple[str, int, str, str], List[int]] = {}
+    for _, company_id, unit, ata, fault_code, day in conn.execute(
+        f"SELECT id, company_id, {UNIT_SQL}, COALESCE(ata, ''), COALESCE(fault_code, ''), "
+        "CAST(julianday(occurrence_date) AS INTEGER) FROM failures WHERE id > ? AND id <= ?",
+        (low_id, high_id),
+    ):
+        if company_id is None or not unit or day is None:
+            continue
+        for kind, code in (("ata", ata), ("fault_code", fault_code)):
+            if code:
+                span = touched.setdefault((kind, company_id, unit, code), [day, day])
+                span[0], span[1] = min(span[0], day), max(span[1], day)
+
+    flags = 0
+    for (kind, company_id, unit, code), (first, last) in touched.items():
+        # Windows that can include a new failure end between its day and window - 1 days later;
+        # counting them needs the window - 1 days before the first one.
+        rows = conn.execute(
+            f"SELECT id, CAST(julianday(occurrence_date) AS INTEGER) FROM failures "
+            f"WHERE company_id = ? AND {kind} = ? AND {UNIT_SQL} = ? "
+            "AND occurrence_date >= date(?) AND occurrence_date < date(?, '+1 day')",
+            (company_id, code, unit, first - (window - 1) + 0.5, last + (window - 1) + 0.5),
+        ).fetchall()
+        rows = [r for r in rows if r[1] is not None]
+        ids = np.asarray([r[0] for r in rows], dtype=np.int64)
+        days = np.asarray([r[1] for r in rows], dtype=np.int64)
+        affected = (days >= first) & (days <= last + window - 1)
+        conn.executemany(
+            "DELETE FROM failure_recurrences WHERE failure_id = ? AND kind = ?",
+            ((failure_id, kind) for failure_id in ids[affected].tolist()),
+        )
+        hits = dict(_flagged(ids, np.zeros(len(ids), dtype=np.int64), days))
+        flags += _write_flags(conn, kind, ((i, hits[i]) for i in ids[affected].tolist() if i in hits))
+    return flags
+
+
+def refresh() -> Dict[str, Any]:
+    """Bring the flags up to date with ``failures``; cheap when nothing changed."""
+    def read_state(conn) -> Tuple[int, int, Optional[str], List[int]]:
+        state = conn.execute("SELECT last_failure_id, params FROM recurrence_state").fetchone()
+        (top,) = conn.execute("SELECT COALESCE(MAX(id), 0) FROM failures").fetchone()
+        dirty = [r[0] for r in conn.execute("SELECT company_id FROM recurrence_dirty")]
+        return top, (state["last_failure_id"] if state else 0), (state["params"] if state else None), dirty
+
+    with _lock, db.connection() as conn:
+        top, last, seen_params, dirty = read_state(conn)
+        report: Dict[str, Any] = {"mode": "none", "new_rows": max(0, top - last), "flags_written": 0}
+        if seen_params == _params() and top <= last and not dirty:
+            return report
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another worker may have refreshed, or a writer changed failures, meanwhile.
+            top, last, seen_params, dirty = read_state(conn)
+            report["new_rows"] = max(0, top - last)
+            if seen_params != _params():
+                report["mode"] = "rebuild"
+                conn.execute("DELETE FROM failure_recurrences")
+                tenants = [r[0] for r in conn.execute("SELECT DISTINCT company_id FROM failures WHERE company_id IS NOT NULL")]
+                report["flags_written"] = _rebuild_tenants(conn, tenants)
+            else:
+                # Tenants with edited or deleted failures are rebuilt; new rows of the others stay incremental.
+                tenants = set(dirty)
+                if top - last > config.RECURRENCE_INCREMENTAL_MAX_ROWS:
+                    tenants.update(r[0] for r in conn.execute(
+                        "SELECT DISTINCT company_id FROM failures WHERE id > ? AND id <= ? AND company_id IS NOT NULL",
+                        (last, top),
+                    ))
+                elif top > last:
+                    report["mode"] = "incremental"
+                    report["flags_written"] = _refresh_keys(conn, last, top)
+                if tenants:
+                    report["mode"] = "rebuild_tenants"
+                    report["flags_written"] += _rebuild_tenants(conn, sorted(tenants))
+            report["dirty_tenants"] = len(dirty)
+            conn.execute("DELETE FROM recurrence_dirty")
+            conn.execute(
+                "INSERT OR REPLACE INTO recurrence_state (id, last_failure_id, params) VALUES (1, ?, ?)",
+                (top, _params()),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    if report["mode"] == "none":
+        return report
+    print(f"[RECURRENCE] {report['mode']}: {report['new_rows']} new failures, {report['flags_written']} flags written")
+    return report
+
+
+def rebuild(company_id: Optional[int] = None) -> int:
+    """Recompute the flags of one tenant (or all) from scratch; returns the number of flags."""
+    with _lock, db.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if company_id is None:
+                conn.execute("DELETE FROM failure_recurrences")
+                tenants = [r[0] for r in conn.execute("SELECT DISTINCT company_id FROM failures WHERE company_id IS NOT NULL")]
+            else:
+                tenants = [company_id]
+            flags = _rebuild_tenants(conn, tenants)
+            if company_id is not None:
+                conn.execute("DELETE FROM recurrence_dirty WHERE company_id = ?", (company_id,))
+            else:
+                conn.execute("DELETE FROM recurrence_dirty")
+                (top,) = conn.execute("SELECT COALESCE(MAX(id), 0) FROM failures").fetchone()
+                conn.execute(
+                    "INSERT OR REPLACE INTO recurrence_state (id, last_failure_id, params) VALUES (1, ?, ?)",
+                    (top, _params()),
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return flags
+
+
+def _episodes(flags: List[Any]) -> List[Dict[str, Any]]:
+    """Group flags (ordered by kind, unit, code, date) into runs less than a window apart."""
+    window = config.RECURRENCE_WINDOW_DAYS
+    episodes: List[Dict[str, Any]] = []
+    current: Optional[Dict[str, Any]] = None
+    for kind, unit, aircraft, ata, code, occurrence_date, day, window_count in flags:
+        key = (kind, unit, code)
+        if current is None or current["_key"] != key or day - current["_last_day"] >= window:
+            current = {
+                "_key": key,
+                "_first_day": day,
+                "kind": kind,
+                "unit": unit,
+                "aircraft": aircraft,
+                "ata": ata,
+                "code": code,
+                "first_flagged": occurrence_date,
+                "max_in_window": 0,
+            }
+            episodes.append(current)
+        current["_last_day"] = day
+        current["last_date"] = occurrence_date
+        current["max_in_window"] = max(current["max_in_window"], window_count)
+    return episodes
+
+
+def find_recurrences(
+    company_id: int,
+    filters: Dict[str, Optional[str]],
+    kind: Optional[str] = None,
+    since: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Repeat-defect episodes for a tenant, most recent first, with the failures involved.
+
+    Only reads ``failure_recurrences``: the import and MRO sync paths refresh the
+    flags after writing, and the API refreshes them in the background, so a read
+    never waits on a rebuild.
+    """
+    if kind is not None and kind not in KINDS:
+        raise ValueError(f"kind must be one of {', '.join(KINDS)}")
+    limit = max(1, limit or config.RECURRENCE_PAGE_SIZE)
+    window = config.RECURRENCE_WINDOW_DAYS
+
+    where = ["company_id = ?"]
+    params: List[Any] = [company_id]
+    if kind:
+        where.append("kind = ?")
+        params.append(kind)
+    if filters.get("aircraft"):
+        where.append("aircraft = ?")
+        params.append(normalize_aircraft(filters["aircraft"]))
+    if filters.get("tail"):
+        where.append("unit = ?")
+        params.append("".join(filters["tail"].upper().split()))
+    if filters.get("ata"):
+        where.append("ata = ?")
+        params.append(normalize_ata(filters["ata"]))
+    if filters.get("fault_code"):
+        where.append("kind = 'fault_code' AND code = ?")
+        params.append(filters["fault_code"].strip().upper())
+    if since:
+        where.append("occurrence_date >= ?")
+        params.append(since)
+
+    with db.connection() as conn:
+        flags = conn.execute(
+            "SELECT kind, unit, aircraft, ata, code, occurrence_date, CAST(julianday(occurrence_date) AS INTEGER), "
+            "window_count FROM failure_recurrences WHERE " + " AND ".join(where)
+            + " ORDER BY kind, unit, code, occurrence_date",
+            params,
+        ).fetchall()
+        episodes = sorted(_episodes(flags), key=lambda e: e["last_date"], reverse=True)
+        total = len(episodes)
+        episodes = episodes[:limit]
+        for episode in episodes:
+            members = conn.execute(
+                f"SELECT id, occurrence_date FROM failures WHERE company_id = ? AND {episode['kind']} = ? "
+                f"AND {UNIT_SQL} = ? AND occurrence_date >= date(?, ?) AND occurrence_date <= ? "
+                "ORDER BY occurrence_date, id",
+                (company_id, episode["code"], episode["unit"], episode["first_flagged"],
+                 f"-{window - 1} days", episode["last_date"]),
+            ).fetchall()
+            episode["first_date"] = members[0]["occurrence_date"] if members else episode["first_flagged"]
+            episode["occurrences"] = len(members)
+            episode["failure_ids"] = [m["id"] for m in members]
+            for private in ("_key", "_first_day", "_last_day"):
+                episode.pop(private, None)
+
+    respuesta = (
+        f"Found {total} repeat-defect episodes ({config.RECURRENCE_MIN_OCCURRENCES}+ occurrences on the same "
+        f"tail within {window} days){f', showing {len(episodes)}' if total > len(episodes) else ''}. "
+        "Use this as context only; always consult OEM and organisational data before decisions."
+    )
+    return {
+        "respuesta": respuesta,
+        "recurrencias": episodes,
+        "total": total,
+        "min_occurrences": config.RECURRENCE_MIN_OCCURRENCES,
+        "window_days": window,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recompute repeat-defect flags over the failures history")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute from scratch instead of refreshing")
+    parser.add_argument("--company", type=int, default=None, help="Only this company (with --rebuild)")
+    args = parser.parse_args()
+    try:
+        if args.rebuild:
+            print(f"[RECURRENCE] {rebuild(args.company)} flags")
+        else:
+            refresh()
+    finally:
+        db.close_db()
+
+
+if __name__ == "__main__":
+    main()
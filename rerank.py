@@ -0,0 +1,105 @@
+"""Post-retrieval re-ranking: metadata boosts, score floor and MMR diversity.
+
+Retrieval over-fetches ``RAG_RERANK_CANDIDATES`` chunks. This stage then:
+
+1. drops vector-only matches whose similarity is under ``RAG_MIN_SCORE``
+   (exact lexical matches are kept, their point is tokens embeddings miss),
+2. boosts chunks whose ATA chapter, aircraft or ``doc_type`` match the request,
+   and chunks the BM25 index matched,
+3. picks ``top_k`` by maximal marginal relevance so near-identical chunks of
+   the same document do not all end up in the prompt.
+
+The report says how many prompt tokens were saved compared with sending the
+first ``top_k`` candidates as they came out of retrieval.
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import config
+from context_builder import count_tokens
+
+
+def preferred_doc_types() -> set:
+    return {t.strip().upper() for t in config.RAG_PREFERRED_DOC_TYPES.split(",") if t.strip()}
+
+
+def boost(fuente: Dict[str, Any], aircraft: str, ata: str, doc_types: set) -> float:
+    """Similarity score plus the metadata boosts that apply to this chunk."""
+    score = float(fuente.get("score", 0.0))
+    if ata and fuente.get("ata_chapter") == ata:
+        score += config.RAG_BOOST_ATA
+    if aircraft and fuente.get("aircraft_model") == aircraft:
+        score += config.RAG_BOOST_AIRCRAFT
+    if (fuente.get("doc_type") or "").upper() in doc_types:
+        score += config.RAG_BOOST_DOC_TYPE
+    if fuente.get("match") in ("lexical", "both"):
+        # Exact-token evidence (fault code, MEL item) that cosine similarity underrates.
+        score += config.RAG_BOOST_LEXICAL
+    return score
+
+
+def _unit_rows(embeddings: Sequence[Optional[Sequence[float]]]) -> Optional[np.ndarray]:
+    if not embeddings or any(e is None for e in embeddings):
+        return None
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def rerank(
+    candidates: List[Dict[str, Any]],
+    embeddings: Sequence[Optional[Sequence[float]]],
+    aircraft: str,
+    ata: str,
+    top_k: int,
+) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """Select ``top_k`` of ``candidates`` (retrieval order, one embedding each).
+
+    ``aircraft`` and ``ata`` must already be normalized like the chunk metadata.
+    Returns the chosen fuentes, best first, and a report.
+    """
+    baseline_tokens = sum(count_tokens(c.get("content", "")) for c in candidates[:top_k])
+    doc_types = preferred_doc_types()
+
+    pool = []
+    dropped_low = 0
+    for i, fuente in enumerate(candidates):
+        if fuente.get("match", "vector") == "vector" and float(fuente.get("score", 0.0)) < config.RAG_MIN_SCORE:
+            dropped_low += 1
+            continue
+        pool.append((i, boost(fuente, aircraft, ata, doc_types)))
+
+    unit = _unit_rows(list(embeddings))
+    selected: List[Tuple[int, float]] = []
+    dropped_dup = 0
+    lam = config.RAG_MMR_LAMBDA
+    while pool and len(selected) < top_k:
+        best_pos, best_mmr, best_redundancy = 0, -np.inf, 0.0
+        for pos, (i, relevance) in enumerate(pool):
+            redundancy = max((float(unit[i] @ unit[j]) for j, _ in selected), default=0.0) if unit is not None else 0.0
+            mmr = lam * relevance - (1.0 - lam) * redundancy
+            if mmr > best_mmr:
+                best_pos, best_mmr, best_redundancy = pos, mmr, redundancy
+        choice = pool.pop(best_pos)
+        if best_redundancy >= config.RAG_DEDUP_SIMILARITY:
+            # Near-copy of a chunk already chosen (e.g. overlapping chunks of one document).
+            dropped_dup += 1
+            continue
+        selected.append(choice)
+
+    chosen = []
+    for i, relevance in selected:
+        fuente = dict(candidates[i])
+        fuente["rerank_score"] = round(relevance, 3)
+        chosen.append(fuente)
+    chosen_tokens = sum(count_tokens(c.get("content", "")) for c in chosen)
+    return chosen, {
+        "candidates": len(candidates),
+        "dropped_low_score": dropped_low,
+        "dropped_duplicates": dropped_dup,
+        "tokens_baseline": baseline_tokens,
+        "tokens_selected": chosen_tokens,
+        "tokens_saved": max(0, baseline_tokens - chosen_tokens),
+    }
@@ -0,0 +1,210 @@
+"""Conversation history backends for AgentManager.
+
+A session is an append-only log of ``(role, content)`` turns addressed by
+``(company_id, conversation_id)``. Backends only need three cheap primitives,
+which map directly onto a Redis list (``RPUSH`` / ``LLEN`` / ``LRANGE``):
+
+- ``append(key, turns)`` -> new length of the log
+- ``length(key)``
+- ``load(key, start)`` -> turns from position ``start`` to the end
+
+Workers keep a hot copy of each conversation and only fetch the turns other
+workers appended since their last sync, so no call rewrites the full history.
+"""
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import config
+
+
+Turn = Tuple[str, str]
+SessionKey = Tuple[Optional[int], str]
+
+
+def serialize_turn(turn: Turn) -> str:
+    """Wire format for key/value backends (one JSON object per list element)."""
+    return json.dumps({"r": turn[0], "c": turn[1]}, ensure_ascii=False)
+
+
+def deserialize_turn(raw: str) -> Turn:
+    data = json.loads(raw)
+    return data["r"], data["c"]
+
+
+class SessionStore:
+    """Interface for conversation history backends."""
+
+    # True when other processes may append to the same session (history must be re-synced).
+    shared: bool = False
+    # True when calls do blocking I/O; async callers then run them in a worker thread.
+    blocking: bool = False
+
+    def append(self, key: SessionKey, turns: List[Turn]) -> int:
+        raise NotImplementedError
+
+    def length(self, key: SessionKey) -> int:
+        raise NotImplementedError
+
+    def load(self, key: SessionKey, start: int = 0) -> List[Turn]:
+        raise NotImplementedError
+
+    def evict(self, key: SessionKey) -> None:
+        """Called when the AgentManager drops its hot copy of a session."""
+
+    def purge_idle(self, older_than_s: float) -> int:
+        """Delete sessions not written to for ``older_than_s`` seconds; return how many."""
+        return 0
+
+
+class InMemorySessionStore(SessionStore):
+    """Process-local default. History is lost when the AgentManager evicts the session."""
+
+    def __init__(self, max_turns: Optional[int] = None) -> None:
+        self.max_turns = max_turns or config.CONVERSATION_MAX_MESSAGES
+        # key -> (total turns ever appended, retained tail)
+        self._sessions: Dict[SessionKey, Tuple[int, List[Turn]]] = {}
+        self._lock = threading.Lock()
+
+    def append(self, key: SessionKey, turns: List[Turn]) -> int:
+        with self._lock:
+            total, tail = self._sessions.get(key, (0, []))
+            tail = (tail + list(turns))[-self.max_turns:]
+            total += len(turns)
+            self._sessions[key] = (total, tail)
+            return total
+
+    def length(self, key: SessionKey) -> int:
+        return self._sessions.get(key, (0, []))[0]
+
+    def load(self, key: SessionKey, start: int = 0) -> List[Turn]:
+        total, tail = self._sessions.get(key, (0, []))
+        first_retained = total - len(tail)
+        return list(tail[max(0, start - first_retained):])
+
+    def evict(self, key: SessionKey) -> None:
+        with self._lock:
+            self._sessions.pop(key, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """WAL-mode SQLite store that several local worker processes can share."""
+
+    shared = True
+    blocking = True
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path or config.SESSION_SQLITE_PATH
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chat_sessions (
+                company_id TEXT NOT NULL,
+                conversation_id TEXT NOT NULL,
+                length INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (company_id, conversation_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS chat_turns (
+                company_id TEXT NOT NULL,
+                conversation_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                PRIMARY KEY (company_id, conversation_id, seq)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_chat_sessions_updated ON chat_sessions (updated_at);
+            """
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _params(key: SessionKey) -> Tuple[str, str]:
+        company_id, conversation_id = key
+        return ("" if company_id is None else str(company_id), conversation_id)
+
+    def append(self, key: SessionKey, turns: List[Turn]) -> int:
+        if not turns:
+            return self.length(key)
+        company, conv = self._params(key)
+        conn = self._conn()
+        # IMMEDIATE takes the write lock up front so concurrent workers get distinct seq numbers.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO chat_sessions (company_id, conversation_id, length, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (company_id, conversation_id) DO UPDATE SET "
+                "length = length + excluded.length, updated_at = excluded.updated_at",
+                (company, conv, len(turns), time.time()),
+            )
+            (new_length,) = conn.execute(
+                "SELECT length FROM chat_sessions WHERE company_id = ? AND conversation_id = ?",
+                (company, conv),
+            ).fetchone()
+            first_seq = new_length - len(turns)
+            conn.executemany(
+                "INSERT INTO chat_turns (company_id, conversation_id, seq, role, content) VALUES (?, ?, ?, ?, ?)",
+                [(company, conv, first_seq + i, role, content) for i, (role, content) in enumerate(turns)],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return new_length
+
+    def length(self, key: SessionKey) -> int:
+        row = self._conn().execute(
+            "SELECT length FROM chat_sessions WHERE company_id = ? AND conversation_id = ?",
+            self._params(key),
+        ).fetchone()
+        return row[0] if row else 0
+
+    def load(self, key: SessionKey, start: int = 0) -> List[Turn]:
+        company, conv = self._params(key)
+        rows = self._conn().execute(
+            "SELECT role, content FROM chat_turns WHERE company_id = ? AND conversation_id = ? AND seq >= ? "
+            "ORDER BY seq",
+            (company, conv, max(0, start)),
+        ).fetchall()
+        return [(role, content) for role, content in rows]
+
+    def purge_idle(self, older_than_s: float) -> int:
+        cutoff = time.time() - older_than_s
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            stale = conn.execute(
+                "SELECT company_id, conversation_id FROM chat_sessions WHERE updated_at < ?", (cutoff,)
+            ).fetchall()
+            conn.executemany("DELETE FROM chat_turns WHERE company_id = ? AND conversation_id = ?", stale)
+            conn.executemany("DELETE FROM chat_sessions WHERE company_id = ? AND conversation_id = ?", stale)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(stale)
+
+
+def get_session_store() -> SessionStore:
+    """Build the backend selected by ``config.SESSION_BACKEND``."""
+    backend = config.SESSION_BACKEND.lower()
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    if backend == "memory":
+        return InMemorySessionStore()
+    raise ValueError(f"Unknown SESSION_BACKEND: {config.SESSION_BACKEND}")
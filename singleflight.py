@@ -0,0 +1,113 @@
+"""Single-flight coalescing of identical in-flight chat requests.
+
+When a fleet-wide ECAM message shows up, many technicians ask the same
+question within seconds. The first request for a key becomes the leader and
+runs retrieval and the LLM call; identical requests arriving while it is in
+flight wait for its outcome instead of starting their own. The shared work runs
+in its own task, so a leader whose client disconnects does not cancel it for
+the followers. Streams are buffered: a follower joining mid-answer first
+replays the events sent so far. Only in-flight work is shared; reusing
+finished answers is the answer cache's job.
+
+Flights live on the event loop and are not thread-safe; the API runs one loop.
+"""
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+import asyncio
+
+
+class _Flight:
+    __slots__ = ("task", "events", "done", "changed", "followers")
+
+    def __init__(self) -> None:
+        self.task: Optional["asyncio.Future[Any]"] = None
+        self.events: List[Any] = []
+        self.done = False
+        self.changed = asyncio.Event()
+        self.followers = 0
+
+    def notify(self) -> None:
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+class SingleFlight:
+    def __init__(self) -> None:
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.leaders = 0
+        self.followers = 0
+        self.max_followers = 0
+
+    def _join(self, key: Hashable) -> Optional[_Flight]:
+        flight = self._flights.get(key)
+        if flight is not None:
+            flight.followers += 1
+            self.followers += 1
+            self.max_followers = max(self.max_followers, flight.followers)
+        return flight
+
+    def _launch(self, key: Hashable, flight: _Flight, work: Awaitable[Any]) -> None:
+        self.leaders += 1
+        self._flights[key] = flight
+        flight.task = asyncio.ensure_future(work)
+
+        def land(_: "asyncio.Future[Any]") -> None:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+        flight.task.add_done_callback(land)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """``(result, shared)``: ``fn()``'s result, computed by this call or by an identical one in flight."""
+        flight = self._join(key)
+        shared = flight is not None
+        if flight is None:
+            flight = _Flight()
+            self._launch(key, flight, fn())
+        # Shielded: a waiter that goes away must not cancel the work the others wait for.
+        return await asyncio.shield(flight.task), shared
+
+    def stream(self, key: Hashable, fn: Callable[[], AsyncIterator[Any]]) -> Tuple[AsyncIterator[Any], bool]:
+        """``(events, shared)``: every item of ``fn()``, produced once and replayed to each caller."""
+        flight = self._join(key)
+        shared = flight is not None
+        if flight is None:
+            flight = _Flight()
+            self._launch(key, flight, self._pump(flight, fn()))
+        return self._replay(flight), shared
+
+    @staticmethod
+    async def _pump(flight: _Flight, events: AsyncIterator[Any]) -> None:
+        try:
+            async for event in events:
+                flight.events.append(event)
+                flight.notify()
+        finally:
+            flight.done = True
+            flight.notify()
+
+    @staticmethod
+    async def _replay(flight: _Flight) -> AsyncIterator[Any]:
+        sent = 0
+        while True:
+            changed = flight.changed
+            while sent < len(flight.events):
+                yield flight.events[sent]
+                sent += 1
+            if flight.done:
+                break
+            await changed.wait()
+        # Surface the producer's failure (if any) to every reader.
+        await asyncio.shield(flight.task)
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.leaders + self.followers
+        return {
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "in_flight": len(self._flights),
+            "max_followers": self.max_followers,
+            "coalesce_ratio": round(self.followers / requests, 4) if requests else 0.0,
+        }
+
+
+chat_flights = SingleFlight()
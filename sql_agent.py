@@ -1,65 +1,236 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+import base64
+import csv
+import io
+import json
+import re
 import sqlite3
-import os
-
-from . import config
-
-
-def _get_conn() -> sqlite3.Connection:
-    os.makedirs(os.path.dirname(config.SQLITE_PATH), exist_ok=True)
-    conn = sqlite3.connect(config.SQLITE_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-
-def init_db() -> None:
-    conn = _get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """CREATE TABLE IF NOT EXISTS failures (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            company_id INTEGER,
-            aircraft TEXT,
-            ata TEXT,
-            fault_code TEXT,
-            description TEXT,
-            corrective_action TEXT,
-            failure_type TEXT,
-            occurrence_date TEXT,
-            reliability_rate REAL
-        )"""
-    )
-    conn.commit()
-    conn.close()
 
+import orjson
+
+import config
+import db
+from aviation_codes import normalize_aircraft, normalize_ata
 
-def search_failures(company_id: int, filters: Dict[str, Optional[str]]) -> Dict[str, Any]:
-    init_db()
-    conn = _get_conn()
-    cur = conn.cursor()
+# Columns returned by search and export (natural_key is internal to the importer).
+FAILURE_COLUMNS = (
+    "id", "company_id", "aircraft", "tail", "ata", "fault_code", "description",
+    "corrective_action", "failure_type", "occurrence_date", "reliability_rate", "source",
+)
+EXPORT_FORMATS = ("ndjson", "csv")
 
+
+def _where(company_id: int, filters: Dict[str, Optional[str]]) -> Tuple[List[str], Dict[str, Any]]:
     where = ["company_id = :company_id"]
     params: Dict[str, Any] = {"company_id": company_id}
 
+    # Imported rows store canonical aircraft / ATA / fault codes (failures_import.py); rows written
+    # before the importer keep their values as entered and only match filters in that form.
     if filters.get("aircraft"):
         where.append("aircraft = :aircraft")
-        params["aircraft"] = filters["aircraft"]
+        params["aircraft"] = normalize_aircraft(filters["aircraft"])
     if filters.get("ata"):
         where.append("ata = :ata")
-        params["ata"] = filters["ata"]
+        params["ata"] = normalize_ata(filters["ata"])
     if filters.get("fault_code"):
         where.append("fault_code = :fault_code")
-        params["fault_code"] = filters["fault_code"]
+        params["fault_code"] = filters["fault_code"].strip().upper()
+    if filters.get("tail"):
+        where.append("tail = :tail")
+        params["tail"] = re.sub(r"\s", "", filters["tail"]).upper()
+    return where, params
+
+
+def encode_cursor(occurrence_date: Optional[str], row_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([occurrence_date, row_id]).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[str], int]:
+    try:
+        occurrence_date, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor") from None
+    if not isinstance(row_id, int) or not (occurrence_date is None or isinstance(occurrence_date, str)):
+        raise ValueError("Invalid cursor")
+    return occurrence_date, row_id
+
 
-    sql = "SELECT * FROM failures WHERE " + " AND ".join(where) + " ORDER BY occurrence_date DESC LIMIT 200"
-    cur.execute(sql, params)
-    rows = cur.fetchall()
-    conn.close()
+def _fetch_page(
+    company_id: int,
+    filters: Dict[str, Optional[str]],
+    after: Optional[Tuple[Optional[str], int]],
+    limit: int,
+) -> List[sqlite3.Row]:
+    """Next ``limit`` rows in ``(occurrence_date DESC, id DESC)`` order after the keyset ``after``.
 
-    registros = [dict(r) for r in rows]
+    Each filter combination has an index ending in ``occurrence_date`` (and the
+    implicit rowid), so every page is an index range seek, however deep. Rows
+    without a date sort last and are read as a second segment.
+    """
+    where, params = _where(company_id, filters)
+    select = f"SELECT {', '.join(FAILURE_COLUMNS)} FROM failures WHERE "
+    order = " ORDER BY occurrence_date DESC, id DESC LIMIT :limit"
+    params["limit"] = limit
+
+    with db.connection() as conn:
+        if after is None:
+            return conn.execute(select + " AND ".join(where) + order, params).fetchall()
+        after_date, params["after_id"] = after
+        if after_date is None:
+            keyset = "occurrence_date IS NULL AND id < :after_id"
+            return conn.execute(select + " AND ".join([*where, keyset]) + order, params).fetchall()
+
+        params["after_date"] = after_date
+        keyset = "(occurrence_date, id) < (:after_date, :after_id)"
+        rows = conn.execute(select + " AND ".join([*where, keyset]) + order, params).fetchall()
+        if len(rows) < limit:
+            params["limit"] = limit - len(rows)
+            rows += conn.execute(select + " AND ".join([*where, "occurrence_date IS NULL"]) + order, params).fetchall()
+        return rows
+
+
+def search_failures(
+    company_id: int,
+    filters: Dict[str, Optional[str]],
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+) -> Dict[str, Any]:
+    """One page of matching failures, newest first; ``next_cursor`` is None on the last page."""
+    limit = max(1, min(limit or config.FAULTS_PAGE_SIZE, config.FAULTS_PAGE_MAX))
+    after = decode_cursor(cursor) if cursor else None
+    # One extra row tells whether there is a next page without a COUNT(*).
+    rows = _fetch_page(company_id, filters, after, limit + 1)
+
+    registros = [dict(r) for r in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = registros[-1]
+        next_cursor = encode_cursor(last["occurrence_date"], last["id"])
     respuesta = (
-        f"Found {len(registros)} matching failures in the reliability database. "
+        f"Found {len(registros)} matching failures in the reliability database"
+        f"{' (more available)' if next_cursor else ''}. "
         "Use this as context only; always consult OEM and organisational data before decisions."
     )
 
-    return {"respuesta": respuesta, "registros": registros}
+    return {"respuesta": respuesta, "registros": registros, "next_cursor": next_cursor}
+
+
+def iter_failures(company_id: int, filters: Dict[str, Optional[str]]) -> Iterator[List[sqlite3.Row]]:
+    """Every matching failure, newest first, in batches of ``FAULTS_EXPORT_BATCH`` rows.
+
+    The pooled connection is only held while a batch is read, so a slow client
+    downloading an export does not pin one.
+    """
+    after = None
+    while True:
+        rows = _fetch_page(company_id, filters, after, config.FAULTS_EXPORT_BATCH)
+        if not rows:
+            return
+        yield rows
+        if len(rows) < config.FAULTS_EXPORT_BATCH:
+            return
+        after = (rows[-1]["occurrence_date"], rows[-1]["id"])
+
+
+def _csv_chunks(company_id: int, filters: Dict[str, Optional[str]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FAILURE_COLUMNS)
+    for rows in iter_failures(company_id, filters):
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _ndjson_chunks(company_id: int, filters: Dict[str, Optional[str]]) -> Iterator[bytes]:
+    for rows in iter_failures(company_id, filters):
+        yield b"".join(orjson.dumps(dict(zip(FAILURE_COLUMNS, row))) + b"\n" for row in rows)
+
+
+def export_failures(company_id: int, filters: Dict[str, Optional[str]], fmt: str = "ndjson") -> Iterator[bytes]:
+    """Stream matching failures as NDJSON or CSV, one encoded chunk per batch."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format {fmt!r}; expected one of {', '.join(EXPORT_FORMATS)}")
+    return _csv_chunks(company_id, filters) if fmt == "csv" else _ndjson_chunks(company_id, filters)
+
+
+def _in(column: str, values: List[str]) -> str:
+    return f"{column} IN ({', '.join('?' * len(values))})"
+
+
+def fault_history(
+    company_id: int,
+    fault_codes: List[str],
+    tails: List[str],
+    atas: List[str],
+    aircraft: Optional[str] = None,
+) -> Optional[Dict[str, Any]]:
+    """Prior occurrences of the fault codes / tails / ATA chapters named in a chat question.
+
+    Code and tail candidates are first resolved against the tenant's records
+    (one index probe each), so words that only look like codes are dropped.
+    Returns None when nothing matches; otherwise a per-code summary with the
+    most frequent corrective actions and the most recent matching records.
+    ATA chapters only narrow the search when no known code does; ``aircraft``
+    always does, since one code string can mean different things on another type.
+    """
+    fleet, fleet_params = ("", []) if not aircraft else (" AND aircraft = ?", [normalize_aircraft(aircraft)])
+    with db.connection() as conn:
+        actions: Dict[str, List[Tuple[str, int, Optional[str]]]] = {}
+        if fault_codes:
+            for code, action, n, last in conn.execute(
+                "SELECT fault_code, COALESCE(corrective_action, ''), COUNT(*), MAX(occurrence_date) FROM failures "
+                f"WHERE company_id = ? AND {_in('fault_code', fault_codes)}{fleet} GROUP BY 1, 2",
+                [company_id, *fault_codes, *fleet_params],
+            ).fetchall():
+                actions.setdefault(code, []).append((action, n, last))
+        known_tails = []
+        if tails:
+            known_tails = [r[0] for r in conn.execute(
+                f"SELECT DISTINCT tail FROM failures WHERE company_id = ? AND {_in('tail', tails)}",
+                [company_id, *tails],
+            ).fetchall()]
+
+        known_codes = [code for code in fault_codes if code in actions]
+        where, params = ["company_id = ?"], [company_id]
+        if known_codes:
+            where.append(_in("fault_code", known_codes))
+            params += known_codes
+        if known_tails:
+            where.append(_in("tail", known_tails))
+            params += known_tails
+        if atas and not known_codes:
+            where.append(_in("ata", atas))
+            params += atas
+        if len(where) == 1:
+            return None
+        registros = [dict(r) for r in conn.execute(
+            f"SELECT {', '.join(FAILURE_COLUMNS)} FROM failures WHERE {' AND '.join(where)}{fleet} "
+            "ORDER BY occurrence_date DESC, id DESC LIMIT ?",
+            [*params, *fleet_params, config.AGENT_FAULT_HISTORY_ROWS],
+        ).fetchall()]
+
+    if not known_codes and not registros:
+        return None
+    codes = []
+    for code in known_codes:
+        ranked = sorted(actions[code], key=lambda a: (-a[1], a[0]))
+        codes.append({
+            "fault_code": code,
+            "occurrences": sum(a[1] for a in ranked),
+            "last_date": max((a[2] for a in ranked if a[2]), default=None),
+            "actions": [
+                {"corrective_action": a, "count": n, "last_date": last}
+                for a, n, last in ranked[: config.AGENT_FAULT_HISTORY_ACTIONS]
+                if a
+            ],
+        })
+    return {
+        "fault_codes": codes,
+        "tails": known_tails,
+        "atas": atas if not known_codes else [],
+        "registros": registros,
+    }
@@ -0,0 +1,43 @@
+import csv
+
+import pytest
+
+import config
+import db
+
+EXPORT_FIELDS = ["id", "tail", "ata", "fault_code", "description", "date"]
+
+
+@pytest.fixture
+def failures_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "SQLITE_PATH", str(tmp_path / "failures.db"))
+    db.close_db()
+    yield
+    db.close_db()
+
+
+@pytest.fixture
+def write_export():
+    """Write rows of a CSV defect export with the ``EXPORT_FIELDS`` columns."""
+    def write(path, rows):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=EXPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+    return write
+
+
+@pytest.fixture
+def add_failures(failures_db):
+    """Insert failure rows (dicts of column values) directly; return their ids."""
+    def add(rows):
+        ids = []
+        with db.connection() as conn:
+            for row in rows:
+                columns = ", ".join(row)
+                marks = ", ".join("?" * len(row))
+                ids.append(conn.execute(f"INSERT INTO failures ({columns}) VALUES ({marks})", list(row.values())).lastrowid)
+            conn.commit()
+        return ids
+    return add
@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, Overloaded, parse_weights
+
+
+def _grant_order(controller, holder, queued):
+    """Hold one slot for ``holder``, queue ``(tenant, name)`` turns in order, release; return the grant order."""
+    order = []
+
+    async def turn(tenant, name):
+        await controller.acquire(tenant)
+        order.append(name)
+        await asyncio.sleep(0)
+        controller.release(tenant)
+
+    async def main():
+        await controller.acquire(holder)
+        tasks = []
+        for tenant, name in queued:
+            tasks.append(asyncio.ensure_future(turn(tenant, name)))
+            await asyncio.sleep(0)
+        controller.release(holder)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    return order
+
+
+def test_parse_weights_ignores_malformed_entries():
+    assert parse_weights("3:2, 7:0.5,x:1,9:0,10") == {3: 2.0, 7: 0.5}
+
+
+def test_queued_tenant_is_interleaved_instead_of_waiting_behind_a_backlog():
+    controller = AdmissionController(max_concurrent=1, tenant_max_concurrent=1, max_queue=10, queue_timeout_s=1)
+
+    order = _grant_order(controller, "bulk", [("bulk", "b2"), ("bulk", "b3"), ("bulk", "b4"), ("chat", "c1")])
+
+    assert order == ["b2", "c1", "b3", "b4"]
+
+
+def test_weights_give_a_tenant_a_larger_share():
+    controller = AdmissionController(
+        max_concurrent=1, tenant_max_concurrent=1, max_queue=10, queue_timeout_s=1, weights={"chat": 4.0}
+    )
+    queued = [("bulk", "b2"), ("bulk", "b3"), ("chat", "c1"), ("chat", "c2"), ("chat", "c3")]
+
+    order = _grant_order(controller, "bulk", queued)
+
+    assert order == ["c1", "c2", "c3", "b2", "b3"]
+
+
+def test_tenant_limit_leaves_slots_to_other_tenants():
+    controller = AdmissionController(max_concurrent=4, tenant_max_concurrent=1, max_queue=10, queue_timeout_s=0.05)
+
+    async def main():
+        await controller.acquire("bulk")
+        await controller.acquire("chat")
+        with pytest.raises(Overloaded) as shed:
+            await controller.acquire("bulk")
+        return shed.value
+
+    shed = asyncio.run(main())
+
+    assert shed.reason == "queue_timeout"
+    stats = controller.stats()
+    assert stats["in_flight"] == 2
+    assert stats["queued"] == 0
+    assert stats["tenants"]["bulk"]["shed_queue_timeout"] == 1
+
+
+def test_full_queue_sheds_at_once():
+    controller = AdmissionController(max_concurrent=1, tenant_max_concurrent=1, max_queue=1, queue_timeout_s=1)
+
+    async def main():
+        await controller.acquire("bulk")
+        waiting = asyncio.ensure_future(controller.acquire("bulk"))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as shed:
+            await controller.acquire("bulk")
+        controller.release("bulk")
+        await waiting
+        return shed.value
+
+    shed = asyncio.run(main())
+
+    assert (shed.reason, shed.wait_ms) == ("queue_full", 0.0)
+    assert controller.stats()["tenants"]["bulk"]["shed_queue_full"] == 1
+
+
+def test_cancelled_waiter_gives_its_place_back():
+    controller = AdmissionController(max_concurrent=1, tenant_max_concurrent=1, max_queue=10, queue_timeout_s=1)
+
+    async def main():
+        await controller.acquire("bulk")
+        waiting = asyncio.ensure_future(controller.acquire("chat"))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        controller.release("bulk")
+        return await controller.acquire("chat")
+
+    assert asyncio.run(main()) == 0.0
+    assert controller.stats()["in_flight"] == 1
+
+
+def test_sync_acquire_times_out_when_no_slot_frees():
+    controller = AdmissionController(max_concurrent=1, tenant_max_concurrent=1, max_queue=10, queue_timeout_s=0.02)
+
+    assert controller.acquire_sync("bulk") == 0.0
+    with pytest.raises(Overloaded):
+        controller.acquire_sync("chat")
+    controller.release("bulk")
+    assert controller.acquire_sync("chat") == 0.0
@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+import agents
+import config
+
+
+@pytest.fixture
+def no_llm(monkeypatch):
+    async def forbidden(**kwargs):
+        raise AssertionError("the LLM must not be called")
+
+    monkeypatch.setattr(config, "OPENAI_API_KEY", "test")
+    monkeypatch.setattr(agents, "acreate_chat_completion", forbidden)
+
+
+@pytest.mark.parametrize("question", ["Write a poem about the sea", "What does fault C4254 mean?"])
+def test_history_only_without_matching_records_never_calls_the_llm(failures_db, no_llm, question):
+    agent = agents.AeroAgent(company_id=3, conversation_id="c1")
+
+    result = asyncio.run(agent.aask(question, None, None, history_only=True))
+
+    assert result["tipo"] == "fault_history"
+    assert result["metadata"]["model_used"] is None
+    assert not agent.memory
+
+
+def test_history_only_stream_without_matching_records_never_calls_the_llm(failures_db, no_llm):
+    agent = agents.AeroAgent(company_id=3, conversation_id="c1")
+
+    async def collect():
+        return [event async for event in agent.astream("Write a poem about the sea", None, None, history_only=True)]
+
+    events = asyncio.run(collect())
+
+    assert [name for name, _ in events] == ["sources", "final"]
+    assert events[-1][1]["tipo"] == "fault_history"
@@ -0,0 +1,41 @@
+import pytest
+
+from chunking import _Block, _split_oversized, chunk_text
+from context_builder import count_tokens, token_windows
+
+
+def test_token_windows_cover_the_text_without_gaps():
+    text = "bleed valve " * 200
+
+    windows = token_windows(text, 20, 20)
+
+    assert "".join(windows) == text
+    assert all(count_tokens(w) <= 20 for w in windows)
+
+
+def test_split_oversized_steps_by_size_minus_overlap():
+    text = "word " * 300
+    total = count_tokens(text)
+
+    pieces = _split_oversized(_Block(text, 1, False, False, ""), 20, 5)
+
+    # Windows start every 15 tokens until one reaches the end.
+    assert len(pieces) == -(-(total - 20) // 15) + 1
+    assert all(p.tokens <= 20 for p in pieces)
+    assert pieces[-1].text.endswith("word ")
+
+
+def test_overlap_not_smaller_than_chunk_is_rejected():
+    with pytest.raises(ValueError):
+        _split_oversized(_Block("word " * 300, 1, False, False, ""), 20, 20)
+    with pytest.raises(ValueError):
+        chunk_text("word " * 300, max_tokens=20, overlap_tokens=20)
+
+
+def test_long_heading_does_not_explode_the_chunk_count():
+    body = "The pack flow control valve regulates the air flow to the pack. " * 60
+    heading = "AIR CONDITIONING PACK FLOW CONTROL AND TEMPERATURE REGULATION SYSTEM"
+    short = chunk_text(f"# Packs\n\n{body}", max_tokens=30, overlap_tokens=10, min_tokens=5)
+    long = chunk_text(f"# {heading}\n\n{body}", max_tokens=30, overlap_tokens=10, min_tokens=5)
+
+    assert len(long) <= 2 * len(short)
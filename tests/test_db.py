@@ -0,0 +1,14 @@
+import sqlite3
+
+import db
+
+
+def test_migrations_keep_legacy_values_and_need_no_python_functions(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "legacy.db"))
+    conn.executescript(dict(db.MIGRATIONS)[1])
+    conn.execute("INSERT INTO failures (company_id, aircraft, ata, fault_code) VALUES (3, 'A320-214', '21-52-01', ' c42 ')")
+    conn.execute("PRAGMA user_version = 1")
+    conn.commit()
+
+    assert db.migrate(conn) == db.MIGRATIONS[-1][0]
+    assert conn.execute("SELECT aircraft, ata, fault_code FROM failures").fetchone() == ("A320-214", "21-52-01", " c42 ")
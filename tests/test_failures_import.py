@@ -0,0 +1,35 @@
+import db
+from failures_import import import_file
+
+
+def test_exports_from_two_sources_sharing_ids_do_not_collide(tmp_path, failures_db, write_export):
+    a = tmp_path / "a.csv"
+    b = tmp_path / "b.csv"
+    write_export(a, [
+        {"id": "1", "tail": "EC-MXV", "ata": "32", "fault_code": "C4254", "description": "brake temp", "date": "2024-03-01"},
+        {"id": "2", "tail": "EC-MXV", "ata": "21", "fault_code": "C1001", "description": "pack fault", "date": "2024-03-02"},
+    ])
+    write_export(b, [
+        {"id": "1", "tail": "EC-LKT", "ata": "36", "fault_code": "C2002", "description": "bleed leak", "date": "2024-04-01"},
+        {"id": "2", "tail": "EC-LKT", "ata": "29", "fault_code": "C3003", "description": "hyd low press", "date": "2024-04-02"},
+    ])
+
+    first = import_file(str(a), company_id=3, source="amos_export")
+    second = import_file(str(b), company_id=3, source="trax_export")
+
+    assert (first["inserted"], first["duplicates"]) == (2, 0)
+    assert (second["inserted"], second["duplicates"]) == (2, 0)
+    with db.connection() as conn:
+        codes = {r[0] for r in conn.execute("SELECT fault_code FROM failures WHERE company_id = 3")}
+    assert codes == {"C4254", "C1001", "C2002", "C3003"}
+
+
+def test_reimport_of_the_same_source_is_deduplicated(tmp_path, failures_db, write_export):
+    a = tmp_path / "a.csv"
+    write_export(a, [
+        {"id": "1", "tail": "EC-MXV", "ata": "32", "fault_code": "C4254", "description": "brake temp", "date": "2024-03-01"},
+    ])
+    import_file(str(a), company_id=3, source="amos_export")
+    again = import_file(str(a), company_id=3, source="amos_export", restart=True)
+
+    assert (again["inserted"], again["duplicates"]) == (0, 1)
@@ -0,0 +1,39 @@
+import asyncio
+import threading
+
+import db
+import mro_sync
+
+
+class _HangingClient:
+    provider_name = "hanging"
+
+    def __init__(self, company_id):
+        self.company_id = company_id
+
+    async def get_defect_changes(self, cursor, limit, timeout=None):
+        await asyncio.sleep(60)
+
+
+def test_cancelled_sync_releases_its_lease_off_the_event_loop(failures_db, monkeypatch):
+    threads = []
+    release = mro_sync._release
+    monkeypatch.setattr(
+        mro_sync, "_release", lambda *args: threads.append(threading.current_thread()) or release(*args)
+    )
+
+    async def main():
+        task = asyncio.ensure_future(mro_sync.sync_provider(_HangingClient, 3))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(main())
+
+    assert threads and threads[0] is not threading.main_thread()
+    with db.connection() as conn:
+        row = conn.execute("SELECT lease_until, last_error FROM mro_sync_state WHERE company_id = 3").fetchone()
+    assert (row["lease_until"], row["last_error"]) == (0, "cancelled")
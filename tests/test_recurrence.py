@@ -0,0 +1,53 @@
+import db
+import recurrence
+from failures_import import import_file
+
+
+def _import_repeats(write_export, path, company_id, tail):
+    """Three brake-temperature faults on one tail within a week: a repeat defect."""
+    write_export(path, [
+        {"id": str(day), "tail": tail, "ata": "32", "fault_code": "C4254", "description": "brake temp",
+         "date": f"2024-03-0{day}"}
+        for day in (1, 3, 5)
+    ])
+    import_file(str(path), company_id=company_id, source="amos_export")
+
+
+def _flags(company_id):
+    with db.connection() as conn:
+        (count,) = conn.execute("SELECT COUNT(*) FROM failure_recurrences WHERE company_id = ?", (company_id,)).fetchone()
+    return count
+
+
+def test_delete_rebuilds_only_the_affected_tenant(tmp_path, failures_db, write_export, monkeypatch):
+    _import_repeats(write_export, tmp_path / "a.csv", company_id=3, tail="EC-MXV")
+    _import_repeats(write_export, tmp_path / "b.csv", company_id=4, tail="EC-LKT")
+    assert _flags(3) == _flags(4) == 2  # ata and fault_code on the third fault
+
+    with db.connection() as conn:
+        conn.execute("DELETE FROM failures WHERE company_id = 3 AND occurrence_date = '2024-03-03'")
+        conn.commit()
+    rebuilt = []
+    rebuild_tenants = recurrence._rebuild_tenants
+    monkeypatch.setattr(
+        recurrence, "_rebuild_tenants", lambda conn, tenants: rebuilt.extend(tenants) or rebuild_tenants(conn, tenants)
+    )
+    report = recurrence.refresh()
+
+    assert report["mode"] == "rebuild_tenants"
+    assert rebuilt == [3]
+    assert (_flags(3), _flags(4)) == (0, 2)
+    assert recurrence.refresh()["mode"] == "none"
+
+
+def test_reads_do_not_refresh(add_failures):
+    add_failures([
+        {"company_id": 3, "tail": "EC-MXV", "ata": "32", "fault_code": "C4254", "occurrence_date": f"2024-03-0{day}"}
+        for day in (1, 3, 5)
+    ])
+
+    assert recurrence.find_recurrences(3, {})["total"] == 0
+    recurrence.refresh()
+    found = recurrence.find_recurrences(3, {"fault_code": "c4254"})
+    assert found["total"] == 1
+    assert found["recurrencias"][0]["occurrences"] == 3
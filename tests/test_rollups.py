@@ -0,0 +1,89 @@
+import pytest
+
+import config
+import db
+from ml_faults import compute_trends
+
+_FROM_FAILURES = {
+    "failure_rollup_monthly": (
+        "SELECT company_id, COALESCE(aircraft, ''), COALESCE(ata, ''), COALESCE(substr(occurrence_date, 1, 7), ''), "
+        "COUNT(*) FROM failures WHERE company_id IS NOT NULL GROUP BY 1, 2, 3, 4"
+    ),
+    "failure_rollup_code_monthly": (
+        "SELECT company_id, COALESCE(aircraft, ''), COALESCE(ata, ''), COALESCE(fault_code, ''), "
+        "COALESCE(substr(occurrence_date, 1, 7), ''), COUNT(*) FROM failures WHERE company_id IS NOT NULL "
+        "GROUP BY 1, 2, 3, 4, 5"
+    ),
+}
+_ROLLUP = {
+    "failure_rollup_monthly": "SELECT company_id, aircraft, ata, month, failures FROM failure_rollup_monthly",
+    "failure_rollup_code_monthly": (
+        "SELECT company_id, aircraft, ata, fault_code, month, failures FROM failure_rollup_code_monthly"
+    ),
+}
+
+
+def _assert_rollups_match_failures():
+    with db.connection() as conn:
+        for table, query in _FROM_FAILURES.items():
+            expected = {tuple(r) for r in conn.execute(query)}
+            actual = {tuple(r) for r in conn.execute(_ROLLUP[table]) if r[-1] != 0}
+            assert actual == expected, table
+
+
+def test_triggers_keep_rollups_in_step_with_inserts_updates_and_deletes(add_failures):
+    ids = add_failures([
+        {"company_id": 3, "aircraft": "A320", "ata": "21", "fault_code": "C1", "occurrence_date": "2024-01-10"},
+        {"company_id": 3, "aircraft": "A320", "ata": "21", "fault_code": "C1", "occurrence_date": "2024-01-20"},
+        {"company_id": 3, "aircraft": "A320", "ata": "32", "fault_code": "C2", "occurrence_date": "2024-02-03"},
+        {"company_id": 3, "aircraft": "A321", "ata": "32", "fault_code": None, "occurrence_date": None},
+        {"company_id": None, "aircraft": "A320", "ata": "21", "occurrence_date": "2024-01-05"},
+    ])
+    _assert_rollups_match_failures()
+
+    with db.connection() as conn:
+        conn.execute("UPDATE failures SET occurrence_date = '2024-03-01', ata = '36' WHERE id = ?", (ids[0],))
+        conn.execute("UPDATE failures SET company_id = 4 WHERE id = ?", (ids[2],))
+        conn.execute("UPDATE failures SET company_id = 3 WHERE id = ?", (ids[4],))
+        conn.execute("UPDATE failures SET description = 'text only' WHERE id = ?", (ids[1],))
+        conn.execute("DELETE FROM failures WHERE id = ?", (ids[3],))
+        conn.commit()
+    _assert_rollups_match_failures()
+
+
+def test_rebuild_restores_rollups_after_a_bulk_load_without_triggers(add_failures):
+    add_failures([{"company_id": 3, "aircraft": "A320", "ata": "21", "occurrence_date": "2024-01-10"}])
+    with db.connection() as conn:
+        db.drop_rollup_triggers(conn)
+    add_failures([{"company_id": 3, "aircraft": "A320", "ata": "21", "occurrence_date": "2024-01-11"}] * 3)
+    with db.connection() as conn:
+        db.ensure_rollups(conn)
+    _assert_rollups_match_failures()
+
+    add_failures([{"company_id": 3, "aircraft": "A320", "ata": "21", "occurrence_date": "2024-02-01"}])
+    _assert_rollups_match_failures()
+
+
+def test_trends_from_rollups(add_failures, monkeypatch):
+    monkeypatch.setattr(config, "TRENDS_ROLLING_MONTHS", 2)
+    per_month = {"2024-01": 2, "2024-02": 4, "2024-03": 1}
+    rows = []
+    for month, n in per_month.items():
+        rows += [{"company_id": 3, "aircraft": "A320", "ata": "21", "fault_code": "C1", "occurrence_date": f"{month}-15"}] * n
+    rows.append({"company_id": 3, "aircraft": "A320", "ata": "32", "fault_code": "C2", "occurrence_date": None})
+    rows.append({"company_id": 4, "aircraft": "A320", "ata": "21", "occurrence_date": "2024-03-15"})
+    add_failures(rows)
+
+    trends = compute_trends(3, months=3, flight_hours=500)
+
+    assert trends["by_ata"] == [{"ata": "21", "count": 7}, {"ata": "32", "count": 1}]
+    assert trends["window"]["from"] == "2024-01" and trends["window"]["to"] == "2024-03"
+    march = trends["monthly"][-1]
+    assert march["month"] == "2024-03"
+    assert march["failures"] == 1
+    assert march["rolling_mean"] == pytest.approx(2.5)
+    assert march["mom_change"] == pytest.approx(-0.75)
+    assert march["rate_per_1000_fh"] == pytest.approx(2.0)
+    assert trends["monthly"][0]["mom_change"] is None
+    assert trends["top_fault_codes"][0]["fault_code"] == "C1"
+    assert trends["top_fault_codes"][0]["failures_in_window"] == 7
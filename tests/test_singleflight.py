@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_identical_calls_in_flight_share_one_computation():
+    flights = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def main():
+        return await asyncio.gather(*(flights.do("key", work) for _ in range(5)))
+
+    results = asyncio.run(main())
+
+    assert len(calls) == 1
+    assert [r for r, _ in results] == ["answer"] * 5
+    assert [shared for _, shared in results] == [False, True, True, True, True]
+    assert flights.stats()["coalesce_ratio"] == 0.8
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_finished_flights_are_not_reused():
+    flights = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        return len(calls)
+
+    async def main():
+        return [await flights.do("key", work) for _ in range(2)]
+
+    assert asyncio.run(main()) == [(1, False), (2, False)]
+
+
+def test_cancelled_leader_does_not_cancel_the_followers():
+    flights = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def main():
+        leader = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == ("answer", True)
+
+
+def test_failure_reaches_every_caller():
+    flights = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("provider down")
+
+    async def main():
+        return await asyncio.gather(*(flights.do("key", work) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(r, RuntimeError) for r in asyncio.run(main()))
+
+
+def test_late_stream_joiner_replays_events_sent_so_far():
+    flights = SingleFlight()
+    produced = []
+
+    async def events():
+        for i in range(4):
+            produced.append(i)
+            yield i
+            await asyncio.sleep(0.01)
+
+    async def read(delay):
+        await asyncio.sleep(delay)
+        stream, shared = flights.stream("key", events)
+        return [e async for e in stream], shared
+
+    async def main():
+        return await asyncio.gather(read(0), read(0.025))
+
+    first, late = asyncio.run(main())
+
+    assert produced == [0, 1, 2, 3]
+    assert first == ([0, 1, 2, 3], False)
+    assert late == ([0, 1, 2, 3], True)
@@ -0,0 +1,60 @@
+import pytest
+
+import config
+from sql_agent import decode_cursor, encode_cursor, fault_history, iter_failures, search_failures
+
+
+@pytest.fixture
+def fleet(add_failures):
+    dates = ["2024-03-01", None, "2024-03-05", "2024-03-05", None, "2024-01-20", "2024-03-05", None]
+    add_failures([{"company_id": 3, "aircraft": "A320", "ata": "21", "occurrence_date": d} for d in dates])
+    add_failures([{"company_id": 4, "aircraft": "A320", "ata": "21", "occurrence_date": "2024-03-02"}])
+    # Newest first, ties by id descending, undated rows last.
+    return [7, 4, 3, 1, 6, 8, 5, 2]
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 5, 8, 20])
+def test_pages_walk_every_row_once_across_the_undated_segment(fleet, limit):
+    seen, cursor = [], None
+    while True:
+        page = search_failures(3, {"ata": "21"}, limit=limit, cursor=cursor)
+        seen += [r["id"] for r in page["registros"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == fleet
+
+
+def test_export_batches_match_the_page_order(fleet, monkeypatch):
+    monkeypatch.setattr(config, "FAULTS_EXPORT_BATCH", 3)
+
+    batches = [[r["id"] for r in batch] for batch in iter_failures(3, {})]
+
+    assert [len(b) for b in batches] == [3, 3, 2]
+    assert sum(batches, []) == fleet
+
+
+def test_cursor_round_trip_and_rejection():
+    assert decode_cursor(encode_cursor(None, 5)) == (None, 5)
+    assert decode_cursor(encode_cursor("2024-03-05", 7)) == ("2024-03-05", 7)
+    for bad in ("not-a-cursor", encode_cursor("2024-03-05", 7)[:-3]):
+        with pytest.raises(ValueError):
+            decode_cursor(bad)
+
+
+def test_fault_history_keeps_to_the_aircraft_type(add_failures):
+    add_failures([
+        {"company_id": 3, "aircraft": "A320", "fault_code": "C42", "corrective_action": "Replaced valve",
+         "occurrence_date": "2024-03-01"},
+        {"company_id": 3, "aircraft": "B737", "fault_code": "C42", "corrective_action": "Reset breaker",
+         "occurrence_date": "2024-03-02"},
+    ])
+
+    mixed = fault_history(3, ["C42"], [], [])
+    a320 = fault_history(3, ["C42"], [], [], aircraft="a-320")
+
+    assert mixed["fault_codes"][0]["occurrences"] == 2
+    assert [a["corrective_action"] for a in a320["fault_codes"][0]["actions"]] == ["Replaced valve"]
+    assert [r["aircraft"] for r in a320["registros"]] == ["A320"]
+    assert fault_history(3, ["C42"], [], [], aircraft="E190") is None
@@ -0,0 +1,15 @@
+import vector_store
+from vector_store import ChromaBackend
+
+
+def test_chroma_reports_writes_from_another_client(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "_RELOAD_CHECK_S", 0.0)
+    reader = ChromaBackend(path=str(tmp_path)).open("docs_c3")
+    writer = ChromaBackend(path=str(tmp_path)).open("docs_c3")
+
+    assert not reader.maybe_reload()
+    writer.upsert(["a"], [[0.1, 0.2, 0.3]], ["brake temp"], [{"company_id": "3"}])
+
+    assert not writer.maybe_reload()  # its own write is not news to it
+    assert reader.maybe_reload()
+    assert not reader.maybe_reload()
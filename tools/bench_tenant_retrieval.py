@@ -0,0 +1,88 @@
+"""Retrieval latency vs. number of tenants, shared vs. per-tenant partitions.
+
+Every tenant gets the same number of synthetic chunks (random unit vectors,
+so no embedding model is needed) plus one shared public corpus. For each
+tenant count the script measures ``RAGPipeline.search`` for one tenant in
+both partition modes, on an in-memory Chroma:
+
+    python -m tools.bench_tenant_retrieval --tenants 1 4 16 64 --docs 500
+
+In ``shared`` mode the filtered search runs over the whole platform's
+chunks, so latency grows with the number of tenants; in ``tenant`` mode it
+only touches the tenant's own collection and the public one.
+"""
+import argparse
+import random
+import statistics
+import time
+import uuid
+from typing import Dict, List
+
+import chromadb
+
+from rag_module import RAGPipeline
+from vector_store import ChromaBackend
+
+AIRCRAFT = ("B737NG", "B737MAX", "B767", "B787")
+
+
+def _vector(rng: random.Random, dim: int) -> List[float]:
+    v = [rng.gauss(0.0, 1.0) for _ in range(dim)]
+    norm = sum(x * x for x in v) ** 0.5
+    return [x / norm for x in v]
+
+
+def _load(pipeline: RAGPipeline, tenants: int, docs: int, dim: int, rng: random.Random) -> None:
+    for company_id in range(tenants + 1):  # 0 = public corpus
+        for start in range(0, docs, 500):
+            n = min(500, docs - start)
+            ids = [f"{company_id}-{start + i}" for i in range(n)]
+            metas = [{
+                "company_id": str(company_id),
+                "aircraft_model": rng.choice(AIRCRAFT),
+                "ata_chapter": f"{rng.randint(21, 80):02d}",
+                "doc_title": f"doc {company_id}-{start + i}",
+            } for i in range(n)]
+            pipeline.upsert_prepared(ids, [m["doc_title"] for m in metas], metas, [_vector(rng, dim) for _ in range(n)])
+
+
+def _measure(pipeline: RAGPipeline, queries: int, dim: int, rng: random.Random) -> Dict[str, float]:
+    timings = []
+    for _ in range(queries):
+        embedding = _vector(rng, dim)
+        started = time.perf_counter()
+        pipeline.search(embedding, company_id=1, aircraft_model=rng.choice(AIRCRAFT), ata_chapter=None, top_k=5)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "p50_ms": statistics.median(timings),
+        "p95_ms": timings[int(len(timings) * 0.95) - 1],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tenants", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--docs", type=int, default=500, help="Chunks per tenant (and in the public corpus)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    backend = ChromaBackend(client=chromadb.EphemeralClient())
+    print(f"{'tenants':>8} {'chunks':>8} {'mode':>7} {'p50 ms':>8} {'p95 ms':>8}")
+    for tenants in args.tenants:
+        for mode in ("shared", "tenant"):
+            rng = random.Random(args.seed)
+            name = f"bench_{uuid.uuid4().hex[:8]}"
+            pipeline = RAGPipeline(collection=name, partition=mode, backend=backend)
+            _load(pipeline, tenants, args.docs, args.dim, rng)
+            pipeline.search(_vector(rng, args.dim), 1, None, None)  # warm the index
+            result = _measure(pipeline, args.queries, args.dim, rng)
+            print(f"{tenants:>8} {(tenants + 1) * args.docs:>8} {mode:>7} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f}")
+            for coll in pipeline._partitions():
+                backend.drop(coll.name)
+
+
+if __name__ == "__main__":
+    main()
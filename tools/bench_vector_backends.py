@@ -0,0 +1,120 @@
+"""Compare vector backends on the same synthetic corpus: build time, disk, query latency and RSS.
+
+    python -m tools.bench_vector_backends --tenants 8 --docs 2000
+    python -m tools.bench_vector_backends --backends chroma numpy-int8 --partition tenant
+
+Each backend is built in one child process and queried in a fresh one, so the
+reported RSS is what a worker that only serves queries holds (peak resident
+set size, including the interpreter and imported libraries, which are the
+same for every backend). Vectors are random unit vectors; the lexical index
+and re-ranking are switched off so only the vector search is timed.
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKENDS = ("chroma", "qdrant", "numpy-float16", "numpy-int8")
+
+
+def _make_backend(spec: str, root: Path):
+    from vector_store import ChromaBackend, NumpyBackend, QdrantBackend
+    if spec == "chroma":
+        return ChromaBackend(path=str(root / "chromadb"))
+    if spec == "qdrant":
+        return QdrantBackend(path=str(root / "qdrant"))
+    if spec.startswith("numpy-"):
+        return NumpyBackend(str(root / "vectors"), dtype=spec.split("-", 1)[1])
+    raise ValueError(f"Unknown backend: {spec}")
+
+
+def _close(backend) -> None:
+    # Local Qdrant holds a lock on its directory until the client is closed.
+    client = getattr(backend, "_client", None)
+    if client is not None and hasattr(client, "close"):
+        client.close()
+
+
+def _child(args: argparse.Namespace) -> None:
+    import random
+
+    from rag_module import RAGPipeline
+    from tools.bench_tenant_retrieval import _load, _measure, _vector
+
+    backend = _make_backend(args.backend, Path(args.root))
+    pipeline = RAGPipeline(collection="bench", partition=args.partition, backend=backend)
+    rng = random.Random(args.seed)
+    if args.phase == "build":
+        started = time.perf_counter()
+        _load(pipeline, args.tenants, args.docs, args.dim, rng)
+        pipeline.persist()
+        result = {"build_s": time.perf_counter() - started}
+    else:
+        pipeline.search(_vector(rng, args.dim), 1, None, None)
+        result = _measure(pipeline, args.queries, args.dim, rng)
+        result["rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    _close(backend)
+    print(json.dumps(result))
+
+
+def _run_child(args: argparse.Namespace, backend: str, phase: str, root: str) -> dict:
+    cmd = [
+        sys.executable, "-m", "tools.bench_vector_backends", "--child", phase,
+        "--backend", backend, "--root", root, "--partition", args.partition,
+        "--tenants", str(args.tenants), "--docs", str(args.docs), "--dim", str(args.dim),
+        "--queries", str(args.queries), "--seed", str(args.seed),
+    ]
+    env = {**os.environ, "RAG_HYBRID_ENABLED": "false", "RAG_RERANK_ENABLED": "false"}
+    out = subprocess.run(cmd, env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def _disk_mb(root: str) -> float:
+    return sum(p.stat().st_size for p in Path(root).rglob("*") if p.is_file()) / (1024 * 1024)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS))
+    parser.add_argument("--partition", choices=("shared", "tenant"), default="shared")
+    parser.add_argument("--tenants", type=int, default=8)
+    parser.add_argument("--docs", type=int, default=2000, help="Chunks per tenant (and in the public corpus)")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--child", choices=("build", "serve"), help=argparse.SUPPRESS)
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    parser.add_argument("--root", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        args.phase = args.child
+        _child(args)
+        return
+
+    chunks = (args.tenants + 1) * args.docs
+    print(f"{chunks} chunks x {args.dim} dims, {args.tenants} tenants, partition={args.partition}")
+    print(f"{'backend':>14} {'build s':>8} {'disk MB':>8} {'p50 ms':>8} {'p95 ms':>8} {'RSS MB':>8}")
+    for backend in args.backends:
+        root = tempfile.mkdtemp(prefix="bench_vectors_")
+        try:
+            build = _run_child(args, backend, "build", root)
+            serve = _run_child(args, backend, "serve", root)
+            print(
+                f"{backend:>14} {build['build_s']:>8.1f} {_disk_mb(root):>8.1f} "
+                f"{serve['p50_ms']:>8.2f} {serve['p95_ms']:>8.2f} {serve['rss_mb']:>8.0f}"
+            )
+        except subprocess.CalledProcessError as e:
+            print(f"{backend:>14} failed: {e.stderr.strip().splitlines()[-1] if e.stderr else e}")
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Local stand-in for the MRO provider APIs (AMOS, TRAX, CAMP, AVIATAR, airnavX).
+
+Lets the integration clients run end-to-end without network access:
+
+    python tools/mro_stub_server.py --port 8766 --delay 0.05 --fail-rate 0.1
+    INTEGRATION_STUB_URL=http://127.0.0.1:8766 uvicorn main:app
+
+Each provider lives under its own prefix (``/amos``, ``/trax``, ...) and serves
+``GET /<provider>/defects?aircraft=&ata=&limit=`` and
+``GET /<provider>/reliability/trends?aircraft=``, plus the change feed
+``GET /<provider>/defects/changes?cursor=&limit=`` read by ``mro_sync.py``:
+``--feed-size`` defects exist at start and ``--feed-growth`` change events per
+second arrive afterwards (new defects, or edits of earlier ones). Answers are
+deterministic for the same query and feed position. ``--fail-rate`` and
+``--throttle-rate`` inject 503 and 429 (with ``Retry-After``) responses to
+exercise retries and the circuit breaker.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+from urllib.parse import parse_qs, urlsplit
+
+PROVIDERS = ("amos", "trax", "camp", "aviatar", "airnavx")
+ACTIONS = ("replaced LRU", "reset and tested", "cleaned connector", "deferred per MEL", "adjusted rigging")
+
+
+def build_defects(provider: str, aircraft: str, ata: str, limit: int) -> List[Dict[str, Any]]:
+    rng = random.Random(zlib.crc32(f"{provider}|{aircraft}|{ata}".encode()))
+    defects = []
+    for i in range(max(0, min(limit, 500))):
+        chapter = ata or f"{rng.randint(21, 80)}"
+        defects.append({
+            "id": f"{provider.upper()}-{rng.randint(10**5, 10**6)}",
+            "aircraft": aircraft or rng.choice(["A320", "B737-800", "A330"]),
+            "tail": f"EC-{rng.choice('ABCDEFGHJKLMN')}{rng.choice('PQRSTUVWXYZ')}{rng.choice('ABCDEFGH')}",
+            "ata": chapter,
+            "fault_code": f"{chapter}{rng.randint(100, 999)}",
+            "description": f"[stub {provider}] defect {i + 1} in ATA {chapter}",
+            "corrective_action": rng.choice(ACTIONS),
+            "occurrence_date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        })
+    return sorted(defects, key=lambda d: d["occurrence_date"], reverse=True)
+
+
+def feed_event(provider: str, seq: int, initial: int) -> Dict[str, Any]:
+    """Change event ``seq`` (1-based): the defect as created or last edited by it."""
+    rng = random.Random(zlib.crc32(f"{provider}|event|{seq}".encode()))
+    defect_id = seq if seq <= initial or rng.random() < 0.7 else rng.randint(1, seq - 1)
+    base = random.Random(zlib.crc32(f"{provider}|defect|{defect_id}".encode()))
+    chapter = base.randint(21, 80)
+    return {
+        "id": f"{provider.upper()}-{defect_id}",
+        "aircraft": base.choice(["A320", "B737-800", "A330"]),
+        "tail": f"EC-{base.randint(100, 199)}",
+        "ata": f"{chapter}-{base.randint(10, 99)}",
+        "fault_code": f"{chapter}{base.randint(100, 999)}",
+        "description": f"[stub {provider}] defect {defect_id} in ATA {chapter}",
+        "corrective_action": ACTIONS[seq % len(ACTIONS)] if defect_id != seq else "open",
+        "occurrence_date": f"2024-{base.randint(1, 12):02d}-{base.randint(1, 28):02d}",
+        "updated_at": seq,
+    }
+
+
+def build_trends(provider: str, aircraft: str) -> Dict[str, Any]:
+    rng = random.Random(zlib.crc32(f"{provider}|{aircraft}|trends".encode()))
+    return {
+        "provider": provider,
+        "aircraft": aircraft or None,
+        "by_ata": [{"ata": f"{ata}", "count": rng.randint(0, 40)} for ata in (21, 24, 27, 29, 32, 34, 36, 49)],
+        "mtbur_hours": round(rng.uniform(2000, 12000), 1),
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    delay_s: float = 0.0
+    fail_rate: float = 0.0
+    throttle_rate: float = 0.0
+    feed_size: int = 1000
+    feed_growth: float = 0.0
+    started: float = 0.0
+    rng: random.Random = random.Random(0)
+    rng_lock = threading.Lock()
+    protocol_version = "HTTP/1.1"  # keep-alive, so client pooling is exercised
+
+    def log_message(self, fmt: str, *args: Any) -> None:  # keep test output quiet
+        return
+
+    def _send_json(self, status: int, payload: Any, headers: Dict[str, str] = None) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        provider, _, endpoint = url.path.strip("/").partition("/")
+        if provider not in PROVIDERS or endpoint not in ("defects", "defects/changes", "reliability/trends"):
+            self._send_json(404, {"error": f"unknown path {url.path}"})
+            return
+
+        if self.delay_s:
+            time.sleep(self.delay_s)
+        with self.rng_lock:
+            roll = self.rng.random()
+        if roll < self.fail_rate:
+            self._send_json(503, {"error": "stub: injected failure"})
+            return
+        if roll < self.fail_rate + self.throttle_rate:
+            self._send_json(429, {"error": "stub: throttled"}, {"Retry-After": "0.1"})
+            return
+
+        if endpoint == "defects/changes":
+            try:
+                after = int(query.get("cursor") or 0)
+                limit = int(query.get("limit", 500))
+            except ValueError:
+                self._send_json(400, {"error": "cursor and limit must be integers"})
+                return
+            head = self.feed_size + int(self.feed_growth * (time.monotonic() - self.started))
+            last = min(head, after + max(1, min(limit, 5000)))
+            defects = [feed_event(provider, seq, self.feed_size) for seq in range(after + 1, last + 1)]
+            self._send_json(200, {"defects": defects, "next_cursor": str(max(after, last)), "has_more": last < head})
+        elif endpoint == "defects":
+            try:
+                limit = int(query.get("limit", 50))
+            except ValueError:
+                self._send_json(400, {"error": "limit must be an integer"})
+                return
+            defects = build_defects(provider, query.get("aircraft", ""), query.get("ata", ""), limit)
+            self._send_json(200, {"defects": defects})
+        else:
+            self._send_json(200, build_trends(provider, query.get("aircraft", "")))
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 8766,
+    delay_s: float = 0.0,
+    fail_rate: float = 0.0,
+    throttle_rate: float = 0.0,
+    seed: int = 0,
+    feed_size: int = 1000,
+    feed_growth: float = 0.0,
+) -> ThreadingHTTPServer:
+    """Create (but do not start) a stub server; call ``serve_forever`` on the result."""
+    handler = type("ConfiguredStubHandler", (StubHandler,), {
+        "delay_s": delay_s,
+        "fail_rate": fail_rate,
+        "throttle_rate": throttle_rate,
+        "rng": random.Random(seed),
+        "feed_size": feed_size,
+        "feed_growth": feed_growth,
+        "started": time.monotonic(),
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--delay", type=float, default=0.0, help="Artificial provider latency in seconds")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of calls answered with 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of calls answered with 429")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--feed-size", type=int, default=1000, help="Defects in each change feed at start")
+    parser.add_argument("--feed-growth", type=float, default=0.0, help="Change events per second after start")
+    args = parser.parse_args()
+
+    server = serve(
+        args.host, args.port, args.delay, args.fail_rate, args.throttle_rate, args.seed, args.feed_size, args.feed_growth
+    )
+    print(f"[STUB] MRO providers listening on http://{args.host}:{args.port}/<{'|'.join(PROVIDERS)}>")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
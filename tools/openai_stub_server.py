@@ -0,0 +1,113 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+Lets the brain run end-to-end without network access or API spend:
+
+    python tools/openai_stub_server.py --port 8765 --delay 0.2
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub uvicorn main:app
+
+Only ``POST /v1/chat/completions`` is implemented, with and without
+``stream=true``. The answer echoes the first line of the last user message so
+callers can check which prompt was sent.
+"""
+import argparse
+import json
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict
+
+
+def build_answer(body: Dict[str, Any]) -> str:
+    messages = body.get("messages") or []
+    last_user = next((m for m in reversed(messages) if m.get("role") == "user"), {})
+    content = last_user.get("content") or ""
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    first_line = content.strip().splitlines()[0] if content.strip() else ""
+    return f"[stub] {first_line}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    delay_s: float = 0.0
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt: str, *args: Any) -> None:  # keep test output quiet
+        return
+
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, model: str, answer: str) -> None:
+        """Emit the answer word by word as chat.completion.chunk SSE events."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        words = answer.split(" ")
+        for i, word in enumerate(words):
+            delta = word if i == 0 else " " + word
+            chunk = {
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+        if self.delay_s:
+            time.sleep(self.delay_s)
+        answer = build_answer(body)
+        if body.get("stream"):
+            self._send_stream(body.get("model", "stub"), answer)
+            return
+        self._send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, delay_s: float = 0.0) -> ThreadingHTTPServer:
+    """Create (but do not start) a stub server; call ``serve_forever`` on the result."""
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"delay_s": delay_s})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0, help="Artificial model latency in seconds")
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.delay)
+    print(f"[STUB] OpenAI stand-in listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
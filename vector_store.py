@@ -0,0 +1,703 @@
+"""Vector store backends behind RAGPipeline.
+
+A backend hands out named collections (one per partition, see
+``RAG_PARTITION_MODE``). Every collection offers the same small API: upsert,
+delete, filtered top-k query, fetch by id, paged scan and count. Filters come
+in as ``{field: [allowed values]}`` (see ``rag_module.filter_values``) and
+each backend translates them to its own syntax.
+
+``VECTOR_BACKEND`` picks the implementation per deployment:
+
+- ``chroma``: persistent ChromaDB (HNSW), the default.
+- ``qdrant``: Qdrant, either a server (``QDRANT_URL``) or in-process on a
+  local directory (``QDRANT_PATH``), which needs no network.
+- ``numpy``: memory-mapped NumPy matrix with float16/int8 vectors and
+  vectorized brute-force search; no index to build, cheap RSS, and fast
+  enough for tenants with up to a few hundred thousand chunks.
+
+Distances are reported as squared L2 between unit vectors (``2 - 2*cos``),
+what Chroma's default space returns for normalized embeddings, so scores mean
+the same thing whatever the backend.
+"""
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence
+import os
+import pickle
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+import config
+
+
+Filters = Optional[Dict[str, List[str]]]
+
+
+class VectorHit(NamedTuple):
+    id: str
+    distance: float
+    document: str
+    metadata: Dict[str, Any]
+    embedding: Optional[Sequence[float]] = None
+
+
+class VectorCollection:
+    """One named set of chunks with embeddings and metadata."""
+
+    name: str
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def upsert(self, ids: List[str], embeddings: Sequence[Sequence[float]], documents: List[str],
+               metadatas: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]) -> None:
+        raise NotImplementedError
+
+    def query(self, embedding: Sequence[float], n_results: int, filters: Filters = None,
+              with_embeddings: bool = False) -> List[VectorHit]:
+        """Nearest ``n_results`` chunks passing ``filters``, closest first."""
+        raise NotImplementedError
+
+    def get(self, ids: List[str], with_embeddings: bool = False) -> List[VectorHit]:
+        """Chunks by id (missing ids are skipped); ``distance`` is 0."""
+        raise NotImplementedError
+
+    def scan(self, page_size: int = 1000) -> Iterator[List[VectorHit]]:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        """Make writes durable; a no-op for backends that persist on every call."""
+
+    def maybe_reload(self) -> bool:
+        """Pick up data written by another process; True when something was reloaded.
+
+        Remote servers (Qdrant at ``QDRANT_URL``) always read live state and report nothing; an
+        embedded Qdrant path is locked to a single process, so it never sees foreign writes.
+        """
+        return False
+
+
+class VectorBackend:
+    name: str
+
+    def open(self, name: str, create: bool = True) -> Optional[VectorCollection]:
+        """Collection ``name``; None if it does not exist and ``create`` is False."""
+        raise NotImplementedError
+
+    def list_collections(self) -> List[str]:
+        raise NotImplementedError
+
+    def drop(self, name: str) -> None:
+        raise NotImplementedError
+
+
+# -- ChromaDB -------------------------------------------------------------------
+
+
+def chroma_where(filters: Filters) -> Optional[Dict[str, Any]]:
+    conditions = [
+        {field: {"$in": allowed}} if len(allowed) > 1 else {field: {"$eq": allowed[0]}}
+        for field, allowed in (filters or {}).items()
+    ]
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+class ChromaCollection(VectorCollection):
+    def __init__(self, collection: Any, db_path: Optional[Path] = None) -> None:
+        self.name = collection.name
+        self._coll = collection
+        # A local PersistentClient commits every write to chroma.sqlite3. Queries already read
+        # that live, so its mtime only serves to tell callers their cached results went stale.
+        self._db_path = db_path
+        self._seen_mtime = self._db_mtime()
+        self._last_reload_check = 0.0
+
+    def _db_mtime(self) -> float:
+        if self._db_path is None:
+            return 0.0
+        try:
+            return self._db_path.stat().st_mtime
+        except FileNotFoundError:
+            return 0.0
+
+    def maybe_reload(self) -> bool:
+        """True when chroma.sqlite3 changed since the last check (another process ingested).
+
+        The file is shared by every collection of the client, so a write to any of them
+        reports a change on all; callers only use this to drop cached results.
+        """
+        if self._db_path is None:
+            return False
+        now = time.monotonic()
+        if now - self._last_reload_check < _RELOAD_CHECK_S:
+            return False
+        self._last_reload_check = now
+        mtime = self._db_mtime()
+        if mtime == self._seen_mtime:
+            return False
+        self._seen_mtime = mtime
+        return True
+
+    def count(self) -> int:
+        return self._coll.count()
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        self._coll.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+        self._seen_mtime = self._db_mtime()
+
+    def delete(self, ids: List[str]) -> None:
+        self._coll.delete(ids=ids)
+        self._seen_mtime = self._db_mtime()
+
+    def query(self, embedding, n_results, filters=None, with_embeddings=False) -> List[VectorHit]:
+        include = ["documents", "metadatas", "distances"] + (["embeddings"] if with_embeddings else [])
+        results = self._coll.query(
+            query_embeddings=[embedding], n_results=n_results, where=chroma_where(filters), include=include
+        )
+        if not results or not results.get("ids") or not results["ids"][0]:
+            return []
+        ids = results["ids"][0]
+        docs = results["documents"][0] if results.get("documents") else [""] * len(ids)
+        metas = results["metadatas"][0] if results.get("metadatas") else [{}] * len(ids)
+        distances = results["distances"][0] if results.get("distances") else [1.0] * len(ids)
+        vectors = results["embeddings"][0] if results.get("embeddings") is not None else [None] * len(ids)
+        return [VectorHit(*row) for row in zip(ids, distances, docs, metas, vectors)]
+
+    def _hits(self, page: Dict[str, Any], with_embeddings: bool) -> List[VectorHit]:
+        vectors = page["embeddings"] if with_embeddings else [None] * len(page["ids"])
+        return [
+            VectorHit(chunk_id, 0.0, doc, meta or {}, vector)
+            for chunk_id, doc, meta, vector in zip(page["ids"], page["documents"], page["metadatas"], vectors)
+        ]
+
+    def get(self, ids, with_embeddings=False) -> List[VectorHit]:
+        include = ["documents", "metadatas"] + (["embeddings"] if with_embeddings else [])
+        return self._hits(self._coll.get(ids=ids, include=include), with_embeddings)
+
+    def scan(self, page_size: int = 1000) -> Iterator[List[VectorHit]]:
+        offset = 0
+        while True:
+            page = self._coll.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                return
+            yield self._hits(page, False)
+            offset += len(page["ids"])
+
+
+class ChromaBackend(VectorBackend):
+    name = "chroma"
+
+    def __init__(self, path: Optional[str] = None, client: Optional[Any] = None,
+                 embedding_function: Optional[Any] = None) -> None:
+        self.path = path
+        self._client = client
+        self.embedding_function = embedding_function
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import chromadb
+                    self._client = chromadb.PersistentClient(path=str(self.path))
+        return self._client
+
+    @property
+    def _db_path(self) -> Optional[Path]:
+        """chroma.sqlite3 of a local PersistentClient; None for an injected (e.g. HTTP) client."""
+        return Path(self.path) / "chroma.sqlite3" if self.path else None
+
+    def open(self, name: str, create: bool = True) -> Optional[VectorCollection]:
+        if create:
+            return ChromaCollection(self.client.get_or_create_collection(
+                name=name,
+                metadata={"description": "Aviation documents for AeroEngineer AI Brain"},
+                embedding_function=self.embedding_function,
+            ), self._db_path)
+        try:
+            return ChromaCollection(
+                self.client.get_collection(name, embedding_function=self.embedding_function), self._db_path
+            )
+        except Exception:
+            return None
+
+    def list_collections(self) -> List[str]:
+        return [c if isinstance(c, str) else c.name for c in self.client.list_collections()]
+
+    def drop(self, name: str) -> None:
+        self.client.delete_collection(name)
+
+
+# -- Qdrant ---------------------------------------------------------------------
+
+
+class QdrantCollection(VectorCollection):
+    """Chunk ids are hashed to UUID point ids; the original id and text live in the payload."""
+
+    def __init__(self, backend: "QdrantBackend", name: str) -> None:
+        self.name = name
+        self._backend = backend
+
+    @property
+    def _client(self) -> Any:
+        return self._backend.client
+
+    @staticmethod
+    def _point_id(chunk_id: str) -> str:
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, chunk_id))
+
+    def _exists(self) -> bool:
+        return self._client.collection_exists(self.name)
+
+    def _ensure(self, dim: int) -> None:
+        if self._exists():
+            return
+        from qdrant_client import models
+        self._client.create_collection(
+            self.name, vectors_config=models.VectorParams(size=dim, distance=models.Distance.COSINE)
+        )
+        if self._backend.remote:
+            # Local mode filters by scanning; a server needs keyword indexes to filter fast.
+            for field in ("company_id", "aircraft_model", "ata_chapter"):
+                self._client.create_payload_index(self.name, field, models.PayloadSchemaType.KEYWORD)
+
+    @staticmethod
+    def _hit(point: Any, distance: float) -> VectorHit:
+        payload = dict(point.payload or {})
+        chunk_id = payload.pop("chunk_id", str(point.id))
+        document = payload.pop("document", "")
+        return VectorHit(chunk_id, distance, document, payload, point.vector)
+
+    def count(self) -> int:
+        return self._client.count(self.name, exact=True).count if self._exists() else 0
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        from qdrant_client import models
+        vectors = [[float(x) for x in v] for v in embeddings]
+        if not vectors:
+            return
+        self._ensure(len(vectors[0]))
+        self._client.upsert(self.name, points=[
+            models.PointStruct(
+                id=self._point_id(chunk_id), vector=vector, payload={**meta, "chunk_id": chunk_id, "document": doc}
+            )
+            for chunk_id, vector, doc, meta in zip(ids, vectors, documents, metadatas)
+        ])
+
+    def delete(self, ids: List[str]) -> None:
+        if not self._exists():
+            return
+        from qdrant_client import models
+        self._client.delete(self.name, points_selector=models.PointIdsList(points=[self._point_id(i) for i in ids]))
+
+    def query(self, embedding, n_results, filters=None, with_embeddings=False) -> List[VectorHit]:
+        if not self._exists():
+            return []
+        from qdrant_client import models
+        query_filter = None
+        if filters:
+            query_filter = models.Filter(must=[
+                models.FieldCondition(key=field, match=models.MatchAny(any=list(allowed)))
+                for field, allowed in filters.items()
+            ])
+        points = self._client.query_points(
+            self.name,
+            query=[float(x) for x in embedding],
+            limit=n_results,
+            query_filter=query_filter,
+            with_payload=True,
+            with_vectors=with_embeddings,
+        ).points
+        return [self._hit(p, 2.0 - 2.0 * float(p.score)) for p in points]
+
+    def get(self, ids, with_embeddings=False) -> List[VectorHit]:
+        if not self._exists():
+            return []
+        points = self._client.retrieve(
+            self.name, ids=[self._point_id(i) for i in ids], with_payload=True, with_vectors=with_embeddings
+        )
+        return [self._hit(p, 0.0) for p in points]
+
+    def scan(self, page_size: int = 1000) -> Iterator[List[VectorHit]]:
+        if not self._exists():
+            return
+        offset = None
+        while True:
+            points, offset = self._client.scroll(self.name, limit=page_size, offset=offset, with_payload=True)
+            if points:
+                yield [self._hit(p, 0.0) for p in points]
+            if offset is None:
+                return
+
+
+class QdrantBackend(VectorBackend):
+    name = "qdrant"
+
+    def __init__(self, url: Optional[str] = None, path: Optional[str] = None) -> None:
+        self.url = url
+        self.path = path
+        # With a path (or ":memory:") Qdrant runs in-process and needs no server.
+        self.remote = not path
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from qdrant_client import QdrantClient
+                    if self.path == ":memory:":
+                        self._client = QdrantClient(location=":memory:")
+                    elif self.path:
+                        os.makedirs(self.path, exist_ok=True)
+                        self._client = QdrantClient(path=self.path)
+                    else:
+                        self._client = QdrantClient(url=self.url)
+        return self._client
+
+    def open(self, name: str, create: bool = True) -> Optional[VectorCollection]:
+        # Qdrant needs the vector size to create a collection, so creation waits for the first upsert.
+        if not create and not self.client.collection_exists(name):
+            return None
+        return QdrantCollection(self, name)
+
+    def list_collections(self) -> List[str]:
+        return [c.name for c in self.client.get_collections().collections]
+
+    def drop(self, name: str) -> None:
+        self.client.delete_collection(name)
+
+
+# -- NumPy / mmap ---------------------------------------------------------------
+
+
+_FILTER_FIELDS = ("company_id", "aircraft_model", "ata_chapter")
+_NUMPY_FORMAT_VERSION = 1
+_RELOAD_CHECK_S = 5.0
+_INT8_SCALE = 127.0
+
+
+class NumpyCollection(VectorCollection):
+    """Brute-force index over a (rows x dim) matrix of unit vectors.
+
+    Vectors are stored as float16, or as int8 with one float32 scale per row.
+    Saved data is opened with ``np.load(mmap_mode="r")``, so several worker
+    processes share the pages through the OS cache instead of each holding a
+    copy. Writes go to an in-RAM copy until ``flush()``, which compacts
+    deleted rows and atomically publishes a new generation of files;
+    ``meta.pkl`` is the commit point.
+    """
+
+    def __init__(self, root: Path, name: str, dtype: str) -> None:
+        self.name = name
+        self.dir = root / name
+        self.dtype = dtype
+        self._lock = threading.RLock()
+        self._reset()
+        self.dirty = False
+        self._loaded_mtime = 0.0
+        self._last_reload_check = 0.0
+        if (self.dir / "meta.pkl").exists():
+            self._load()
+
+    def _reset(self) -> None:
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.documents: List[str] = []
+        self.metadatas: List[Optional[Dict[str, Any]]] = []
+        self.alive = np.zeros(0, dtype=bool)
+        self.vectors: Optional[np.ndarray] = None
+        self.scales: Optional[np.ndarray] = None
+        # Per filter field: value -> small int code, and one code per row.
+        self.vocab: Dict[str, Dict[str, int]] = {f: {} for f in _FILTER_FIELDS}
+        self.codes: Dict[str, np.ndarray] = {f: np.zeros(0, dtype=np.int32) for f in _FILTER_FIELDS}
+        self.generation = 0
+        self._writable = True
+
+    # -- persistence ----------------------------------------------------
+
+    def _load(self) -> None:
+        meta_path = self.dir / "meta.pkl"
+        with open(meta_path, "rb") as fh:
+            state = pickle.load(fh)
+        if state.get("version") != _NUMPY_FORMAT_VERSION:
+            print(f"[VECTOR] Ignoring index with unknown format: {self.dir}")
+            return
+        with self._lock:
+            self._reset()
+            self.dtype = state["dtype"]
+            self.generation = state["generation"]
+            self.ids = state["ids"]
+            self.rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+            self.documents = state["documents"]
+            self.metadatas = state["metadatas"]
+            self.alive = np.ones(len(self.ids), dtype=bool)
+            if self.ids:
+                self.vectors = np.load(self.dir / f"vectors-{self.generation}.npy", mmap_mode="r")
+                if self.dtype == "int8":
+                    self.scales = np.load(self.dir / f"scales-{self.generation}.npy", mmap_mode="r")
+            for field in _FILTER_FIELDS:
+                self._index_field(field, range(len(self.ids)))
+            self._writable = False
+            self.dirty = False
+            self._loaded_mtime = meta_path.stat().st_mtime
+
+    def _index_field(self, field: str, rows: Any) -> None:
+        vocab = self.vocab[field]
+        codes = self.codes[field]
+        if len(codes) < len(self.ids):
+            codes = np.concatenate([codes, np.zeros(len(self.ids) - len(codes), dtype=np.int32)])
+        for row in rows:
+            value = str((self.metadatas[row] or {}).get(field, ""))
+            codes[row] = vocab.setdefault(value, len(vocab))
+        self.codes[field] = codes
+
+    def maybe_reload(self) -> bool:
+        """Pick up data flushed by an ingestion run in another process."""
+        if self.dirty:
+            return False
+        now = time.monotonic()
+        if now - self._last_reload_check < _RELOAD_CHECK_S:
+            return False
+        self._last_reload_check = now
+        try:
+            mtime = (self.dir / "meta.pkl").stat().st_mtime
+        except FileNotFoundError:
+            return False
+        if mtime == self._loaded_mtime:
+            return False
+        try:
+            self._load()
+        except FileNotFoundError:
+            return False  # a newer generation was published mid-load; retry on the next check
+        return True
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self.dirty:
+                return
+            keep = np.flatnonzero(self.alive)
+            if len(keep) < len(self.ids):
+                self._compact(keep)
+            self.generation += 1
+            self.dir.mkdir(parents=True, exist_ok=True)
+            if self.vectors is not None and len(self.ids):
+                np.save(self.dir / f"vectors-{self.generation}.npy", self.vectors[:len(self.ids)])
+                if self.scales is not None:
+                    np.save(self.dir / f"scales-{self.generation}.npy", self.scales[:len(self.ids)])
+            tmp = self.dir / "meta.pkl.tmp"
+            with open(tmp, "wb") as fh:
+                pickle.dump({
+                    "version": _NUMPY_FORMAT_VERSION,
+                    "dtype": self.dtype,
+                    "generation": self.generation,
+                    "ids": self.ids,
+                    "documents": self.documents,
+                    "metadatas": self.metadatas,
+                }, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.dir / "meta.pkl")
+            # Readers that still map an older generation keep their open file until they reload.
+            for old in self.dir.glob("*.npy"):
+                if not old.stem.endswith(f"-{self.generation}"):
+                    old.unlink(missing_ok=True)
+            self.dirty = False
+            self._loaded_mtime = (self.dir / "meta.pkl").stat().st_mtime
+
+    def _compact(self, keep: np.ndarray) -> None:
+        self.ids = [self.ids[i] for i in keep]
+        self.rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        self.documents = [self.documents[i] for i in keep]
+        self.metadatas = [self.metadatas[i] for i in keep]
+        self.alive = np.ones(len(self.ids), dtype=bool)
+        if self.vectors is not None:
+            self.vectors = np.ascontiguousarray(self.vectors[keep])
+        if self.scales is not None:
+            self.scales = np.ascontiguousarray(self.scales[keep])
+        for field in _FILTER_FIELDS:
+            self.codes[field] = self.codes[field][keep]
+
+    # -- writes ---------------------------------------------------------
+
+    def _make_writable(self) -> None:
+        if not self._writable:
+            if self.vectors is not None:
+                self.vectors = np.array(self.vectors)
+            if self.scales is not None:
+                self.scales = np.array(self.scales)
+            self._writable = True
+
+    def _quantize(self, unit: np.ndarray) -> tuple:
+        if self.dtype == "int8":
+            scales = np.abs(unit).max(axis=1)
+            scales[scales == 0] = 1.0
+            q = np.round(unit / scales[:, None] * _INT8_SCALE).astype(np.int8)
+            return q, (scales / _INT8_SCALE).astype(np.float32)
+        return unit.astype(np.float16 if self.dtype == "float16" else np.float32), None
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        if not ids:
+            return
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        quantized, scales = self._quantize(matrix / norms)
+        with self._lock:
+            self._make_writable()
+            if self.vectors is None:
+                self.vectors = np.zeros((0, quantized.shape[1]), dtype=quantized.dtype)
+                self.scales = np.zeros(0, dtype=np.float32) if scales is not None else None
+            new_rows = []
+            targets = []
+            for i, chunk_id in enumerate(ids):
+                row = self.rows.get(chunk_id)
+                if row is None:
+                    row = len(self.ids)
+                    self.rows[chunk_id] = row
+                    self.ids.append(chunk_id)
+                    self.documents.append(documents[i])
+                    self.metadatas.append(dict(metadatas[i]))
+                    new_rows.append(i)
+                else:
+                    self.documents[row] = documents[i]
+                    self.metadatas[row] = dict(metadatas[i])
+                    self.alive[row] = True
+                targets.append(row)
+            if new_rows:
+                self.vectors = np.concatenate([self.vectors, np.zeros((len(new_rows), self.vectors.shape[1]), self.vectors.dtype)])
+                self.alive = np.concatenate([self.alive, np.ones(len(new_rows), dtype=bool)])
+                if self.scales is not None:
+                    self.scales = np.concatenate([self.scales, np.zeros(len(new_rows), dtype=np.float32)])
+            self.vectors[targets] = quantized
+            if self.scales is not None:
+                self.scales[targets] = scales
+            for field in _FILTER_FIELDS:
+                self._index_field(field, targets)
+            self.dirty = True
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            for chunk_id in ids:
+                row = self.rows.pop(chunk_id, None)
+                if row is not None:
+                    self.alive[row] = False
+                    self.metadatas[row] = None
+                    self.documents[row] = ""
+                    self.dirty = True
+
+    # -- reads ----------------------------------------------------------
+
+    def count(self) -> int:
+        self.maybe_reload()
+        return int(self.alive.sum())
+
+    def _embedding(self, row: int) -> np.ndarray:
+        vector = self.vectors[row].astype(np.float32)
+        return vector * self.scales[row] if self.scales is not None else vector
+
+    def query(self, embedding, n_results, filters=None, with_embeddings=False) -> List[VectorHit]:
+        self.maybe_reload()
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self._lock:
+            if self.vectors is None or not len(self.ids):
+                return []
+            mask = self.alive.copy()
+            for field, allowed in (filters or {}).items():
+                vocab = self.vocab.get(field, {})
+                codes = [vocab[v] for v in allowed if v in vocab]
+                mask &= np.isin(self.codes[field][:len(mask)], codes)
+            rows = np.flatnonzero(mask)
+            if not len(rows):
+                return []
+            block = self.vectors if len(rows) == len(self.ids) else self.vectors[rows]
+            sims = block.astype(np.float32) @ query
+            if self.scales is not None:
+                sims *= self.scales if len(rows) == len(self.ids) else self.scales[rows]
+            k = min(n_results, len(rows))
+            best = np.argpartition(-sims, k - 1)[:k]
+            best = best[np.argsort(-sims[best])]
+            return [
+                VectorHit(
+                    self.ids[rows[i]],
+                    float(2.0 - 2.0 * sims[i]),
+                    self.documents[rows[i]],
+                    self.metadatas[rows[i]],
+                    self._embedding(rows[i]) if with_embeddings else None,
+                )
+                for i in best
+            ]
+
+    def get(self, ids, with_embeddings=False) -> List[VectorHit]:
+        self.maybe_reload()
+        with self._lock:
+            hits = []
+            for chunk_id in ids:
+                row = self.rows.get(chunk_id)
+                if row is not None:
+                    hits.append(VectorHit(
+                        chunk_id, 0.0, self.documents[row], self.metadatas[row],
+                        self._embedding(row) if with_embeddings else None,
+                    ))
+            return hits
+
+    def scan(self, page_size: int = 1000) -> Iterator[List[VectorHit]]:
+        self.maybe_reload()
+        with self._lock:
+            rows = np.flatnonzero(self.alive)
+            pages = [
+                [VectorHit(self.ids[r], 0.0, self.documents[r], self.metadatas[r]) for r in rows[start:start + page_size]]
+                for start in range(0, len(rows), page_size)
+            ]
+        yield from pages
+
+
+class NumpyBackend(VectorBackend):
+    name = "numpy"
+
+    def __init__(self, root: str, dtype: Optional[str] = None) -> None:
+        self.root = Path(root)
+        self.dtype = (dtype or config.NUMPY_INDEX_DTYPE).lower()
+        if self.dtype not in ("float16", "int8", "float32"):
+            raise ValueError(f"Unknown NUMPY_INDEX_DTYPE: {self.dtype}")
+        self._collections: Dict[str, NumpyCollection] = {}
+        self._lock = threading.Lock()
+
+    def open(self, name: str, create: bool = True) -> Optional[VectorCollection]:
+        with self._lock:
+            coll = self._collections.get(name)
+            if coll is None:
+                if not create and not (self.root / name / "meta.pkl").exists():
+                    return None
+                coll = self._collections[name] = NumpyCollection(self.root, name, self.dtype)
+            return coll
+
+    def list_collections(self) -> List[str]:
+        on_disk = {p.parent.name for p in self.root.glob("*/meta.pkl")} if self.root.exists() else set()
+        return sorted(on_disk | set(self._collections))
+
+    def drop(self, name: str) -> None:
+        with self._lock:
+            self._collections.pop(name, None)
+        shutil.rmtree(self.root / name, ignore_errors=True)
+
+
+def get_vector_backend(data_dir: Path, embedding_function: Optional[Any] = None) -> VectorBackend:
+    """Build the backend selected by ``config.VECTOR_BACKEND``; ``data_dir`` holds local data."""
+    backend = config.VECTOR_BACKEND.lower()
+    if backend == "chroma":
+        return ChromaBackend(path=str(Path(data_dir) / "chromadb"), embedding_function=embedding_function)
+    if backend == "qdrant":
+        return QdrantBackend(url=config.QDRANT_URL, path=config.QDRANT_PATH or None)
+    if backend == "numpy":
+        return NumpyBackend(str(Path(data_dir) / "vectors"))
+    raise ValueError(f"Unknown VECTOR_BACKEND: {config.VECTOR_BACKEND}")